@@ -0,0 +1,217 @@
+# Hosting many generated Dash apps at once, each on its own port from a pool
+#
+#     registry = AppRegistry(ports=range(8000, 8050), max_apps=8, idle_seconds=1800)
+#     process = registry.deploy(code)                 # new app, http://localhost:8000
+#     registry.deploy(edited_code, app_id="3f2a9c")   # replaces that app, same port
+#     registry.stop("3f2a9c")
+#
+# Each app is served by app_server.deploy_app from its own script in ./scripts/apps. Apps
+# that have not answered a request for idle_seconds are stopped, and so is the least
+# recently used one when max_apps are running and another one is deployed.
+
+import os
+import re
+import time
+import uuid
+import socket
+import atexit
+import threading
+from app_server import deploy_app
+
+APPS_DIR = "./scripts/apps"
+DEFAULT_PORTS = range(8000, 8050)
+MAX_APPS = 8
+IDLE_SECONDS = 1800
+CHECK_INTERVAL = 60
+
+
+def port_free(port, host="127.0.0.1"):
+    """Whether a server can listen on port, i.e. nothing else (e.g. an app of an earlier session) does"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        # Like the servers do, so ports of stopped apps in TIME_WAIT count as free
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+class _Starting:
+    """Holds the id and port of an app in the registry while deploy starts it"""
+    failed = False
+    url = None
+
+    def __init__(self, port):
+        self.port = port
+        self.started = time.time()
+
+    def last_active(self):
+        return self.started
+
+    def stop(self):
+        pass
+
+
+class AppRegistry:
+    def __init__(self, ports=DEFAULT_PORTS, max_apps=MAX_APPS, idle_seconds=IDLE_SECONDS,
+                 check_interval=CHECK_INTERVAL, apps_dir=APPS_DIR, stop_on_exit=True, **deploy_options):
+        """
+        The running apps by id. deploy_options (backend, workers, threads, host, ...) are
+        passed to app_server.deploy_app. idle_seconds=None keeps idle apps running, the
+        max_apps limit still applies. With stop_on_exit the apps are stopped when this
+        process exits.
+        """
+        self.ports = list(ports)
+        self.max_apps = max_apps
+        self.idle_seconds = idle_seconds
+        self.check_interval = check_interval
+        self.apps_dir = apps_dir
+        self.deploy_options = deploy_options
+        self.apps = {}
+        self._lock = threading.RLock()
+        self._reaper = None
+        if stop_on_exit:
+            atexit.register(self.stop_all)
+
+    @staticmethod
+    def new_app_id():
+        return uuid.uuid4().hex[:12]
+
+    def script_path(self, app_id):
+        return os.path.join(self.apps_dir, f"{app_id}.py")
+
+    def url(self, app_id):
+        with self._lock:
+            return self.apps[app_id].url if app_id in self.apps else None
+
+    def _last_active(self, app_id):
+        return self.apps[app_id].last_active() or 0.0
+
+    def _pop_coldest(self, reason):
+        """Unregister the least recently used running app, returns it for _stop. Caller holds _lock"""
+        running = [app_id for app_id, process in self.apps.items() if not isinstance(process, _Starting)]
+        if not running:
+            raise RuntimeError("No app can be stopped to make room, all of them are starting")
+        app_id = min(running, key=self._last_active)
+        return app_id, self.apps.pop(app_id), reason
+
+    def _pop_idle(self, now):
+        """Unregister the idle and crashed apps, returns them for _stop. Caller holds _lock"""
+        popped = []
+        for app_id, process in list(self.apps.items()):
+            if isinstance(process, _Starting):
+                continue
+            if process.failed:
+                popped.append((app_id, self.apps.pop(app_id), "exited"))
+            elif self.idle_seconds is not None and now - self._last_active(app_id) > self.idle_seconds:
+                popped.append((app_id, self.apps.pop(app_id), f"idle for {self.idle_seconds}s"))
+        return popped
+
+    @staticmethod
+    def _stop(popped):
+        """Stop apps unregistered by _pop_coldest/_pop_idle, without holding _lock"""
+        for app_id, process, reason in popped:
+            if reason:
+                print(f"Stopping app {app_id} on port {process.port} ({reason})")
+            process.stop()
+
+    def _allocate_port(self, host):
+        used = {process.port for process in self.apps.values()}
+        for port in self.ports:
+            if port not in used and port_free(port, host):
+                return port
+        return None
+
+    def deploy(self, code, app_id=None, **deploy_options):
+        """
+        Write code to the script of app_id and serve it, replacing the app of that id
+        (on the same port) or starting a new one on a free port of the pool. Returns the
+        AppProcess once the app answers, its name is the app id (a new one when none is given).
+        The id and port are reserved under the lock, the app is started outside of it, so
+        a slow start does not hold up other deployments, stops or the idle check.
+        """
+        app_id = app_id or self.new_app_id()
+        if not re.fullmatch(r"[\w-]+", app_id):
+            raise ValueError(f"Invalid app id: {app_id!r}")
+        options = {**self.deploy_options, **deploy_options}
+        host = options.get("host", "127.0.0.1")
+        with self._lock:
+            previous = self.apps.get(app_id)
+            if isinstance(previous, _Starting):
+                raise RuntimeError(f"App {app_id} is being deployed already")
+            popped = [(app_id, self.apps.pop(app_id), None)] if previous is not None else []
+            popped += self._pop_idle(time.time())
+            while len(self.apps) >= self.max_apps:
+                popped.append(self._pop_coldest("least recently used"))
+            port = previous.port if previous is not None else self._allocate_port(host)
+            while port is None and self.apps:
+                popped.append(self._pop_coldest("no free port"))
+                port = self._allocate_port(host)
+            if port is None:
+                raise RuntimeError(f"No free port for {app_id} in {self.ports[0]}-{self.ports[-1]}")
+            starting = _Starting(port)
+            self.apps[app_id] = starting
+
+        try:
+            self._stop(popped)
+            if not port_free(port, host):
+                # Something else took the port of the replaced app
+                with self._lock:
+                    port = starting.port = self._allocate_port(host)
+                if port is None:
+                    raise RuntimeError(f"No free port for {app_id} in {self.ports[0]}-{self.ports[-1]}")
+            script_path = self.script_path(app_id)
+            os.makedirs(os.path.dirname(script_path) or ".", exist_ok=True)
+            with open(script_path, "w", encoding="utf-8") as f:
+                f.write(code)
+            process = deploy_app(script_path, port=port, name=app_id, **options)
+        except BaseException:
+            with self._lock:
+                if self.apps.get(app_id) is starting:
+                    del self.apps[app_id]
+            raise
+
+        with self._lock:
+            registered = self.apps.get(app_id) is starting
+            if registered:
+                self.apps[app_id] = process
+        if not registered:
+            process.stop()
+            raise RuntimeError(f"App {app_id} was stopped while it was starting")
+        self._start_reaper()
+        return process
+
+    def stop(self, app_id, reason=None):
+        with self._lock:
+            process = self.apps.pop(app_id, None)
+        if process is None:
+            return False
+        if reason:
+            print(f"Stopping app {app_id} on port {process.port} ({reason})")
+        process.stop()
+        return True
+
+    def stop_all(self):
+        with self._lock:
+            app_ids = list(self.apps)
+        for app_id in app_ids:
+            self.stop(app_id)
+
+    def evict_idle(self, now=None):
+        """Stop the apps without requests for idle_seconds and those that keep crashing, returns their ids"""
+        with self._lock:
+            popped = self._pop_idle(time.time() if now is None else now)
+        self._stop(popped)
+        return [app_id for app_id, _, _ in popped]
+
+    def _start_reaper(self):
+        if self.idle_seconds is None or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        self._reaper = threading.Thread(target=self._reap, name="app-registry-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(self.check_interval)
+            self.evict_idle()
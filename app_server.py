@@ -0,0 +1,302 @@
+# Headless deployment of generated Dash apps: a multi-worker gunicorn server (or the Dash dev
+# server), a health check before the URL is handed out and restarts when the server dies
+#
+#     process = deploy_app("./scripts/generated_dash_app.py", port=8000, workers=4, threads=2)
+#     process.url      # http://localhost:8000, answering once deploy_app returns
+#     process.stop()
+#
+# gunicorn runs wsgi_app(script) in each worker, which imports the generated script without
+# running its __main__ block and serves the Flask server of its Dash app. The dev server is
+# run the same way with `python -m app_server script --port 8000`.
+
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+import importlib.util
+
+# Generated apps import the runtime helpers of this directory (data_cube.py, callback_cache.py, data_snapshot.py)
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = "./app_logs"
+# Answered by every Dash app once its layout is built
+HEALTH_PATH = "/_dash-layout"
+# Sent with the health checks, which do not count as use of the app
+HEALTH_HEADER = "X-App-Server-Health"
+# File whose mtime the app sets on requests, at most every ACTIVITY_INTERVAL seconds
+ACTIVITY_ENV = "APP_ACTIVITY_PATH"
+ACTIVITY_INTERVAL = 5
+BACKENDS = ["gunicorn", "dev"]
+
+
+def app_environment():
+    """Environment for running generated apps, with REPO_DIR on PYTHONPATH"""
+    from data_snapshot import snapshot_root, SNAPSHOT_DIR_ENV
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(path for path in (REPO_DIR, env.get("PYTHONPATH")) if path)
+    # The snapshots written while exploring the data, wherever the app is started from
+    env[SNAPSHOT_DIR_ENV] = os.path.abspath(snapshot_root())
+    return env
+
+
+def load_app(script_path):
+    """The Dash app of a generated script, imported as a module so app.run_server is not called"""
+    name = "dash_app_" + os.path.splitext(os.path.basename(script_path))[0]
+    spec = importlib.util.spec_from_file_location(name, os.path.abspath(script_path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    app = getattr(module, "app", None)
+    if app is None or not hasattr(app, "server"):
+        import dash
+        app = next((value for value in vars(module).values() if isinstance(value, dash.Dash)), None)
+    if app is None:
+        raise RuntimeError(f"No Dash app found in {script_path}")
+    if os.getenv(ACTIVITY_ENV):
+        track_activity(app.server, os.environ[ACTIVITY_ENV])
+    return app
+
+
+def track_activity(server, path):
+    """Touch path on the requests of the Flask server, so its mtime is the last use of the app in any worker"""
+    from flask import request
+    touched = [0.0]
+
+    @server.before_request
+    def touch_activity():
+        now = time.time()
+        if now - touched[0] < ACTIVITY_INTERVAL or request.headers.get(HEALTH_HEADER):
+            return
+        touched[0] = now
+        try:
+            os.utime(path)
+        except OSError:
+            open(path, "a").close()
+
+
+def wsgi_app(script_path):
+    """gunicorn app factory: the Flask server of the generated script's Dash app"""
+    return load_app(script_path).server
+
+
+def gunicorn_available():
+    return sys.platform != "win32" and importlib.util.find_spec("gunicorn") is not None
+
+
+def default_workers():
+    # gunicorn's rule of thumb, capped since every worker holds a copy of the app's data
+    return min(2 * (os.cpu_count() or 1) + 1, 8)
+
+
+def gunicorn_command(script_path, port, host="127.0.0.1", workers=None, threads=2, timeout=120, preload=True):
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "--bind", f"{host}:{port}",
+        "--workers", str(workers or default_workers()),
+        "--threads", str(threads),
+        "--timeout", str(timeout),
+        "--chdir", os.getcwd(),
+    ]
+    if preload:
+        # The app (and its data) is loaded once in the master and shared with the forked workers
+        command.append("--preload")
+    return command + [f"app_server:wsgi_app({os.path.abspath(script_path)!r})"]
+
+
+def dev_command(script_path, port, host="127.0.0.1", debug=False):
+    command = [sys.executable, "-m", "app_server", os.path.abspath(script_path), "--port", str(port), "--host", host]
+    return command + (["--debug"] if debug else [])
+
+
+class AppProcess:
+    def __init__(self, name, command, port, env=None, host="127.0.0.1", log_path=None,
+                 health_timeout=120, max_restarts=3, restart_window=300):
+        """
+        A server process started headless in its own process group, its output going to
+        log_path. start() returns once HEALTH_PATH answers; if the server exits on its
+        own later it is started again, at most max_restarts times per restart_window
+        seconds.
+        """
+        self.name = name
+        self.command = command
+        self.port = port
+        self.host = host
+        self.env = env
+        self.log_path = log_path or os.path.join(LOG_DIR, f"{name}.log")
+        self.activity_path = (env or {}).get(ACTIVITY_ENV)
+        self.health_timeout = health_timeout
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.process = None
+        self.restarts = []
+        # Set when the server exited once more after max_restarts restarts
+        self.failed = False
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._monitor = None
+
+    @property
+    def url(self):
+        return f"http://{'localhost' if self.host in ('127.0.0.1', '0.0.0.0') else self.host}:{self.port}"
+
+    def _spawn(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        log = open(self.log_path, "ab")
+        options = {"start_new_session": True} if sys.platform != "win32" else \
+            {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        self.process = subprocess.Popen(self.command, stdout=log, stderr=subprocess.STDOUT,
+                                        stdin=subprocess.DEVNULL, env=self.env, **options)
+        log.close()
+
+    def healthy(self, timeout=2):
+        health_check = urllib.request.Request(f"http://127.0.0.1:{self.port}{HEALTH_PATH}", headers={HEALTH_HEADER: "1"})
+        try:
+            with urllib.request.urlopen(health_check, timeout=timeout) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+    def wait_healthy(self):
+        deadline = time.monotonic() + self.health_timeout
+        delay = 0.1
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.name} exited with code {self.process.returncode} before answering, "
+                                   f"last output:\n{self.log_tail()}")
+            if self.healthy():
+                return
+            time.sleep(delay)
+            delay = min(delay * 1.5, 1.0)
+        self.stop()
+        raise TimeoutError(f"{self.name} did not answer {HEALTH_PATH} within {self.health_timeout}s, "
+                           f"last output:\n{self.log_tail()}")
+
+    def log_tail(self, lines=20):
+        try:
+            with open(self.log_path, "r", encoding="utf-8", errors="replace") as f:
+                return "".join(f.readlines()[-lines:])
+        except OSError:
+            return ""
+
+    def start(self):
+        with self._lock:
+            self._stopping.clear()
+            self._spawn()
+        self.wait_healthy()
+        if self._monitor is None or not self._monitor.is_alive():
+            self._monitor = threading.Thread(target=self._watch, name=f"supervise-{self.name}", daemon=True)
+            self._monitor.start()
+        return self
+
+    def _watch(self):
+        while not self._stopping.wait(1.0):
+            with self._lock:
+                if self._stopping.is_set() or self.process.poll() is None:
+                    continue
+                now = time.monotonic()
+                self.restarts = [t for t in self.restarts if now - t < self.restart_window]
+                if len(self.restarts) >= self.max_restarts:
+                    print(f"{self.name} exited with code {self.process.returncode}, "
+                          f"not restarting after {self.max_restarts} restarts")
+                    self.failed = True
+                    return
+                print(f"{self.name} exited with code {self.process.returncode}, restarting")
+                self.restarts.append(now)
+                self._spawn()
+            try:
+                self.wait_healthy()
+            except (RuntimeError, TimeoutError) as e:
+                if not self._stopping.is_set():
+                    print(e)
+
+    def last_active(self):
+        """Time of the last request to the app, its start before the first one, None when it is not tracked"""
+        if self.activity_path is None:
+            return None
+        try:
+            return os.path.getmtime(self.activity_path)
+        except OSError:
+            return None
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self, timeout=10):
+        """Stop the server and its workers (the whole process group)"""
+        self._stopping.set()
+        with self._lock:
+            process = self.process
+            if process is None or process.poll() is not None:
+                return
+            if sys.platform == "win32":
+                process.terminate()
+            else:
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    return
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                if sys.platform == "win32":
+                    process.kill()
+                else:
+                    os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+
+
+def deploy_app(script_path, port=8000, backend="gunicorn", workers=None, threads=2, host="127.0.0.1",
+               name=None, debug=False, **options):
+    """
+    Start the generated app at script_path on port and return its AppProcess once it
+    answers. backend "gunicorn" runs workers processes of threads threads each and
+    falls back to the dev server where gunicorn is not installed (or on Windows).
+    With more than one worker, apps that memoize callbacks (callback_cache.py) share
+    one cache file unless the environment chooses otherwise, started empty by every
+    deployment.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown deployment backend: {backend}. Choose from {BACKENDS}")
+    if backend == "gunicorn" and not gunicorn_available():
+        print("gunicorn is not available, falling back to the Dash dev server")
+        backend = "dev"
+    name = name or f"{os.path.splitext(os.path.basename(script_path))[0]}-{port}"
+    env = app_environment()
+    env[ACTIVITY_ENV] = os.path.abspath(os.path.join(LOG_DIR, f"{name}.activity"))
+    os.makedirs(os.path.dirname(env[ACTIVITY_ENV]), exist_ok=True)
+    # Until the first request, the app counts as used when it was started
+    open(env[ACTIVITY_ENV], "a").close()
+    os.utime(env[ACTIVITY_ENV])
+    if backend == "gunicorn":
+        workers = workers or default_workers()
+        if workers > 1:
+            from callback_cache import BACKEND_ENV, PATH_ENV
+            env.setdefault(BACKEND_ENV, "disk")
+            if PATH_ENV not in env:
+                env[PATH_ENV] = os.path.abspath(os.path.join(LOG_DIR, f"{name}.callback_cache.sqlite"))
+                # Left by the previous deployment under this name, which ran other code or data
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(env[PATH_ENV] + suffix):
+                        os.remove(env[PATH_ENV] + suffix)
+        command = gunicorn_command(script_path, port, host, workers, threads)
+    else:
+        command = dev_command(script_path, port, host, debug)
+    return AppProcess(name, command, port, env=env, host=host, **options).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a generated Dash app on the Dash dev server")
+    parser.add_argument("script")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+    load_app(args.script).run(host=args.host, port=args.port, debug=args.debug)
+
+
+if __name__ == "__main__":
+    main()
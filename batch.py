@@ -0,0 +1,128 @@
+# Generate many dashboards from a JSONL manifest of {"query", "file", "mode"} jobs
+# Usage: poetry run python batch.py manifest.jsonl --output-dir ./batch_output --concurrency 4
+
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+from langchain_openai import ChatOpenAI
+from data_agent import DataAnalyser
+from dash_agent import DashCoder
+from user_input import UserInput
+from llm_cache import LLMCache
+from profile_cache import ProfileCache
+from dash_workflow import DashWorkflow
+from load_dotenv import load_dotenv
+load_dotenv()
+
+
+def load_manifest(manifest_path):
+    jobs = []
+    seen = {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            job["id"] = str(job.get("id", f"job_{line_no}"))
+            # The id names the job's output file
+            if not re.fullmatch(r"[\w-]+", job["id"]):
+                raise ValueError(f"Invalid job id on line {line_no}: {job['id']!r}")
+            if job["id"] in seen:
+                raise ValueError(f"Duplicate job id on line {line_no}: {job['id']!r} (first on line {seen[job['id']]})")
+            seen[job["id"]] = line_no
+            job.setdefault("query", "Generate a financial dashboard")
+            job.setdefault("mode", "adhoc-gen")
+            jobs.append(job)
+    return jobs
+
+
+class BatchRunner:
+    def __init__(self, output_dir="./batch_output", concurrency=4):
+        """
+        Every job gets its own DataAnalyser/DashCoder, so the analyses kept for edits
+        do not pile up in one analyser, but all of them share one UserInput (and its
+        embedding models), the LLM clients with their connection pools, and the LLM
+        and profile caches.
+        """
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.user_input = UserInput()
+        self.llm_cache = LLMCache()
+        self.profile_cache = ProfileCache()
+        self.analysis_llm = ChatOpenAI(model="gpt-4o", api_key=os.getenv("OPENAI_API_KEY"), temperature=0.2)
+        self.coder_llm = ChatOpenAI(model="gpt-4o", api_key=os.getenv("OPENAI_API_KEY"), temperature=0.3)
+
+    def create_workflow(self):
+        return DashWorkflow(
+            stream_generation=False,
+            deploy=False,
+            user_input=self.user_input,
+            llm_cache=self.llm_cache,
+            data_analyser=DataAnalyser(llm=self.analysis_llm, llm_cache=self.llm_cache, profile_cache=self.profile_cache),
+            dash_maker=DashCoder(llm=self.coder_llm, llm_cache=self.llm_cache),
+        )
+
+    async def run_job(self, job, semaphore):
+        output_path = os.path.join(self.output_dir, f"{job['id']}.py")
+        report = {"id": job["id"], "file": job.get("file"), "mode": job["mode"], "output_path": output_path}
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if job["mode"] != "adhoc-gen":
+                    # Edits need the visualizations of an earlier interactive session
+                    raise ValueError(f"Unsupported batch mode: {job['mode']}")
+                if not job.get("file"):
+                    raise ValueError("Job has no file")
+                workflow = self.create_workflow()
+                result = await workflow.arun(job["query"], job["file"], job["mode"], output_path=output_path)
+                if result["syntax_error"]:
+                    raise SyntaxError(f"Generated code does not compile ({result['syntax_error']})")
+                report.update(status="ok", timings=workflow.last_timings)
+            except Exception as e:
+                report.update(status="error", error=f"{type(e).__name__}: {e}")
+            report["seconds"] = time.perf_counter() - start
+        print(f"[{report['status']}] {job['id']} in {report['seconds']:.1f}s")
+        return report
+
+    async def arun(self, jobs):
+        os.makedirs(self.output_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+        reports = await asyncio.gather(*(self.run_job(job, semaphore) for job in jobs))
+        elapsed = time.perf_counter() - start
+
+        summary = {
+            "jobs": len(reports),
+            "succeeded": sum(r["status"] == "ok" for r in reports),
+            "failed": sum(r["status"] != "ok" for r in reports),
+            "concurrency": self.concurrency,
+            "seconds": elapsed,
+            "jobs_per_minute": len(reports) / elapsed * 60 if elapsed > 0 else 0.0,
+            "llm_cache": self.llm_cache.stats(),
+        }
+        with open(os.path.join(self.output_dir, "report.json"), "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "jobs": reports}, f, indent=2)
+        return summary, reports
+
+    def run(self, manifest_path):
+        return asyncio.run(self.arun(load_manifest(manifest_path)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate dashboards for every job in a JSONL manifest")
+    parser.add_argument("manifest")
+    parser.add_argument("--output-dir", default="./batch_output")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    summary, _ = BatchRunner(args.output_dir, args.concurrency).run(args.manifest)
+    print(f"{summary['succeeded']}/{summary['jobs']} jobs succeeded in {summary['seconds']:.1f}s "
+          f"({summary['jobs_per_minute']:.1f} jobs/min)")
+
+
+if __name__ == "__main__":
+    main()
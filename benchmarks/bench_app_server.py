@@ -0,0 +1,145 @@
+# Throughput of a generated app under concurrent callback requests, served the way execute_code
+# used to run it (the Dash dev server in debug mode), by the dev server without debug and by
+# gunicorn (app_server.py)
+# Usage: poetry run python benchmarks/bench_app_server.py [clients] [seconds] [workers] [rows]
+# Each client posts /_dash-update-component requests for random date ranges in a loop; the
+# callback is not memoized, so every request computes its figure.
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import http.client
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from app_server import deploy_app, gunicorn_available
+
+APP = """
+import dash
+from dash import dcc, html
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from data_cube import DataCube
+
+rng = np.random.default_rng(0)
+n = {rows}
+df = pd.DataFrame({{
+    "Date": rng.choice(pd.date_range("2020-01-01", periods=1000, freq="D"), n),
+    "Company": rng.choice(["AAPL", "MSFT", "GOOG", "AMZN", "META"], n),
+    "Volume": rng.integers(1_000, 1_000_000, n),
+}})
+cube = DataCube(df, date="Date", categories=["Company"])
+
+app = dash.Dash(__name__)
+app.layout = html.Div([dcc.DatePickerRange(id="date-picker"), dcc.Graph(id="volume-trend")])
+
+@app.callback(dash.Output("volume-trend", "figure"),
+              [dash.Input("date-picker", "start_date"), dash.Input("date-picker", "end_date")])
+def update_chart(start_date, end_date):
+    monthly = cube.over_time("Volume", start_date, end_date, by="Company")
+    return px.line(monthly, x="period", y="Volume", color="Company")
+
+if __name__ == "__main__":
+    app.run_server(debug=True, port=8000)
+"""
+
+
+def request_body(start_date, end_date):
+    return json.dumps({
+        "output": "volume-trend.figure",
+        "outputs": {"id": "volume-trend", "property": "figure"},
+        "inputs": [{"id": "date-picker", "property": "start_date", "value": start_date},
+                   {"id": "date-picker", "property": "end_date", "value": end_date}],
+        "changedPropIds": ["date-picker.start_date"],
+        "state": [],
+    })
+
+
+def client(port, bodies, deadline, times, errors):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            connection.request("POST", "/_dash-update-component", bodies[i % len(bodies)],
+                               {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(repr(e))
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            continue
+        finally:
+            i += 1
+        times.append(time.perf_counter() - start)
+    connection.close()
+
+
+def load_test(port, bodies, n_clients, seconds):
+    times, errors = [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client, args=(port, bodies[i::n_clients], deadline, times, errors))
+               for i in range(n_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(times) * 1000, errors
+
+
+def main():
+    n_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 15
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    n_rows = int(sys.argv[4]) if len(sys.argv) > 4 else 200_000
+    rng = np.random.default_rng(1)
+    days = np.datetime64("2020-01-01") + np.arange(1000)
+    bodies = []
+    for _ in range(400):
+        first, last = sorted(rng.choice(len(days), 2, replace=False))
+        bodies.append(request_body(str(days[first]), str(days[last])))
+
+    directory = tempfile.mkdtemp()
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        script = os.path.join(directory, "generated_dash_app.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(APP.format(rows=n_rows))
+        setups = [("dev, debug", "dev", {"debug": True}), ("dev", "dev", {})]
+        if gunicorn_available():
+            setups.append(("gunicorn", "gunicorn", {"workers": workers}))
+        else:
+            print("gunicorn is not installed, skipping it")
+
+        print(f"{n_clients} clients for {seconds:.0f}s, {n_rows} rows, {os.cpu_count()} CPUs")
+        print(f"{'server':<22} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'errors':>7}")
+        for label, backend, options in setups:
+            process = deploy_app(script, port=8765, backend=backend, **options)
+            try:
+                load_test(8765, bodies, n_clients, 2)  # warm up every worker
+                times, errors = load_test(8765, bodies, n_clients, seconds)
+            finally:
+                process.stop()
+            if backend == "gunicorn":
+                label = f"gunicorn {process.command[process.command.index('--workers') + 1]}w x " \
+                        f"{process.command[process.command.index('--threads') + 1]}t"
+            print(f"{label:<22} {len(times) / seconds:7.1f} {np.median(times):7.1f} "
+                  f"{np.percentile(times, 95):7.1f} {len(errors):7d}")
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Latency of a generated app's callback requests with and without CallbackCache (callback_cache.py)
+# Usage: poetry run python benchmarks/bench_callback_cache.py [rows] [requests] [distinct_ranges]
+# Requests go through Dash's /_dash-update-component endpoint with Flask's test client, so the
+# times include computing the figures and Dash serializing them. The date ranges users pick
+# follow a Zipf distribution, a few popular ranges and a long tail.
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dash
+from dash import dcc, html
+import plotly.express as px
+from data_cube import DataCube
+from callback_cache import CallbackCache
+
+
+def make_app(df, cache):
+    cube = DataCube(df, date="Date", categories=["Company"])
+    app = dash.Dash(__name__)
+    app.layout = html.Div([
+        dcc.DatePickerRange(id="date-picker"),
+        dcc.Dropdown(id="company-dropdown", multi=True),
+        dcc.Graph(id="stock-trend"),
+        dcc.Graph(id="volume-comparison"),
+    ])
+
+    def update_charts(start_date, end_date, selected_companies):
+        filters = {"Company": selected_companies}
+        fig1 = px.line(cube.frame(start_date, end_date, filters), x="Date", y="Stock Price", color="Company")
+        fig2 = px.bar(cube.totals("Company", "Volume", start_date, end_date, filters), x="Company", y="Volume")
+        return fig1, fig2
+
+    if cache is not None:
+        cache.init_app(app)
+        update_charts = cache.memoize()(update_charts)
+    app.callback(
+        [dash.Output("stock-trend", "figure"), dash.Output("volume-comparison", "figure")],
+        [dash.Input("date-picker", "start_date"), dash.Input("date-picker", "end_date"),
+         dash.Input("company-dropdown", "value")]
+    )(update_charts)
+    return app
+
+
+def request_body(start_date, end_date, companies):
+    return {
+        "output": "..stock-trend.figure...volume-comparison.figure..",
+        "outputs": [{"id": "stock-trend", "property": "figure"}, {"id": "volume-comparison", "property": "figure"}],
+        "inputs": [{"id": "date-picker", "property": "start_date", "value": start_date},
+                   {"id": "date-picker", "property": "end_date", "value": end_date},
+                   {"id": "company-dropdown", "property": "value", "value": companies}],
+        "changedPropIds": ["date-picker.start_date"],
+        "state": [],
+    }
+
+
+def run(app, bodies):
+    client = app.server.test_client()
+    times = []
+    for body in bodies:
+        start = time.perf_counter()
+        response = client.post("/_dash-update-component", json=body)
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.data[:200]
+    return np.array(times) * 1000
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    n_ranges = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2020-01-01", periods=1000, freq="D")
+    df = pd.DataFrame({
+        "Date": rng.choice(dates, n_rows),
+        "Company": rng.choice(["AAPL", "MSFT", "GOOG", "AMZN", "META"], n_rows),
+        "Stock Price": rng.gamma(5.0, 30.0, n_rows).round(2),
+        "Volume": rng.integers(1_000, 1_000_000, n_rows),
+    })
+    ranges = []
+    for _ in range(n_ranges):
+        first, last = sorted(rng.choice(len(dates), 2, replace=False))
+        ranges.append((str(dates[first].date()), str(dates[last].date()), []))
+    # Request i picks the range of rank k with probability ~ 1 / k
+    weights = 1 / np.arange(1, n_ranges + 1)
+    bodies = [request_body(*ranges[k]) for k in rng.choice(n_ranges, n_requests, p=weights / weights.sum())]
+
+    directory = tempfile.mkdtemp()
+    results = {"no cache": (run(make_app(df, None), bodies), None)}
+    for backend in ["memory", "disk"]:
+        cache = CallbackCache(backend=backend, path=os.path.join(directory, "callback_cache.sqlite"))
+        app = make_app(df, cache)
+        results[backend] = (run(app, bodies), app.server.test_client().get("/_callback_cache").get_json())
+
+    print(f"{n_requests} requests over {n_ranges} date ranges, {n_rows} rows")
+    print(f"{'cache':<10} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'hit rate':>9}")
+    for name, (times, stats) in results.items():
+        hit_rate = f"{stats['hit_rate']:9.2f}" if stats else f"{'-':>9}"
+        print(f"{name:<10} {times.mean():8.1f} {np.median(times):7.1f} {np.percentile(times, 95):7.1f} {hit_rate}")
+
+
+if __name__ == "__main__":
+    main()
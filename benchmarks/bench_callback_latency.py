@@ -0,0 +1,89 @@
+# Latency of a typical generated update_charts callback: filtering and grouping the DataFrame
+# on every call versus answering from a DataCube (data_cube.py)
+# Usage: poetry run python benchmarks/bench_callback_latency.py [rows ...]
+# Times the data preparation only, building the figures costs the same either way
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_cube import DataCube
+
+CALLS = 50
+
+
+def make_data(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Date": (pd.Timestamp("2018-01-01") + pd.to_timedelta(rng.integers(0, 6 * 365, n), unit="D")).strftime("%Y-%m-%d"),
+        "Business Unit": rng.choice(["Tankers", "Bulk", "Containers", "Gas", "Offshore", "Ferries"], n),
+        "Ship Type": rng.choice([f"Type {i}" for i in range(20)], n),
+        "Revenue": rng.gamma(2.0, 5000.0, n).round(2),
+        "Cost": rng.gamma(2.0, 3500.0, n).round(2),
+    })
+
+
+def naive_callback(df, start_date, end_date, selected_units):
+    filtered = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)]
+    if selected_units:
+        filtered = filtered[filtered["Business Unit"].isin(selected_units)]
+    by_unit = filtered.groupby("Business Unit")[["Revenue", "Cost"]].sum().reset_index()
+    ship_types = filtered["Ship Type"].value_counts()
+    monthly = filtered.groupby(filtered["Date"].dt.to_period("M"))["Revenue"].sum().reset_index()
+    return by_unit, ship_types, monthly
+
+
+def cube_callback(cube, start_date, end_date, selected_units):
+    filters = {"Business Unit": selected_units}
+    by_unit = cube.totals("Business Unit", ["Revenue", "Cost"], start_date, end_date, filters)
+    ship_types = cube.counts("Ship Type", start_date, end_date, filters)
+    monthly = cube.over_time("Revenue", start_date, end_date, freq="MS", filters=filters)
+    return by_unit, ship_types, monthly
+
+
+def time_calls(callback, data, queries):
+    times = []
+    for start_date, end_date, units in queries:
+        start = time.perf_counter()
+        callback(data, start_date, end_date, units)
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000, np.percentile(times, 95) * 1000
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    rng = np.random.default_rng(1)
+    print(f"{'rows':>9} {'cube build s':>12} {'naive ms p50/p95':>18} {'cube ms p50/p95':>17} {'speedup':>8}")
+    for n in sizes:
+        df = make_data(n)
+        # Generated apps parse the dates once at startup
+        df["Date"] = pd.to_datetime(df["Date"])
+        start = time.perf_counter()
+        cube = DataCube(df, date="Date", categories=["Business Unit", "Ship Type"], measures=["Revenue", "Cost"])
+        build_time = time.perf_counter() - start
+
+        queries = []
+        for _ in range(CALLS):
+            first, last = sorted(rng.integers(0, 6 * 365, 2))
+            units = list(rng.choice(["Tankers", "Bulk", "Containers", "Gas"], rng.integers(0, 3), replace=False))
+            queries.append((str(pd.Timestamp("2018-01-01") + pd.Timedelta(days=int(first)))[:10],
+                            str(pd.Timestamp("2018-01-01") + pd.Timedelta(days=int(last)))[:10], units))
+
+        # Same answers both ways
+        by_unit, ship_types, monthly = naive_callback(df, *queries[0])
+        cube_by_unit, cube_ship_types, cube_monthly = cube_callback(cube, *queries[0])
+        assert np.allclose(by_unit["Revenue"], cube_by_unit["Revenue"])
+        assert ship_types.to_dict() == dict(zip(cube_ship_types["Ship Type"], cube_ship_types["count"]))
+        assert np.allclose(monthly["Revenue"], cube_monthly["Revenue"])
+
+        naive = time_calls(naive_callback, df, queries)
+        fast = time_calls(cube_callback, cube, queries)
+        print(f"{n:9d} {build_time:12.2f} {naive[0]:9.1f}/{naive[1]:<8.1f} {fast[0]:8.1f}/{fast[1]:<8.1f} "
+              f"{naive[0] / fast[0]:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
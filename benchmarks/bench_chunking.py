@@ -0,0 +1,69 @@
+# Index size, build time and top-k hit rate of the documentation index per chunking strategy
+# Usage: poetry run python benchmarks/bench_chunking.py [k]
+# Crawls dash.plotly.com (re-crawls are served from ./doc_page_cache)
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scrap_doc import DocumentationScraper
+from index import VectorIndexer
+
+# Question and the path of the page that answers it
+QUESTIONS = [
+    ("How do I update a graph when a dropdown value changes?", "/basic-callbacks"),
+    ("How can a callback read a value without being triggered by it?", "/basic-callbacks"),
+    ("How do I write callbacks for a dynamic number of components?", "/pattern-matching-callbacks"),
+    ("How do I run a callback in the browser with JavaScript?", "/clientside-callbacks"),
+    ("How do I share data between callbacks with dcc.Store?", "/sharing-data-between-callbacks"),
+    ("How do I get the points a user clicked or selected on a graph?", "/interactive-graphing"),
+    ("How do I prevent a callback from firing on page load?", "/advanced-callbacks"),
+    ("How do I run long callbacks in the background with a progress bar?", "/background-callbacks"),
+    ("How do I build a multi-page app with a page registry?", "/pages"),
+    ("How do I add custom CSS and JavaScript to my app?", "/external-resources"),
+    ("How do I show a loading spinner while a component updates?", "/loading-states"),
+    ("How do I memoize expensive computations to improve performance?", "/performance"),
+]
+STRATEGIES = ["page", "recursive", "structure"]
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def hit_rate(indexer, k):
+    hits = 0
+    for question, path in QUESTIONS:
+        docs = indexer.vector_store.similarity_search(question, k=k)
+        hits += any(doc.metadata["source"].rstrip("/").endswith(path) for doc in docs)
+    return hits / len(QUESTIONS)
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    scraper = DocumentationScraper("https://dash.plotly.com/")
+    docs = scraper.load_documents()
+    print(f"{len(docs)} pages crawled, {scraper.crawler.stats}")
+
+    directory = tempfile.mkdtemp()
+    try:
+        print(f"{'strategy':<10} {'chunks':>7} {'size MB':>8} {'build s':>8} {f'hit@{k}':>7}")
+        for strategy in STRATEGIES:
+            index_path = os.path.join(directory, strategy)
+            indexer = VectorIndexer(index_path=index_path, chunking=strategy)
+            start = time.perf_counter()
+            stats = indexer.sync(docs)
+            build_time = time.perf_counter() - start
+            rate = hit_rate(indexer, k)
+            indexer.close()
+            print(f"{strategy:<10} {stats['upserted_chunks']:7d} {directory_size(index_path) / 2**20:8.1f} "
+                  f"{build_time:8.1f} {rate:7.2f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
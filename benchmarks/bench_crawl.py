@@ -0,0 +1,84 @@
+# Crawl a local fixture site: cold crawl, serial vs pooled, and a re-crawl after one page changed
+# Usage: poetry run python benchmarks/bench_crawl.py [pages] [latency_ms]
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler import AsyncCrawler
+
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    """Serves files with Last-Modified/If-Modified-Since support and a fixed latency per request"""
+    latency = 0.05
+
+    def send_head(self):
+        time.sleep(self.latency)
+        return super().send_head()
+
+    def log_message(self, *args):
+        pass
+
+
+def make_site(directory, n_pages):
+    """A homepage linking to sections, each linking to its pages, about three levels deep"""
+    sections = max(n_pages // 10, 1)
+    page = lambda title, links: (f"<html lang='en'><head><title>{title}</title></head><body><h1>{title}</h1>"
+                                 f"<p>{'Dash components and callbacks. ' * 20}</p>"
+                                 + "".join(f"<a href='{link}'>{link}</a>" for link in links) + "</body></html>")
+    with open(os.path.join(directory, "index.html"), "w") as f:
+        f.write(page("Home", [f"/section_{s}.html" for s in range(sections)] + ["/enterprise.html"]))
+    with open(os.path.join(directory, "enterprise.html"), "w") as f:
+        f.write(page("Enterprise", []))
+    for s in range(sections):
+        pages = [f"/page_{s}_{i}.html" for i in range(10)]
+        with open(os.path.join(directory, f"section_{s}.html"), "w") as f:
+            f.write(page(f"Section {s}", pages + ["/index.html"]))
+        for i in range(10):
+            with open(os.path.join(directory, f"page_{s}_{i}.html"), "w") as f:
+                f.write(page(f"Page {s}.{i}", [f"/section_{s}.html"]))
+
+
+def crawl(url, cache_dir, max_connections):
+    crawler = AsyncCrawler(url, max_depth=2, max_connections=max_connections, cache_dir=cache_dir,
+                           url_filter=lambda link: "enterprise" not in link)
+    pages = asyncio.run(crawler.crawl())
+    return pages, crawler.stats
+
+
+def report(label, pages, stats):
+    changed = sum(page["status"] != "unchanged" for page in pages)
+    print(f"{label:<28} {stats['pages']:4d} pages, {stats['downloaded']:4d} downloaded, "
+          f"{stats['not_modified']:4d} not modified, {changed:4d} new/changed in {stats['seconds']:6.2f}s")
+
+
+def main():
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    SlowHandler.latency = (int(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+    with tempfile.TemporaryDirectory() as site, tempfile.TemporaryDirectory() as cache:
+        make_site(site, n_pages)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(SlowHandler, directory=site))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/index.html"
+
+        report("cold, 1 connection", *crawl(url, os.path.join(cache, "serial"), 1))
+        report("cold, 16 connections", *crawl(url, os.path.join(cache, "pooled"), 16))
+        report("re-crawl, unchanged", *crawl(url, os.path.join(cache, "pooled"), 16))
+
+        changed = os.path.join(site, "page_0_0.html")
+        with open(changed, "a") as f:
+            f.write("<p>Updated</p>")
+        # Last-Modified has a one second resolution
+        os.utime(changed, (time.time() + 5, time.time() + 5))
+        report("re-crawl, one page changed", *crawl(url, os.path.join(cache, "pooled"), 16))
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Startup time and memory of a generated app's data loading: pd.read_csv plus the usual string
+# cleaning versus memory-mapping the typed snapshot (data_snapshot.py)
+# Usage: poetry run python benchmarks/bench_data_loading.py [rows] [runs]
+# Each variant runs in a fresh process; RSS is measured after loading and after a callback-like
+# pass over all the data
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from data_snapshot import build_snapshot
+
+# What generated apps do today (see scripts/generated_dash_app.py in earlier runs)
+NAIVE = """
+df = pd.read_csv(path)
+df["Revenue"] = df["Revenue"].str.replace(",", "").str.replace("$", "").astype(float)
+df["Cost"] = df["Cost"].str.replace(",", "").str.replace("$", "").astype(float)
+df["Date"] = pd.to_datetime(df["Date"], format="%m/%d/%Y")
+"""
+SNAPSHOT = """
+from data_snapshot import load_data
+df = load_data(path)
+"""
+RUNNER = """
+import os, sys, time, json, psutil
+start = time.perf_counter()
+import pandas as pd
+{load}
+loaded = time.perf_counter() - start
+rss_loaded = psutil.Process().memory_info().rss
+# A callback's worth of work touching every column
+df.groupby("Business Unit", observed=True)[["Revenue", "Cost"]].sum()
+df["Ship Type"].value_counts()
+df.groupby(df["Date"].dt.to_period("M"))["Revenue"].sum()
+print(json.dumps({{"seconds": loaded, "rss_loaded": rss_loaded, "rss_used": psutil.Process().memory_info().rss,
+                   "frame_bytes": int(df.memory_usage(deep=True).sum())}}))
+"""
+
+
+def make_csv(path, n, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2015-01-01", periods=3000, freq="D").strftime("%m/%d/%Y")
+    pd.DataFrame({
+        "Date": rng.choice(dates, n),
+        "Business Unit": rng.choice(["Tankers", "Bulk", "Containers", "Gas", "Offshore", "Ferries"], n),
+        "Ship Type": rng.choice([f"Type {i}" for i in range(40)], n),
+        "Region": rng.choice(["North America", "Europe", "Asia Pacific", "Latin America", "Middle East"], n),
+        "Revenue": [f"${x:,.2f}" for x in rng.gamma(2.0, 50_000.0, n)],
+        "Cost": [f"${x:,.2f}" for x in rng.gamma(2.0, 35_000.0, n)],
+        "Units": rng.integers(1, 500, n),
+    }).to_csv(path, index=False)
+
+
+def run(load, path, env):
+    code = RUNNER.format(load=f"path = {path!r}\n" + load)
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "shipping.csv")
+        make_csv(path, n_rows)
+        env = dict(os.environ, PYTHONPATH=ROOT, DATA_SNAPSHOT_DIR=os.path.join(directory, "snapshots"))
+        os.environ["DATA_SNAPSHOT_DIR"] = env["DATA_SNAPSHOT_DIR"]
+        # Written once while the workflow explores the data
+        build_snapshot(path)
+
+        print(f"{n_rows} rows, CSV {os.path.getsize(path) / 2**20:.0f} MB, best of {runs} runs")
+        print(f"{'loading':<10} {'startup s':>9} {'RSS loaded MB':>14} {'RSS used MB':>12} {'frame MB':>9}")
+        for name, load in [("read_csv", NAIVE), ("snapshot", SNAPSHOT)]:
+            results = [run(load, path, env) for _ in range(runs)]
+            best = min(results, key=lambda r: r["seconds"])
+            print(f"{name:<10} {best['seconds']:9.2f} {best['rss_loaded'] / 2**20:14.0f} "
+                  f"{best['rss_used'] / 2**20:12.0f} {best['frame_bytes'] / 2**20:9.0f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# Documentation index refresh: full rebuild versus incremental sync after a small docs change
+# Usage: poetry run python benchmarks/bench_docs_sync.py [pages] [changed_pages]
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain_core.documents import Document
+from index import VectorIndexer
+
+WORDS = ("dash callback layout component graph figure dropdown slider input output state store "
+         "interval table datatable style css html core bootstrap server app property id value").split()
+
+
+def make_pages(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        Document(page_content="\n\n".join(" ".join(rng.choices(WORDS, k=120)) for _ in range(12)),
+                 metadata={"source": f"https://dash.plotly.com/page-{i}", "title": f"Page {i}"})
+        for i in range(n)
+    ]
+
+
+def main():
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_changed = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    pages = make_pages(n_pages)
+    # Some pages edited, one removed and one added upstream
+    updated = list(pages)
+    for i in range(n_changed):
+        updated[i] = Document(page_content=updated[i].page_content + "\n\nNew paragraph about pattern matching callbacks.",
+                              metadata=updated[i].metadata)
+    updated.pop()
+    updated.append(make_pages(1, seed=1)[0])
+    updated[-1].metadata["source"] = "https://dash.plotly.com/new-page"
+
+    directory = tempfile.mkdtemp()
+    try:
+        indexer = VectorIndexer(index_path=os.path.join(directory, "documentation_cache"))
+        # Repeated runs hit the persistent embedding cache, the first run gives the cold build time
+        start = time.perf_counter()
+        indexer.sync(pages)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stats = indexer.sync(updated)
+        sync_time = time.perf_counter() - start
+        indexer.close()
+
+        print(f"full build of {n_pages} pages: {build_time:6.1f}s")
+        print(f"incremental sync:          {sync_time:6.1f}s "
+              f"({stats['changed_pages']} pages changed, {stats['upserted_chunks']} chunks upserted, "
+              f"{stats['deleted_chunks']} deleted)")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Compare QdrantVectorStore.from_documents with the batched EmbeddingPipeline
+# Usage: poetry run python benchmarks/bench_embedding.py [pages] [batch_size]
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain.docstore.document import Document
+from langchain_qdrant import QdrantVectorStore, RetrievalMode
+from embedding_pipeline import EmbeddingPipeline
+from user_input import UserInput
+
+WORDS = ("revenue income operating net total expenses assets liabilities equity cash debt "
+         "interest tax segment quarter fiscal million share dividend margin growth").split()
+
+
+def make_pages(n):
+    rng = random.Random(0)
+    pages = []
+    for i in range(n):
+        rows = "\n".join(
+            f"| {' '.join(rng.choices(WORDS, k=3))} | {rng.randint(100, 99999):,} | {rng.randint(100, 99999):,} |"
+            for _ in range(25)
+        )
+        text = " ".join(rng.choices(WORDS, k=300)) + "\n\n| Item | 2023 | 2024 |\n|---|---:|---:|\n" + rows
+        pages.append(Document(page_content=text, metadata={"id": f"page_{i}", "has_table": True, "file": "bench.pdf"}))
+    return pages
+
+
+def main():
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    pages = make_pages(n_pages)
+    user_input = UserInput()
+    # Load both models before timing
+    user_input.embeddings.embed_query("warm up")
+    user_input.sparse_embeddings.embed_query("warm up")
+
+    start = time.perf_counter()
+    QdrantVectorStore.from_documents(
+        pages,
+        embedding=user_input.embeddings,
+        sparse_embedding=user_input.sparse_embeddings,
+        location=":memory:",
+        collection_name="bench_default",
+        retrieval_mode=RetrievalMode.HYBRID
+    )
+    default_time = time.perf_counter() - start
+
+    vector_store = QdrantVectorStore.construct_instance(
+        embedding=user_input.embeddings,
+        sparse_embedding=user_input.sparse_embeddings,
+        client_options={"location": ":memory:"},
+        collection_name="bench_pipeline",
+        retrieval_mode=RetrievalMode.HYBRID
+    )
+    stats = EmbeddingPipeline(user_input.embeddings, user_input.sparse_embeddings, batch_size=batch_size).run(vector_store, pages)
+
+    print(f"from_documents: {n_pages / default_time:6.1f} pages/sec ({default_time:.1f}s)")
+    print(f"pipeline:       {stats['pages_per_sec']:6.1f} pages/sec ({stats['seconds']:.1f}s, "
+          f"dense {stats['dense_seconds']:.1f}s, sparse {stats['sparse_seconds']:.1f}s, upload {stats['upload_seconds']:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Filtered search latency (p50/p99) versus collection size, with and without payload indexes
+# Usage: poetry run python benchmarks/bench_filtered_search.py [url] [sizes...]
+# Without a url the embedded Qdrant is used. It ignores payload indexes, HNSW and quantization, so
+# indexing gains nothing there and only the unindexed baseline is measured
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from qdrant_client import QdrantClient, models
+from user_input import create_payload_indexes, collection_settings
+
+DIM = 384
+QUERIES = 200
+
+
+def fill(client, name, size, n_files, indexed, settings):
+    client.create_collection(name, vectors_config=models.VectorParams(size=DIM, distance=models.Distance.COSINE), **settings)
+    if indexed:
+        create_payload_indexes(client, name)
+    rng = np.random.default_rng(0)
+    for start in range(0, size, 1000):
+        count = min(1000, size - start)
+        client.upsert(name, points=[
+            models.PointStruct(
+                id=start + i,
+                vector=vector.tolist(),
+                payload={"metadata": {"id": f"doc_{start + i}", "file": f"filing_{(start + i) % n_files}.pdf",
+                                      "has_table": bool((start + i) % 3 == 0)}}
+            )
+            for i, vector in enumerate(rng.random((count, DIM), dtype="float32"))
+        ])
+
+
+def measure(client, name, n_files):
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(QUERIES):
+        query_filter = models.Filter(must=[
+            models.FieldCondition(key="metadata.has_table", match=models.MatchValue(value=True)),
+            models.FieldCondition(key="metadata.file", match=models.MatchValue(value=f"filing_{rng.randrange(n_files)}.pdf")),
+        ])
+        start = time.perf_counter()
+        client.query_points(name, query=np.random.random(DIM).tolist(), query_filter=query_filter, limit=5)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return 1000 * latencies[len(latencies) // 2], 1000 * latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    args = sys.argv[1:]
+    url = args.pop(0) if args and args[0].startswith("http") else None
+    sizes = [int(size) for size in args] or [1_000, 5_000, 20_000]
+    with tempfile.TemporaryDirectory() as directory:
+        client = QdrantClient(url=url) if url else QdrantClient(path=directory)
+        if not url:
+            print("Embedded Qdrant ignores payload indexes and quantization, pass a server url to compare them")
+        print(f"{'points':>8} {'variant':<22} {'p50 ms':>8} {'p99 ms':>8}")
+        for size in sizes:
+            # Roughly 50 pages per filing
+            n_files = max(size // 50, 1)
+            variants = {"no payload index": (False, {})}
+            if url:
+                variants["payload index"] = (True, {})
+                variants["payload index + int8"] = (True, collection_settings(quantization="int8"))
+            for variant, (indexed, settings) in variants.items():
+                name = f"bench_{size}_{len(settings)}_{int(indexed)}"
+                if client.collection_exists(name):
+                    client.delete_collection(name)
+                fill(client, name, size, n_files, indexed, settings)
+                p50, p99 = measure(client, name, n_files)
+                print(f"{size:>8} {variant:<22} {p50:8.2f} {p99:8.2f}")
+                client.delete_collection(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# Pages/sec of the PDF parser backends
+# Usage: poetry run python benchmarks/bench_parsing.py [pdf ...] [--llamaparse]
+# Docling runs with one worker and with one worker per core; --llamaparse also times the remote service
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from pdf_parsers import get_parser
+
+
+def run(label, parser, file_paths):
+    start = time.perf_counter()
+    docs = parser.parse(file_paths)
+    elapsed = time.perf_counter() - start
+    pages = sum(len(doc["pages"]) for doc in docs)
+    tables = sum(page["triggeredAutoMode"] for doc in docs for page in doc["pages"])
+    print(f"{label:<22} {pages:5d} pages ({tables} with tables) in {elapsed:6.1f}s: {pages / elapsed:6.2f} pages/sec")
+
+
+def main():
+    args = sys.argv[1:]
+    remote = "--llamaparse" in args
+    file_paths = [arg for arg in args if arg != "--llamaparse"] or [os.path.join(ROOT, "data", "form-10k-exp.pdf")]
+    cores = os.cpu_count()
+
+    if remote:
+        run("llamaparse", get_parser("llamaparse"), file_paths)
+    # Each pool loads the docling models once per worker, the timings include it
+    run("docling, 1 worker", get_parser("docling", workers=1), file_paths)
+    run(f"docling, {cores} workers", get_parser("docling", workers=cores), file_paths)
+
+
+if __name__ == "__main__":
+    main()
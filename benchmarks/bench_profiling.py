@@ -0,0 +1,80 @@
+# Compare the old run_code subprocess profiling with the in-process profiler
+# Usage: poetry run python benchmarks/bench_profiling.py [path/to/file.csv] [rows]
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_agent import run_code
+from data_profiler import profile_csv
+
+SUBPROCESS_COMMANDS = [
+    "print(df.info())",
+    "print(df.columns.tolist())",
+    "print(df.dtypes.to_string())",
+    "print(df.head().to_string())",
+    "print(df.describe(include='all').to_string())",
+    """cat_analysis = {}
+for col in df.select_dtypes(include=['object', 'category']).columns:
+    cat_analysis[col] = {
+        'unique_values': df[col].value_counts().head(10).to_dict(),
+        'total_unique': df[col].nunique(),
+        'null_count': df[col].isnull().sum()
+    }
+print(cat_analysis)""",
+    """num_analysis = {}
+for col in df.select_dtypes(include=['int64', 'float64']).columns:
+    stats = df[col].describe()
+    num_analysis[col] = {
+        'min': stats['min'],
+        'max': stats['max'],
+        'mean': stats['mean'],
+        'median': df[col].median(),
+        'null_count': df[col].isnull().sum(),
+        'skewness': df[col].skew()
+    }
+print(num_analysis)""",
+]
+
+
+def make_dataset(path, rows):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "Date": pd.date_range("2020-01-01", periods=rows, freq="min").strftime("%Y-%m-%d"),
+        "Business Unit": rng.choice(["Retail", "Wholesale", "Online", "Export"], rows),
+        "Ship Type": rng.choice(["Air", "Sea", "Road"], rows),
+        "Revenue": rng.lognormal(8, 1, rows).round(2),
+        "Units": rng.integers(1, 500, rows),
+    })
+    df.to_csv(path, index=False)
+
+
+def main():
+    if len(sys.argv) > 1:
+        file_path = sys.argv[1]
+    else:
+        rows = int(sys.argv[2]) if len(sys.argv) > 2 else 500_000
+        os.makedirs("./data", exist_ok=True)
+        file_path = "./data/bench_profiling.csv"
+        make_dataset(file_path, rows)
+
+    start = time.perf_counter()
+    for command in SUBPROCESS_COMMANDS:
+        run_code(command, file_path)
+    subprocess_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    profile_csv(file_path)
+    in_process_time = time.perf_counter() - start
+
+    print(f"File: {file_path} ({os.path.getsize(file_path) / 1e6:.1f} MB)")
+    print(f"run_code subprocesses: {subprocess_time:.2f}s")
+    print(f"in-process profiler:   {in_process_time:.2f}s")
+    print(f"speedup:               {subprocess_time / in_process_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
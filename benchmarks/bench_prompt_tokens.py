@@ -0,0 +1,63 @@
+# Prompt tokens per DashCoder call with the worked examples versus retrieved documentation
+# Usage: poetry run python benchmarks/bench_prompt_tokens.py [--call]
+# Needs the documentation index (index.py); --call also times one generation each way
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dash_agent import DashCoder
+from index import VectorIndexer
+
+CASES = [
+    ("./data/dummy_data.csv",
+     "- A line chart to visualize stock price trends over time.\n"
+     "- A bar chart to compare the volume traded across different companies.",
+     "- A date range picker to filter stock data by time.\n"
+     "- A dropdown to select different companies.\n"
+     "- A graph component for the line chart.\n"
+     "- A graph component for the bar chart."),
+    ("./data/crypto.csv",
+     "- A candlestick chart of daily prices.\n- A histogram of daily returns.",
+     "- A checklist to pick the cryptocurrencies.\n"
+     "- A range slider for the time window.\n"
+     "- Tabs switching between the price and returns graphs."),
+    ("./data/filing.pdf",
+     "- A stacked bar chart of obligations per period.\n- A pie chart of obligation shares.",
+     "- A dropdown to select categories.\n"
+     "- A data table listing the obligations.\n"
+     "- Two graph components side by side."),
+]
+
+
+def run(coder, call):
+    totals = []
+    for data_path, plot_recs, dash_recs in CASES:
+        messages, stats = coder.build_messages("", data_path, plot_recs, dash_recs, "adhoc-gen")
+        if call:
+            start = time.perf_counter()
+            coder.generate(messages)
+            stats["seconds"] = time.perf_counter() - start
+        totals.append(stats)
+    return totals
+
+
+def main():
+    call = "--call" in sys.argv
+    indexer = VectorIndexer()
+    indexer.load_index()
+    results = {"examples": run(DashCoder(), call), "documentation": run(DashCoder(doc_indexer=indexer), call)}
+
+    print(f"{'case':<22} {'prompt':<14} {'tokens':>7} {'docs':>6}" + (f" {'seconds':>8}" if call else ""))
+    for i, (data_path, _, _) in enumerate(CASES):
+        for name, totals in results.items():
+            stats = totals[i]
+            print(f"{os.path.basename(data_path):<22} {name:<14} {stats['prompt_tokens']:7d} {stats['doc_tokens']:6d}"
+                  + (f" {stats['seconds']:8.1f}" if call else ""))
+    for name, totals in results.items():
+        print(f"mean tokens per call, {name}: {sum(s['prompt_tokens'] for s in totals) / len(totals):.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Latency and recall of PDF table retrieval: the old blank-query search against search_tables
+# Usage: poetry run python benchmarks/bench_retrieval.py [pages]
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from user_input import UserInput, file_sha256
+
+TOPICS = {
+    "revenue": "Revenue by segment | Cloud | Devices | Services | Advertising",
+    "balance": "Balance sheet | Total assets | Total liabilities | Shareholders equity",
+    "cash": "Cash flow statement | Operating activities | Investing activities | Financing activities",
+    "tax": "Income taxes | Effective tax rate | Deferred tax assets | Current tax",
+    "employees": "Headcount by region | Employees | Contractors | Attrition",
+    "debt": "Long-term debt | Notes due | Interest rate | Maturity",
+}
+QUERIES = {
+    "revenue": "How did revenue evolve across business segments?",
+    "balance": "Show total assets and liabilities over time",
+    "cash": "Visualize operating and investing cash flows",
+    "tax": "What is the effective tax rate trend?",
+    "employees": "Plot employee headcount per region",
+    "debt": "Compare long-term debt maturities and interest rates",
+}
+FILLER = "The company discusses its strategy, risks, governance and outlook for the coming fiscal year."
+
+
+def make_fixture(directory, n_pages):
+    """Writes a stand-in PDF and its parsed pages, so no parsing service is needed"""
+    rng = random.Random(0)
+    pages = []
+    expected = {topic: [] for topic in TOPICS}
+    for i in range(n_pages):
+        topic = rng.choice(list(TOPICS)) if rng.random() < 0.4 else None
+        if topic is None:
+            pages.append({"md": f"# Page {i}\n\n" + " ".join([FILLER] * rng.randint(3, 8)), "triggeredAutoMode": False})
+            continue
+        header, *columns = TOPICS[topic].split(" | ")
+        rows = "\n".join(f"| {column} | {rng.randint(100, 99999):,} | {rng.randint(100, 99999):,} |" for column in columns)
+        pages.append({"md": f"# {header}\n\n| Item | 2023 | 2024 |\n|---|---:|---:|\n{rows}", "triggeredAutoMode": True})
+        expected[topic].append(i)
+
+    file_path = os.path.join(directory, "fixture.pdf")
+    with open(file_path, "wb") as f:
+        f.write(json.dumps(pages).encode("utf-8"))
+    parsed_dir = os.path.join(directory, "parsed")
+    os.makedirs(parsed_dir)
+    with open(os.path.join(parsed_dir, f"{file_sha256(file_path)}.json"), "w", encoding="utf-8") as f:
+        json.dump({"file_path": file_path, "pages": pages}, f)
+    return file_path, parsed_dir, expected
+
+
+def evaluate(name, retrieve, expected):
+    latencies = []
+    recalls = []
+    for topic, query in QUERIES.items():
+        start = time.perf_counter()
+        docs = retrieve(query)
+        latencies.append(time.perf_counter() - start)
+        relevant = set(expected[topic])
+        found = {doc.metadata["page"] for doc in docs} & relevant
+        recalls.append(len(found) / len(relevant) if relevant else 1.0)
+    latencies.sort()
+    print(f"{name:<14} median {1000 * latencies[len(latencies) // 2]:7.1f}ms  "
+          f"max {1000 * latencies[-1]:7.1f}ms  recall {sum(recalls) / len(recalls):.2f}")
+
+
+def main():
+    n_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    with tempfile.TemporaryDirectory() as directory:
+        file_path, parsed_dir, expected = make_fixture(directory, n_pages)
+        user_input = UserInput(index_path=os.path.join(directory, "index"), parsed_cache_dir=parsed_dir)
+        user_input.process_files(file_path)
+        # Load the models before timing
+        user_input.vector_store.similarity_search("warm up", k=1)
+
+        evaluate("blank query", lambda query: user_input.search("  ", k=2, filter=True), expected)
+        evaluate("search_tables", lambda query: user_input.search_tables(query, file_path=file_path), expected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Measure import time and cold start (process start to the first interactive prompt)
+# Usage: poetry run python benchmarks/bench_startup.py [runs]
+
+import os
+import re
+import sys
+import time
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Does everything main() does before its first input() call
+COLD_START = """
+from dash_workflow import DashWorkflow
+workflow = DashWorkflow()
+print("READY", flush=True)
+"""
+
+
+def cold_start():
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", COLD_START], cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    for line in proc.stdout:
+        if line.startswith("READY"):
+            elapsed = time.perf_counter() - start
+            break
+    else:
+        raise RuntimeError("Workflow did not start")
+    proc.wait()
+    return elapsed
+
+
+def import_times(top=10):
+    """Cumulative import time per top-level module from python -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import dash_workflow"],
+                            cwd=ROOT, capture_output=True, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match and len(match.group(2)) <= 1:
+            times[match.group(3)] = int(match.group(1)) / 1e6
+    return sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print("Slowest top-level imports of dash_workflow:")
+    for module, seconds in import_times():
+        print(f"  {module:<40} {seconds:6.2f}s")
+
+    timings = sorted(cold_start() for _ in range(runs))
+    print(f"Cold start to first prompt over {runs} runs: "
+          f"min {timings[0]:.2f}s, median {timings[len(timings) // 2]:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# Memoization of the callbacks of generated Dash apps
+#
+#     from callback_cache import CallbackCache
+#     app = dash.Dash(__name__)
+#     cache = CallbackCache(app)
+#
+#     @app.callback(...)
+#     @cache.memoize()
+#     def update_charts(start_date, end_date, selected):
+#         ...
+#
+# Results are keyed on the callback, the data it reads and its input values and stored
+# serialized, so a figure is converted to JSON once rather than on every request. The
+# "memory" backend keeps entries in the process, the "disk" backend in a SQLite file
+# that all workers of a multi-process server share. Hit rates are served at /_callback_cache.
+
+import os
+import sys
+import json
+import time
+import types
+import atexit
+import sqlite3
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Defaults for apps that do not choose, set by the deployment backend for multi-worker servers
+BACKEND_ENV = "CALLBACK_CACHE_BACKEND"
+PATH_ENV = "CALLBACK_CACHE_PATH"
+STATS_ROUTE = "/_callback_cache"
+# Seconds between writes of the disk backend that only keep LRU order and hit counters
+WRITE_INTERVAL = 5
+
+
+def serialize(result):
+    """JSON of a callback result (figures, components, tuples of them), the way Dash encodes it"""
+    try:
+        from plotly.io.json import to_json_plotly
+        return to_json_plotly(result).encode("utf-8")
+    except ImportError:
+        return json.dumps(result, default=str).encode("utf-8")
+
+
+def cacheable(result):
+    """no_update can not be stored, the callback has to run again"""
+    values = result if isinstance(result, (tuple, list)) else [result]
+    return not any(type(value).__name__ == "NoUpdate" for value in values)
+
+
+class MemoryBackend:
+    """Least recently used entries of one process"""
+    def __init__(self, max_entries=256, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            created, payload = entry
+            if created < time.time() - self.ttl_seconds:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return payload
+
+    def put(self, key, payload):
+        with self._lock:
+            self.entries[key] = (time.time(), payload)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def record(self, name, outcome):
+        with self._lock:
+            counts = self.counts.setdefault(name, {"hits": 0, "misses": 0})
+            counts[outcome] += 1
+
+    def counters(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self.counts.items()}
+
+    def size(self):
+        with self._lock:
+            return len(self.entries), sum(len(payload) for _, payload in self.entries.values())
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.counts.clear()
+
+
+class SQLiteBackend:
+    """
+    Entries and hit counters in a SQLite file shared by the processes using the same
+    path. Each process opens its own connection, also after a fork (gunicorn
+    workers), and WAL mode lets readers go on while one of them writes.
+    """
+    def __init__(self, path="./callback_cache.sqlite", max_entries=2048, ttl_seconds=3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        # Hits and misses of this process not yet added to the shared counters
+        self.pending = {}
+        # Process whose thread adds its pending counts every WRITE_INTERVAL seconds
+        self._flusher_pid = None
+        atexit.register(self.flush)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            conn = self.conn
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    payload BLOB,
+                    created REAL,
+                    last_used REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, hits INTEGER, misses INTEGER)")
+            conn.commit()
+
+    @property
+    def conn(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+            self.pending = {}
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT payload, last_used FROM entries WHERE key = ? AND created >= ?", (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+            # Recency only matters for eviction, a hit does not need a write every time
+            if now - row[1] > WRITE_INTERVAL:
+                self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+            return bytes(row[0])
+
+    def put(self, key, payload):
+        now = time.time()
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, payload, now, now))
+            self.conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl_seconds,))
+            self.conn.execute("""
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self.conn.commit()
+
+    def record(self, name, outcome):
+        with self._lock:
+            counts = self.pending.setdefault(name, {"hits": 0, "misses": 0})
+            counts[outcome] += 1
+            if self._flusher_pid != os.getpid():
+                # Threads do not survive a fork, every worker starts its own
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self._flush_periodically, name="callback-cache-flush", daemon=True).start()
+
+    def _flush_periodically(self):
+        """Add the counts of this process on a timer, so they are counted while it is idle too"""
+        while True:
+            time.sleep(WRITE_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        for name, counts in self.pending.items():
+            self.conn.execute(
+                "INSERT INTO counters VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                (name, counts["hits"], counts["misses"])
+            )
+        if self.pending:
+            self.conn.commit()
+        self.pending = {}
+
+    def counters(self):
+        with self._lock:
+            self._flush()
+            rows = self.conn.execute("SELECT name, hits, misses FROM counters").fetchall()
+        return {name: {"hits": hits, "misses": misses} for name, hits, misses in rows}
+
+    def size(self):
+        with self._lock:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM entries").fetchone()
+        return count, total
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute("DELETE FROM counters")
+            self.conn.commit()
+            self.pending = {}
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "disk": SQLiteBackend,
+}
+
+
+class CallbackCache:
+    def __init__(self, app=None, backend=None, path=None, max_entries=None, ttl_seconds=3600, namespace=None):
+        """
+        backend is "memory" or "disk", by default the CALLBACK_CACHE_BACKEND environment
+        variable or "memory"; the disk backend uses path (CALLBACK_CACHE_PATH or
+        ./callback_cache.sqlite). Entries expire after ttl_seconds, the least recently
+        used beyond max_entries are evicted. namespace is part of every key, by default
+        it identifies the data of each callback (see data_namespace); pass one that
+        changes with the data when it is not loaded with data_snapshot.load_data.
+        """
+        backend = backend or os.getenv(BACKEND_ENV, "memory")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown callback cache backend: {backend}. Choose from {list(BACKENDS)}")
+        options = {"ttl_seconds": ttl_seconds}
+        if max_entries is not None:
+            options["max_entries"] = max_entries
+        if backend == "disk":
+            options["path"] = path or os.getenv(PATH_ENV, "./callback_cache.sqlite")
+        self.backend_name = backend
+        self.backend = BACKENDS[backend](**options)
+        self.namespace = namespace
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Serve stats() as JSON at STATS_ROUTE of the Dash app's Flask server"""
+        server = getattr(app, "server", app)
+        server.add_url_rule(STATS_ROUTE, "callback_cache_stats", lambda: self.stats())
+
+    @staticmethod
+    def _hash_code(code, digest):
+        """Feed code and the code objects nested in it (comprehensions, lambdas) to digest"""
+        digest.update(code.co_code)
+        digest.update(repr(code.co_names).encode("utf-8"))
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                # Their repr holds a memory address, which differs from one process to the next
+                CallbackCache._hash_code(const, digest)
+            elif isinstance(const, frozenset):
+                # Ordered by string hashes, which are randomized per process
+                digest.update(repr(sorted(map(repr, const))).encode("utf-8"))
+            else:
+                digest.update(repr(const).encode("utf-8"))
+
+    @staticmethod
+    def function_id(func):
+        """
+        The callback's name and a hash of its code, so a regenerated app with the same
+        callback names does not get the old app's results from a shared cache file.
+        """
+        digest = hashlib.sha256()
+        CallbackCache._hash_code(func.__code__, digest)
+        return f"{func.__module__}.{func.__qualname__}:{digest.hexdigest()[:16]}"
+
+    def data_namespace(self, func):
+        """
+        namespace, or by default a hash of the script that defines func (its module-level
+        data and data paths) and of the snapshots loaded by data_snapshot.load_data, whose
+        names change with the data files. Computed on the first call, after the data loaded.
+        """
+        if self.namespace is not None:
+            return self.namespace
+        path = func.__code__.co_filename
+        try:
+            with open(path, "rb") as f:
+                parts = [hashlib.sha256(f.read()).hexdigest()]
+        except OSError:
+            parts = [path]
+        snapshots = sys.modules.get("data_snapshot")
+        if snapshots is not None:
+            parts.extend(sorted(snapshots.LOADED_SNAPSHOTS))
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def key(namespace, name, args, kwargs):
+        raw = json.dumps([namespace, name, args, sorted(kwargs.items())], default=str, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def memoize(self):
+        """
+        Decorator for a callback whose outputs depend only on its input values (not on
+        callback_context or on state changed elsewhere). Goes under @app.callback.
+        A hit returns the stored JSON decoded to plain lists and dicts, which Dash
+        sends as they are.
+        """
+        def decorator(func):
+            name = self.function_id(func)
+            namespace = []
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not namespace:
+                    namespace.append(self.data_namespace(func))
+                key = self.key(namespace[0], name, args, kwargs)
+                payload = self.backend.get(key)
+                if payload is not None:
+                    self.backend.record(name, "hits")
+                    return _loads(payload)
+                self.backend.record(name, "misses")
+                result = func(*args, **kwargs)
+                if cacheable(result):
+                    try:
+                        payload = serialize(result)
+                    except (TypeError, ValueError):
+                        # Not JSON serializable, Dash would reject it anyway
+                        return result
+                    self.backend.put(key, payload)
+                return result
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """
+        Hits, misses and hit rate per callback. With the disk backend they add up all
+        processes, the counts of the others at most WRITE_INTERVAL seconds late.
+        """
+        callbacks = {}
+        hits = misses = 0
+        for name, counts in self.backend.counters().items():
+            lookups = counts["hits"] + counts["misses"]
+            callbacks[name] = dict(counts, hit_rate=counts["hits"] / lookups if lookups else 0.0)
+            hits += counts["hits"]
+            misses += counts["misses"]
+        entries, total_bytes = self.backend.size()
+        return {
+            "backend": self.backend_name,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "entries": entries,
+            "bytes": total_bytes,
+            "callbacks": callbacks,
+        }
+
+    def clear(self):
+        self.backend.clear()
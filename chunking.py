@@ -0,0 +1,136 @@
+# Deterministic chunking of documentation pages for the documentation index
+
+import re
+import hashlib
+from langchain_core.documents import Document
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+FENCE = re.compile(r"^\s*```")
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def markdown_blocks(text):
+    """
+    Split markdown into (kind, level, text) blocks: headings, fenced code blocks and
+    paragraphs separated by blank lines. A code block is one block however long it is.
+    """
+    blocks = []
+    paragraph = []
+    code = None
+
+    def flush():
+        if paragraph:
+            blocks.append(("text", 0, "\n".join(paragraph).strip()))
+            paragraph.clear()
+
+    for line in text.splitlines():
+        if code is not None:
+            code.append(line)
+            if FENCE.match(line):
+                blocks.append(("code", 0, "\n".join(code)))
+                code = None
+        elif FENCE.match(line):
+            flush()
+            code = [line]
+        elif HEADING.match(line):
+            flush()
+            level, title = HEADING.match(line).groups()
+            blocks.append(("heading", len(level), title.strip()))
+        elif not line.strip():
+            flush()
+        else:
+            paragraph.append(line)
+    flush()
+    if code is not None:
+        # Unterminated fence, keep what there is
+        blocks.append(("code", 0, "\n".join(code)))
+    return [block for block in blocks if block[2]]
+
+
+def structured_chunks(doc, chunk_size=1000, chunk_overlap=150):
+    """
+    Chunks that follow the page's sections. A heading starts a new chunk, paragraphs
+    and code blocks are packed up to chunk_size characters, code blocks are never split,
+    and a chunk repeats the last chunk_overlap characters of the paragraph before it in
+    the same section. Each chunk starts with its section path, which is also stored
+    in its metadata with the page url.
+    """
+    chunks = []
+    path = []
+    current = []
+    overlap = []
+
+    def emit():
+        if not any(kind != "overlap" for kind, _ in current):
+            return
+        section = " > ".join(title for _, title in path)
+        body = "\n\n".join(text for _, text in current)
+        chunks.append((section, f"{section}\n\n{body}" if section else body))
+
+    def split_long(text):
+        """A paragraph longer than chunk_size is cut at sentence or word boundaries"""
+        pieces = []
+        while len(text) > chunk_size:
+            cut = max(text.rfind(". ", 0, chunk_size) + 1, text.rfind(" ", 0, chunk_size))
+            cut = cut if cut > 0 else chunk_size
+            pieces.append(text[:cut].strip())
+            text = text[cut:].strip()
+        return pieces + [text] if text else pieces
+
+    for kind, level, text in markdown_blocks(doc.page_content):
+        if kind == "heading":
+            emit()
+            path = [(l, title) for l, title in path if l < level] + [(level, text)]
+            current, overlap = [], []
+            continue
+        for piece in ([text] if kind == "code" else split_long(text)):
+            size = sum(len(t) for _, t in current) + len(piece)
+            if current and size > chunk_size and any(k != "overlap" for k, _ in current):
+                # A code block moves on together with the paragraph introducing it
+                intro = [current.pop()] if kind == "code" and current[-1][0] == "text" else []
+                emit()
+                current = intro or [("overlap", t) for t in overlap]
+            current.append((kind, piece))
+            if kind == "text" and chunk_overlap:
+                # The end of the last paragraph, from a word boundary, is repeated in the next chunk
+                tail = piece[-chunk_overlap:]
+                overlap = [tail[tail.find(" ") + 1:] if len(piece) > chunk_overlap else tail]
+            else:
+                overlap = []
+    emit()
+
+    url = doc.metadata.get("source")
+    return [
+        Document(page_content=text, metadata=dict(doc.metadata, url=url, section=section,
+                                                  chunk=i, chunk_hash=chunk_hash(text)))
+        for i, (section, text) in enumerate(chunks)
+    ]
+
+
+def chunk_documents(docs, chunk_size=1000, chunk_overlap=150, strategy="structure"):
+    """
+    Split pages into chunks with strategy "structure" (sections and code blocks),
+    "recursive" (character windows) or "page" (one chunk per page). The same page text
+    always gives the same chunks, so their hashes identify what changed between crawls.
+    """
+    if strategy == "structure":
+        return [chunk for doc in docs for chunk in structured_chunks(doc, chunk_size, chunk_overlap)]
+    if strategy == "page":
+        return [Document(page_content=doc.page_content,
+                         metadata=dict(doc.metadata, chunk=0, chunk_hash=chunk_hash(doc.page_content)))
+                for doc in docs]
+    if strategy != "recursive":
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = []
+    for doc in docs:
+        for i, text in enumerate(splitter.split_text(doc.page_content)):
+            chunks.append(Document(
+                page_content=text,
+                metadata=dict(doc.metadata, chunk=i, chunk_hash=chunk_hash(text))
+            ))
+    return chunks
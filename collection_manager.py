@@ -0,0 +1,245 @@
+# Per-file / per-tenant Qdrant collections behind an LRU pool of open vector stores
+
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """Any number of readers or a single writer"""
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writer:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class _Handle:
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+        self.lock = ReadWriteLock()
+        self.users = 0
+        # Set by drop(), the client is closed when the last user releases the handle
+        self.dropped = False
+        self.closing = False
+        self.closed = threading.Event()
+
+
+class CollectionManager:
+    def __init__(self, embeddings, sparse_embeddings, base_path="./user_input_shards", url=None,
+                 max_open=8, collection_options=None, on_create=None):
+        """
+        Every shard (a filing's content hash or a tenant id) is its own collection.
+        Embedded Qdrant loads a whole storage path into memory and locks it, so each
+        shard gets its own path under base_path; with url all shards are collections
+        of one server. At most max_open stores stay open, the least recently used
+        idle one is closed when another is needed. Handles in use are never closed.
+        on_create(vector_store) runs once after a shard's collection is created.
+        The locks only coordinate the threads of one process: a second process must
+        not open the same embedded base_path, and processes sharing a server (url)
+        do not see each other's writers.
+        """
+        self.embeddings = embeddings
+        self.sparse_embeddings = sparse_embeddings
+        self.base_path = base_path
+        self.url = url
+        self.max_open = max_open
+        self.collection_options = collection_options or {}
+        self.on_create = on_create
+        self.handles = OrderedDict()
+        self.opened = 0
+        self.closed = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._shard_locks = {}
+        # Dropped handles still in use, by shard
+        self._dropping = {}
+        # Client of the server for collection lookups, with url
+        self._client = None
+
+    @staticmethod
+    def collection_name(shard):
+        return "shard_" + re.sub(r"[^A-Za-z0-9_-]", "_", shard)
+
+    def shard_path(self, shard):
+        return os.path.join(self.base_path, self.collection_name(shard))
+
+    def exists(self, shard):
+        if self.url:
+            from qdrant_client import QdrantClient
+            with self._lock:
+                if self._client is None:
+                    self._client = QdrantClient(url=self.url)
+                client = self._client
+            return client.collection_exists(self.collection_name(shard))
+        return os.path.exists(self.shard_path(shard))
+
+    def _open(self, shard, create):
+        from langchain_qdrant import QdrantVectorStore, RetrievalMode
+        client_options = {"url": self.url} if self.url else {"path": self.shard_path(shard)}
+        if not self.exists(shard):
+            if not create:
+                raise KeyError(f"No collection for shard {shard}")
+            vector_store = QdrantVectorStore.construct_instance(
+                embedding=self.embeddings,
+                sparse_embedding=self.sparse_embeddings,
+                client_options=client_options,
+                collection_name=self.collection_name(shard),
+                retrieval_mode=RetrievalMode.HYBRID,
+                collection_create_options=self.collection_options
+            )
+            if self.on_create:
+                self.on_create(vector_store)
+            return vector_store
+        return QdrantVectorStore.from_existing_collection(
+            embedding=self.embeddings,
+            sparse_embedding=self.sparse_embeddings,
+            collection_name=self.collection_name(shard),
+            retrieval_mode=RetrievalMode.HYBRID,
+            **client_options
+        )
+
+    def _acquire(self, shard, create):
+        with self._lock:
+            shard_lock = self._shard_locks.setdefault(shard, threading.Lock())
+        # Opening a shard can take a while, only callers of the same shard wait for it
+        with shard_lock:
+            with self._lock:
+                handle = self.handles.get(shard)
+                if handle is not None:
+                    self.hits += 1
+                    self.handles.move_to_end(shard)
+                    handle.users += 1
+                    return handle
+                dropping = self._dropping.get(shard)
+            if dropping is not None:
+                # Embedded Qdrant locks the path until the dropped shard's client is closed
+                dropping.closed.wait()
+            handle = _Handle(self._open(shard, create))
+            with self._lock:
+                handle.users += 1
+                self.handles[shard] = handle
+                self.opened += 1
+                self._evict()
+            return handle
+
+    def _release(self, shard, handle):
+        with self._lock:
+            handle.users -= 1
+            close = handle.dropped and handle.users == 0 and not handle.closing
+            if close:
+                handle.closing = True
+            self._evict()
+        if close:
+            handle.vector_store.client.close()
+            if not self.url:
+                shutil.rmtree(self.shard_path(shard), ignore_errors=True)
+            with self._lock:
+                self._dropping.pop(shard, None)
+                self.closed += 1
+            handle.closed.set()
+
+    def _evict(self):
+        """Close idle stores, coldest first, until at most max_open are open. Caller holds _lock"""
+        for shard in list(self.handles):
+            if len(self.handles) <= self.max_open:
+                return
+            if self.handles[shard].users == 0:
+                self.handles.pop(shard).vector_store.client.close()
+                self.closed += 1
+
+    @contextmanager
+    def reader(self, shard):
+        """Shared access to an existing shard, concurrent readers do not block each other"""
+        handle = self._acquire(shard, create=False)
+        try:
+            with handle.lock.read():
+                if handle.dropped:
+                    raise KeyError(f"No collection for shard {shard}")
+                yield handle.vector_store
+        finally:
+            self._release(shard, handle)
+
+    @contextmanager
+    def writer(self, shard):
+        """Exclusive access to a shard, creating its collection if needed"""
+        while True:
+            handle = self._acquire(shard, create=True)
+            try:
+                with handle.lock.write():
+                    if handle.dropped:
+                        # Dropped while waiting, create it again
+                        continue
+                    yield handle.vector_store
+                    return
+            finally:
+                self._release(shard, handle)
+
+    def drop(self, shard):
+        """
+        Delete a shard and its data. Readers already waiting for it get a KeyError,
+        writers a new collection, and its client stays open until they are done.
+        """
+        handle = self._acquire(shard, create=False) if self.exists(shard) else None
+        if handle is None:
+            return
+        try:
+            with handle.lock.write():
+                if handle.dropped:
+                    return
+                handle.vector_store.client.delete_collection(self.collection_name(shard))
+                with self._lock:
+                    handle.dropped = True
+                    if self.handles.get(shard) is handle:
+                        self.handles.pop(shard)
+                    self._dropping[shard] = handle
+        finally:
+            self._release(shard, handle)
+
+    def close_all(self):
+        with self._lock:
+            for handle in self.handles.values():
+                handle.vector_store.client.close()
+            self.closed += len(self.handles)
+            self.handles.clear()
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": len(self.handles),
+                "in_use": sum(handle.users > 0 for handle in self.handles.values()),
+                "opened": self.opened,
+                "closed": self.closed,
+                "hits": self.hits,
+            }
@@ -0,0 +1,209 @@
+# Async breadth-first crawler with conditional requests and an on-disk page cache
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from urllib.parse import urljoin, urlparse, urldefrag
+
+SKIPPED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".css", ".js", ".json",
+                      ".pdf", ".zip", ".csv", ".xml", ".woff", ".woff2", ".mp4")
+
+
+def page_text(html):
+    """Visible text of a page, as WebBaseLoader extracts it"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    return soup.get_text()
+
+
+BLOCK_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "pre", "table", "blockquote")
+
+
+def page_markdown(html):
+    """
+    Headings, paragraphs, list items, tables and code blocks of a page as markdown, in
+    document order, so chunking can follow the page structure. Code keeps its layout
+    inside ``` fences. Falls back to the plain text when the page has no such blocks.
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript", "nav", "footer"]):
+        tag.decompose()
+    blocks = []
+    for tag in soup.find_all(BLOCK_TAGS):
+        # Blocks inside another block were already emitted with their parent
+        if tag.find_parent(BLOCK_TAGS):
+            continue
+        if tag.name == "pre":
+            code = tag.get_text().strip("\n")
+            if code.strip():
+                blocks.append(f"```\n{code}\n```")
+            continue
+        if tag.name == "table":
+            rows = [" | ".join(cell.get_text(" ", strip=True) for cell in row.find_all(["th", "td"]))
+                    for row in tag.find_all("tr")]
+            text = "\n".join(row for row in rows if row)
+        else:
+            text = tag.get_text(" ", strip=True)
+        if not text:
+            continue
+        if tag.name[0] == "h" and tag.name[1:].isdigit():
+            blocks.append("#" * int(tag.name[1]) + " " + text)
+        elif tag.name == "li":
+            blocks.append("- " + text)
+        else:
+            blocks.append(text)
+    if not blocks:
+        return page_text(html)
+    return "\n\n".join(blocks)
+
+
+def page_links(url, html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    return [urldefrag(urljoin(url, a_tag["href"]))[0] for a_tag in soup.find_all("a", href=True)]
+
+
+class PageCache:
+    def __init__(self, cache_dir="./doc_page_cache"):
+        """Page bodies stored by url hash, with their ETag/Last-Modified in index.json"""
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def _body_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".html")
+
+    def get(self, url):
+        """(entry, html) for a cached url, entry holds etag, last_modified, content_hash, rendered"""
+        entry = self.index.get(url)
+        if entry is None or not os.path.exists(self._body_path(url)):
+            return None, None
+        with open(self._body_path(url), "r", encoding="utf-8") as f:
+            return entry, f.read()
+
+    def put(self, url, html, etag=None, last_modified=None, rendered=False):
+        with open(self._body_path(url), "w", encoding="utf-8") as f:
+            f.write(html)
+        self.index[url] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": hashlib.sha256(html.encode("utf-8")).hexdigest(),
+            "rendered": rendered,
+            "fetched": time.time(),
+        }
+
+    def save(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+
+class AsyncCrawler:
+    def __init__(self, start_url, max_depth=1, max_connections=8, cache_dir="./doc_page_cache",
+                 url_filter=None, js_fallback=None, min_text_chars=200, timeout=30):
+        """
+        Crawls pages of start_url's host breadth first up to max_depth links away, with
+        at most max_connections requests in flight. Cached pages are revalidated with
+        If-None-Match/If-Modified-Since, so a re-crawl only downloads changed pages.
+        url_filter(url) can exclude links. Pages with less than min_text_chars of text
+        are assumed to be rendered by JavaScript and go through js_fallback(url) -> html.
+        """
+        self.start_url = start_url
+        self.max_depth = max_depth
+        self.max_connections = max_connections
+        self.cache = PageCache(cache_dir)
+        self.url_filter = url_filter
+        self.js_fallback = js_fallback
+        self.min_text_chars = min_text_chars
+        self.timeout = timeout
+        self.stats = {}
+
+    def accept(self, url):
+        parsed = urlparse(url)
+        return (parsed.scheme in ("http", "https")
+                and parsed.netloc == urlparse(self.start_url).netloc
+                and not parsed.path.lower().endswith(SKIPPED_EXTENSIONS)
+                and (self.url_filter is None or self.url_filter(url)))
+
+    async def fetch(self, client, semaphore, url):
+        """Returns a page dict, or None when the url is not an HTML page"""
+        import httpx
+        entry, cached_html = self.cache.get(url)
+        headers = {}
+        if entry:
+            # Also for rendered pages: the validators describe the HTML the browser started from
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        async with semaphore:
+            try:
+                response = await client.get(url, headers=headers)
+            except httpx.HTTPError as e:
+                print(f"Failed to fetch {url}: {e}")
+                self.stats["failed"] += 1
+                return None
+
+        if response.status_code == 304 and cached_html is not None:
+            self.stats["not_modified"] += 1
+            return {"url": url, "html": cached_html, "status": "unchanged"}
+        if response.status_code != 200 or "html" not in response.headers.get("content-type", ""):
+            self.stats["skipped"] += 1
+            return None
+
+        html = response.text
+        rendered = False
+        if self.js_fallback is not None and len(page_text(html).strip()) < self.min_text_chars:
+            # Only one browser runs, calls are serialized by js_fallback itself
+            html = await asyncio.to_thread(self.js_fallback, url)
+            rendered = True
+            self.stats["rendered"] += 1
+        self.stats["downloaded"] += 1
+        status = "new" if entry is None else (
+            "unchanged" if entry["content_hash"] == hashlib.sha256(html.encode("utf-8")).hexdigest() else "changed"
+        )
+        self.cache.put(url, html, response.headers.get("etag"), response.headers.get("last-modified"), rendered)
+        return {"url": url, "html": html, "status": status}
+
+    async def crawl(self):
+        """Pages in BFS order as dicts with url, html, depth and status (new, changed or unchanged)"""
+        import httpx
+        self.stats = {"downloaded": 0, "not_modified": 0, "rendered": 0, "skipped": 0, "failed": 0}
+        semaphore = asyncio.Semaphore(self.max_connections)
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        seen = {self.start_url}
+        frontier = [self.start_url]
+        pages = []
+        start = time.perf_counter()
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout, follow_redirects=True) as client:
+            for depth in range(self.max_depth + 1):
+                results = await asyncio.gather(*(self.fetch(client, semaphore, url) for url in frontier))
+                frontier = []
+                for page in results:
+                    if page is None:
+                        continue
+                    page["depth"] = depth
+                    pages.append(page)
+                    if depth == self.max_depth:
+                        continue
+                    for link in page_links(page["url"], page["html"]):
+                        if link not in seen and self.accept(link):
+                            seen.add(link)
+                            frontier.append(link)
+                if not frontier:
+                    break
+        self.cache.save()
+        self.stats["pages"] = len(pages)
+        self.stats["seconds"] = time.perf_counter() - start
+        return pages
@@ -1,9 +1,16 @@
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 import os
+import re
+import time
 from load_dotenv import load_dotenv
+from llm_cache import LLMCache
+from token_budget import count_tokens
 load_dotenv()
 
+# Names of the snapshot column types in the prompt (see data_snapshot.py)
+SNAPSHOT_TYPES = {"float64": "float", "category": "categorical"}
+
 ADHOC_PROMPT = """You are a coder with expertise in making dash apps for financial data visualization using plotly dash library.
 You will be given these as inputs:
 1. User Query: User's query for the dashboard (may or may not be given, empty string if not given)
@@ -18,6 +25,16 @@ Your task is to generate the code for a dash app that visualizes the financial d
 Expected output:
 A code that can be executed as-is and will generate a dash app that visualizes the financial data based on the user query, the plot and dashboard layout recommendations. Do not output anything else other than the code. Also use localhost 8000 port for the app that you will code.
 
+Load the data with load_data from the data_snapshot module instead of pd.read_csv. It returns the data already cleaned and typed: amounts written with currency signs, thousands separators or percent signs are floats, date columns are datetimes and repetitive text columns are categoricals (the converted columns are listed after the recommendations). Do not clean or convert these columns again.
+
+Callbacks must stay fast on large data. Build a DataCube from the data_cube module once after loading the data, naming the date column and the category columns used for filtering and grouping, and answer callbacks from it instead of filtering and grouping the DataFrame:
+- cube.frame(start, end, {"Column": selected_values}) returns the rows in the date range with the selected values (empty or None selects all).
+- cube.totals(by, measures, start, end, filters) returns one row per value of by with the sums of the measures and a "count" column, like groupby(by).sum().
+- cube.counts(by, start, end, filters) returns the values of by and their "count", largest first, like value_counts().
+- cube.over_time(measures, start, end, by=None, freq="MS", filters=None) returns the sums per period ("MS" months, "QS" quarters, "YS" years, "W-MON" weeks) in a "period" column, per value of by if given.
+For a mean, divide a sum by "count".
+Many users pick the same filters, so memoize the callbacks too: create cache = CallbackCache(app) from the callback_cache module right after the app and put @cache.memoize() between @app.callback(...) and the callback function. Only memoize callbacks whose outputs depend on their input values alone.
+
 Example 1:
 User Query: "I want to analyze the stock price trends and compare volume traded across different companies."
 
@@ -38,13 +55,17 @@ Output:
 import dash
 from dash import dcc, html
 import plotly.express as px
-import pandas as pd
+from data_snapshot import load_data
+from data_cube import DataCube
+from callback_cache import CallbackCache
 
 # Load data
-df = pd.read_csv("./data/dummy_data.csv")
+df = load_data("./data/dummy_data.csv")
+cube = DataCube(df, date="Date", categories=["Company"])
 
 # Dash app
 app = dash.Dash(__name__)
+cache = CallbackCache(app)
 
 app.layout = html.Div([
     dcc.DatePickerRange(id="date-picker", start_date=df["Date"].min(), end_date=df["Date"].max()),
@@ -57,18 +78,17 @@ app.layout = html.Div([
     [dash.Output("stock-trend", "figure"), dash.Output("volume-comparison", "figure")],
     [dash.Input("date-picker", "start_date"), dash.Input("date-picker", "end_date"), dash.Input("company-dropdown", "value")]
 )
+@cache.memoize()
 def update_charts(start_date, end_date, selected_companies):
-    filtered_df = df[(df["Date"] >= start_date) & (df["Date"] <= end_date)]
-    if selected_companies:
-        filtered_df = filtered_df[filtered_df["Company"].isin(selected_companies)]
+    filters = {"Company": selected_companies}
 
-    fig1 = px.line(filtered_df, x="Date", y="Stock Price", color="Company", title="Stock Price Trend")
-    fig2 = px.bar(filtered_df, x="Company", y="Volume", title="Volume Comparison")
+    fig1 = px.line(cube.frame(start_date, end_date, filters), x="Date", y="Stock Price", color="Company", title="Stock Price Trend")
+    fig2 = px.bar(cube.totals("Company", "Volume", start_date, end_date, filters), x="Company", y="Volume", title="Volume Comparison")
 
     return fig1, fig2
 
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    app.run_server(debug=True, port=8000)
 ```
 
 Example 2:
@@ -90,14 +110,20 @@ Output:
 ```python
 import dash
 from dash import dcc, html
-import plotly.express as px
 import pandas as pd
+import plotly.express as px
+from data_snapshot import load_data
+from data_cube import DataCube
+from callback_cache import CallbackCache
 
 # Load data
-df = pd.read_csv("./data/dummy_data.csv")
+df = load_data("./data/dummy_data.csv")
+cube = DataCube(df, date="Date", categories=["Crypto"])
+last_date = df["Date"].max()
 
 # Dash app
 app = dash.Dash(__name__)
+cache = CallbackCache(app)
 
 app.layout = html.Div([
     dcc.Dropdown(id="crypto-dropdown", options=[{"label": c, "value": c} for c in df["Crypto"].unique()], multi=True),
@@ -110,10 +136,11 @@ app.layout = html.Div([
     [dash.Output("pct-change-line", "figure"), dash.Output("volatility-scatter", "figure")],
     [dash.Input("crypto-dropdown", "value"), dash.Input("time-window", "value")]
 )
+@cache.memoize()
 def update_charts(selected_cryptos, time_window):
-    filtered_df = df.tail(time_window)
-    if selected_cryptos:
-        filtered_df = filtered_df[filtered_df["Crypto"].isin(selected_cryptos)]
+    # The last time_window days of data
+    start_date = last_date - pd.Timedelta(days=time_window - 1)
+    filtered_df = cube.frame(start_date, last_date, {"Crypto": selected_cryptos})
 
     fig1 = px.line(filtered_df, x="Date", y="Pct Change", color="Crypto", title="Daily % Change in Crypto Prices")
     fig2 = px.scatter(filtered_df, x="Crypto", y="Volatility", title="Crypto Volatility Comparison")
@@ -121,7 +148,7 @@ def update_charts(selected_cryptos, time_window):
     return fig1, fig2
 
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    app.run_server(debug=True, port=8000)
 ```
 
 
@@ -272,30 +299,177 @@ if __name__ == "__main__":
 
 """
 
-class DashCoder:
+# With documentation retrieval the worked examples are left out of the system prompts,
+# the retrieved excerpts of the recommended components take their place
+DOC_RAG_NOTE = """Excerpts of the Dash documentation for the recommended components are given after the recommendations. Follow the component APIs shown there.
+"""
+ADHOC_RAG_PROMPT = ADHOC_PROMPT[:ADHOC_PROMPT.index("Example 1:")] + DOC_RAG_NOTE
+ADHOC_DOC_RAG_PROMPT = ADHOC_DOC_PROMPT[:ADHOC_DOC_PROMPT.index("Example 1:")] + DOC_RAG_NOTE
+
+# Phrases in layout recommendations and the Dash component they refer to
+DASH_COMPONENTS = [
+    (r"date ?range ?picker|datepickerrange|date picker range", "dcc.DatePickerRange"),
+    (r"date ?picker(?!\s?range)|datepickersingle", "dcc.DatePickerSingle"),
+    (r"range ?slider", "dcc.RangeSlider"),
+    (r"(?<!range )(?<!range)slider", "dcc.Slider"),
+    (r"drop-?down", "dcc.Dropdown"),
+    (r"data ?table|\btables?\b", "dash_table.DataTable"),
+    (r"\bgraphs?\b|\bcharts?\b|\bplots?\b", "dcc.Graph"),
+    (r"\btabs?\b", "dcc.Tabs"),
+    (r"check ?list|checkbox", "dcc.Checklist"),
+    (r"radio", "dcc.RadioItems"),
+    (r"text input|input (?:field|box)", "dcc.Input"),
+    (r"\bstore\b", "dcc.Store"),
+    (r"\binterval\b|auto-?refresh", "dcc.Interval"),
+    (r"loading|spinner", "dcc.Loading"),
+    (r"markdown", "dcc.Markdown"),
+    (r"\bbuttons?\b", "html.Button"),
+    (r"download|export", "dcc.Download"),
+]
+
+
+def find_components(text):
+    """Dash components named or described in text, in order of first mention"""
+    found = {}
+    for match in re.finditer(r"\b(?:dcc|html|dash_table|dbc)\.[A-Z]\w+", text):
+        found.setdefault(match.group(0), match.start())
+    lowered = text.lower()
+    for pattern, component in DASH_COMPONENTS:
+        match = re.search(pattern, lowered)
+        if match:
+            found[component] = min(found.get(component, match.start()), match.start())
+    return sorted(found, key=found.get)
+
+
+def strip_code_fences(content):
+    return content.strip().removeprefix("```python").removeprefix("```").removesuffix("```").strip()
+
+
+class FenceStripper:
+    """Strip a leading ```python fence and a trailing ``` fence from streamed text"""
+    TAIL = re.compile(r"\s*`{0,3}\s*$")
+
     def __init__(self):
+        self.started = False
+        self.pending = ""
+
+    def feed(self, chunk):
+        self.pending += chunk
+        if not self.started:
+            head = self.pending.lstrip()
+            # Wait until we can tell whether the reply opens with a fence
+            if not head or (head.startswith("`") and "\n" not in head):
+                return ""
+            self.pending = head.removeprefix("```python").removeprefix("```").lstrip()
+            self.started = True
+
+        # Hold back trailing whitespace and backticks, they may be the closing fence
+        cut = self.TAIL.search(self.pending).start()
+        text, self.pending = self.pending[:cut], self.pending[cut:]
+        return text
+
+    def finish(self):
+        if not self.started:
+            self.pending = self.pending.strip().removeprefix("```python").removeprefix("```")
+        text = self.pending.strip().removesuffix("```").rstrip()
+        self.pending = ""
+        return text
+
+
+class DashCoder:
+    def __init__(self, llm_cache: LLMCache = None, llm: ChatOpenAI = None, doc_indexer=None,
+                 doc_token_budget=600, docs_per_component=1):
+        """
+        With a doc_indexer (a loaded VectorIndexer) the prompts leave out the worked
+        examples and include documentation excerpts for the components named in the
+        layout recommendations instead, at most doc_token_budget tokens of them (the
+        examples alone are about 900 tokens).
+        """
         self.mode = None
-        self.llm = ChatOpenAI(
+        self.doc_indexer = doc_indexer
+        self.doc_token_budget = doc_token_budget
+        self.docs_per_component = docs_per_component
+        self.llm = llm or ChatOpenAI(
             model="gpt-4o",
             api_key=os.getenv("OPENAI_API_KEY"),
             temperature=0.3,
         )
+        self.llm_cache = llm_cache
 
-    def init_prompts(self, mode, file_path):
+    def select_system_prompt(self, mode, file_path):
+        rag = self.doc_indexer is not None
         if file_path.endswith(".csv"):
             if mode == "adhoc-gen":
-                self.system_prompt = ADHOC_PROMPT
+                return ADHOC_RAG_PROMPT if rag else ADHOC_PROMPT
             elif mode == "adhoc-edit":
-                self.system_prompt = ADHOC_EDITING_PROMPT
+                return ADHOC_EDITING_PROMPT
         elif file_path.endswith(".pdf"):
             if mode == "adhoc-gen":
-                self.system_prompt = ADHOC_DOC_PROMPT
+                return ADHOC_DOC_RAG_PROMPT if rag else ADHOC_DOC_PROMPT
             # elif mode == "adhoc-edit":
-            #     self.system_prompt = ADHOC_EDIT_DOC_PROMPT
-
-    def invoke(self, query, data_path, plot_recommendations, dash_recommendations, mode, old_code=""): 
-        self.init_prompts(mode, data_path)
-        print(mode)
+            #     return ADHOC_EDIT_DOC_PROMPT
+        raise ValueError(f"No system prompt for mode {mode} and file {file_path}")
+
+    def generate(self, messages, query=None):
+        """Call the LLM (or the LLM cache) and strip the code fences from the reply"""
+        if self.llm_cache is not None:
+            content = self.llm_cache.invoke("dash_code", self.llm, messages, query=query)
+        else:
+            content = self.llm.invoke(messages).content
+        return strip_code_fences(content)
+
+    async def agenerate(self, messages, query=None):
+        if self.llm_cache is not None:
+            content = await self.llm_cache.ainvoke("dash_code", self.llm, messages, query=query)
+        else:
+            content = (await self.llm.ainvoke(messages)).content
+        return strip_code_fences(content)
+
+    def retrieve_docs(self, dash_recommendations):
+        """
+        Documentation excerpts for the recommended components. Every component gets its
+        best excerpt before any gets a second one, until doc_token_budget is used up.
+        """
+        components = find_components(dash_recommendations)
+        results = {
+            component: self.doc_indexer.search(f"{component} component properties and usage example",
+                                               k=self.docs_per_component)
+            for component in components
+        }
+        sections = []
+        seen = set()
+        budget = self.doc_token_budget
+        for rank in range(self.docs_per_component):
+            for component in components:
+                if rank >= len(results[component]):
+                    continue
+                doc = results[component][rank]
+                if doc.page_content in seen:
+                    continue
+                section = f"### {component} ({doc.metadata.get('source', '')})\n{doc.page_content}"
+                tokens = count_tokens(section)
+                if tokens > budget:
+                    continue
+                seen.add(doc.page_content)
+                sections.append(section)
+                budget -= tokens
+        return "\n\n".join(sections)
+
+    @staticmethod
+    def snapshot_columns(data_path):
+        """
+        The columns load_data converts and their new types, one per line, from the
+        snapshot written while the data was explored (none with data_snapshots=False)
+        """
+        if not os.path.exists(data_path):
+            return ""
+        from data_snapshot import snapshot_changes
+        changes = snapshot_changes(data_path) or {}
+        return "\n".join(f"- {column}: {SNAPSHOT_TYPES.get(after, after)}" for column, (_, after) in changes.items())
+
+    def build_messages(self, query, data_path, plot_recommendations, dash_recommendations, mode, old_code=""):
+        """The messages for one generation and their token counts"""
+        system_prompt = self.select_system_prompt(mode, data_path)
         if data_path.endswith(".csv"):
             user_prompt = f"User: {query}\n\n" + \
                 "Data Path:\n" + \
@@ -306,17 +480,9 @@ class DashCoder:
                 "\n\n" + \
                 "Dash Recommendations:\n" + \
                 dash_recommendations
-            if mode == "adhoc-edit":
-                user_prompt += f"\n\nOld Dash Code:\n{old_code}"
-            
-            messages = [
-                SystemMessage(self.system_prompt),
-                HumanMessage(user_prompt)
-            ]
-
-            result = self.llm.invoke(messages)
-            code = result.content.strip().removeprefix("```python").removeprefix("```").removesuffix("```").strip()
-            return code
+            converted = self.snapshot_columns(data_path)
+            if converted:
+                user_prompt += f"\n\nColumns converted by load_data:\n{converted}"
         elif data_path.endswith(".pdf"):
             user_prompt = f"User: {query}\n\n" + \
                 "Plot Recommendations:\n" + \
@@ -324,20 +490,119 @@ class DashCoder:
                 "\n\n" + \
                 "Dash Recommendations:\n" + \
                 dash_recommendations
-            if mode == "adhoc-edit":
-                user_prompt += f"\n\nOld Dash Code:\n{old_code}"
-            
-            messages = [
-                SystemMessage(self.system_prompt),
-                HumanMessage(user_prompt)
-            ]
-
-            result = self.llm.invoke(messages)
-            code = result.content.strip().removeprefix("```python").removeprefix("```").removesuffix("```").strip()
-            return code
-    
+        doc_tokens = 0
+        if self.doc_indexer is not None:
+            docs = self.retrieve_docs(dash_recommendations)
+            if docs:
+                doc_tokens = count_tokens(docs)
+                user_prompt += f"\n\nDash Documentation:\n{docs}"
+        if mode == "adhoc-edit":
+            user_prompt += f"\n\nOld Dash Code:\n{old_code}"
+
+        system_tokens, user_tokens = count_tokens(system_prompt), count_tokens(user_prompt)
+        prompt_stats = {
+            "system_tokens": system_tokens,
+            "user_tokens": user_tokens,
+            "doc_tokens": doc_tokens,
+            "prompt_tokens": system_tokens + user_tokens
+        }
+        print(f"Prompt tokens: {system_tokens + user_tokens} (system {system_tokens}, documentation {doc_tokens})")
+
+        return [
+            SystemMessage(system_prompt),
+            HumanMessage(user_prompt)
+        ], prompt_stats
+
+    def invoke(self, query, data_path, plot_recommendations, dash_recommendations, mode, old_code=""): 
+        messages, _ = self.build_messages(query, data_path, plot_recommendations, dash_recommendations, mode, old_code)
+        return self.generate(messages, query)
+
+    async def ainvoke(self, query, data_path, plot_recommendations, dash_recommendations, mode, old_code=""):
+        messages, _ = self.build_messages(query, data_path, plot_recommendations, dash_recommendations, mode, old_code)
+        return await self.agenerate(messages, query)
+
+    def stream(self, query, data_path, plot_recommendations, dash_recommendations, mode, old_code="", output_path=None):
+        """
+        A CodeStream of the app source: iterating it yields the code as it is generated,
+        with the code fences stripped on the fly. If output_path is given the code is
+        also written there progressively.
+        """
+        messages, prompt_stats = self.build_messages(query, data_path, plot_recommendations, dash_recommendations,
+                                                     mode, old_code)
+        return CodeStream(self, messages, query, output_path, prompt_stats)
+
+
+class CodeStream:
+    def __init__(self, coder, messages, query=None, output_path=None, prompt_stats=None):
+        """
+        One streamed generation of DashCoder. Once it has been iterated, code holds the
+        final code and stats the timing of the generation.
+        """
+        self.coder = coder
+        self.messages = messages
+        self.query = query
+        self.output_path = output_path
+        self.prompt_stats = prompt_stats
+        self.code = None
+        self.stats = None
+
+    def __iter__(self):
+        llm, llm_cache, query, output_path = self.coder.llm, self.coder.llm_cache, self.query, self.output_path
+        system_prompt, user_prompt = LLMCache.split_messages(self.messages)
+        model, temperature = llm.model_name, llm.temperature
+
+        cached = None
+        if llm_cache is not None:
+            cached = llm_cache.lookup("dash_code", model, temperature, system_prompt, user_prompt, query)
+        chunks = [cached] if cached is not None else (chunk.content for chunk in llm.stream(self.messages))
+
+        stripper = FenceStripper()
+        content = ""
+        tokens = 0
+        first_token_time = None
+        start = time.perf_counter()
+        out = open(output_path, "w", encoding="utf-8") if output_path else None
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start
+                tokens += 1
+                content += chunk
+                text = stripper.feed(chunk)
+                if text:
+                    if out:
+                        out.write(text)
+                        out.flush()
+                    yield text
+            text = stripper.finish()
+            if text:
+                if out:
+                    out.write(text)
+                yield text
+        finally:
+            if out:
+                out.close()
+
+        total_time = time.perf_counter() - start
+        self.code = strip_code_fences(content)
+        if output_path:
+            # The streamed file can differ in surrounding whitespace, write the canonical code
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(self.code)
+        if cached is None and llm_cache is not None:
+            llm_cache.update("dash_code", model, temperature, system_prompt, user_prompt, content, query)
+
+        generation_time = total_time - (first_token_time or 0)
+        self.stats = {
+            "cached": cached is not None,
+            "time_to_first_token": first_token_time,
+            "tokens": tokens,
+            "tokens_per_sec": tokens / generation_time if generation_time > 0 else None,
+            "total_time": total_time
+        }
 
-    
 
 # write a main guard
 if __name__ == "__main__":
@@ -2,13 +2,19 @@ from langgraph.graph import StateGraph
 from langgraph.graph import END
 from typing import Annotated, Dict, TypedDict
 from pydantic import BaseModel
-from data_agent import DataAnalyser
-from dash_agent import DashCoder
 from user_input import UserInput
+from llm_cache import LLMCache
+from app_registry import AppRegistry
 import os
-import psutil
-import subprocess
-import sys
+import re
+import time
+import uuid
+import asyncio
+import codeop
+
+GENERATED_APP_PATH = "./scripts/generated_dash_app.py"
+# Runs that deploy their app stream its code here, one file per run
+DRAFTS_DIR = "./scripts/drafts"
 
 class DashFlowState(BaseModel):
     mode: str = ""
@@ -18,65 +24,236 @@ class DashFlowState(BaseModel):
     dashboard_design: str = ""
     dash_code: str = ""
     url: str = ""
+    app_id: str = ""
+    run_id: str = ""
+    output_path: str = ""
+    # Set when the generated code does not compile, the app is then not deployed
+    syntax_error: str = ""
+
 
+class IncrementalSyntaxChecker:
+    """Check streamed source for syntax errors as soon as each top-level statement is complete"""
+    # A line at column 0 that starts a new statement, rather than closing or continuing one
+    STATEMENT_START = re.compile(r"^(?![\s#)\]}]|else\b|elif\b|except\b|finally\b)", re.M)
+
+    def __init__(self):
+        self.source = ""
+        self.checked_upto = 0
+        self.error = None
 
-def kill_existing_process(port=8000):
-    """Kill any process running on the given port."""
-    for proc in psutil.process_iter(['pid', 'name']):  
+    def feed(self, text):
+        """Returns True the first time a syntax error is found"""
+        self.source += text
+        if self.error is not None or "\n" not in text:
+            return False
+        complete = self.source[:self.source.rindex("\n") + 1]
+        boundary = None
+        for match in self.STATEMENT_START.finditer(complete, self.checked_upto + 1):
+            if match.start() < len(complete):
+                boundary = match.start()
+        if boundary is None:
+            return False
         try:
-            for conn in proc.connections(kind='inet'):
-                if conn.laddr.port == port:
-                    proc.terminate()
-                    print(f"Killed process {proc.name()} (PID: {proc.pid}) running on port {port}")
-        except (psutil.AccessDenied, psutil.NoSuchProcess):
-            pass  
-
-def execute_code(generated_code):
-    """Write and run the generated Dash code in a new terminal."""
-    script_filename = "./scripts/generated_dash_app.py"
-    os.makedirs("./scripts", exist_ok=True)
-    
-    with open(script_filename, "w", encoding='utf-8') as f:
-        f.write(generated_code)
+            # Returns None while the prefix is still incomplete, e.g. inside a triple-quoted string
+            if codeop.compile_command(complete[:boundary], "<generated>", "exec") is not None:
+                self.checked_upto = boundary
+        except (SyntaxError, OverflowError, ValueError) as e:
+            self.error = e
+            return True
+        return False
+
+    def finish(self):
+        """Check the complete source once the stream ended, including its last statement; returns the error or None"""
+        if self.error is None:
+            try:
+                compile(self.source, "<generated>", "exec")
+            except (SyntaxError, OverflowError, ValueError) as e:
+                self.error = e
+        return self.error
+
 
-    kill_existing_process(8000)  
+def describe_syntax_error(error):
+    return f"line {getattr(error, 'lineno', None)}: {getattr(error, 'msg', None) or error}"
 
-    if sys.platform == "win32":
-        cmd = f'start cmd /k "poetry run python {script_filename}"'
-    elif sys.platform == "darwin": 
-        cmd = f'osascript -e \'tell application "Terminal" to do script "poetry run python {script_filename}"\''
-    else: 
-        cmd = f'gnome-terminal -- bash -c "poetry run python {script_filename}; exec bash"'
 
-    subprocess.Popen(cmd, shell=True)  
+def check_syntax(code):
+    """Description of the syntax error in code, "" when it compiles"""
+    try:
+        compile(code, "<generated>", "exec")
+    except (SyntaxError, OverflowError, ValueError) as e:
+        return describe_syntax_error(e)
+    return ""
 
-    return "http://localhost:8000"
 
-    
+def save_code(generated_code, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding='utf-8') as f:
+        f.write(generated_code)
+
+
+def execute_code(generated_code, registry, app_id=None):
+    """
+    Host the generated Dash code in registry next to the other apps (see app_registry.py),
+    replacing the app app_id if given. Returns the app id and its URL once the app answers.
+    """
+    process = registry.deploy(generated_code, app_id)
+    return process.name, process.url
+
 
 class DashWorkflow:
-    def __init__(self):
-        self.data_analyser = DataAnalyser()
-        self.dash_maker = DashCoder()
-        self.user_input = UserInput()
+    def __init__(self, semantic_llm_cache=False, stream_generation=True, deploy=True,
+                 user_input=None, llm_cache=None, data_analyser=None, dash_maker=None,
+                 documentation_rag=False, doc_indexer=None, data_snapshots=True,
+                 deploy_backend="gunicorn", workers=None, threads=2, app_registry=None):
+        """
+        Components can be passed in to share them between workflows (see batch.py).
+        With deploy=False the generated app is only written to state.output_path.
+        With documentation_rag the code generation prompts get excerpts of the indexed
+        Dash documentation (see index.py) instead of the worked examples.
+        With data_snapshots the cleaned, typed snapshot the generated app loads
+        (see data_snapshot.py) is written while the data is explored.
+        deploy_backend, workers and threads choose how the apps are served (see app_server.py),
+        app_registry hosts them next to each other (see app_registry.py).
+        """
+        # UserInput loads its embedding models on first use, so it is cheap to build here
+        self.user_input = user_input or UserInput()
+        if llm_cache is None:
+            # Near-duplicate lookups reuse the MiniLM embeddings of the PDF index
+            llm_cache = LLMCache(embeddings=self.user_input if semantic_llm_cache else None)
+        self.llm_cache = llm_cache
+        # The agents (and the LLM client imports) are created on first use
+        self._data_analyser = data_analyser
+        self._dash_maker = dash_maker
+        self.documentation_rag = documentation_rag
+        self._doc_indexer = doc_indexer
+        self.stream_generation = stream_generation
+        self.deploy = deploy
+        if app_registry is None and deploy:
+            app_registry = AppRegistry(backend=deploy_backend, workers=workers, threads=threads)
+        self.app_registry = app_registry
+        self.data_snapshots = data_snapshots
+        # Per-run node timings and background tasks, keyed by DashFlowState.run_id
+        self.timings = {}
+        self.background_tasks = {}
+        self.last_timings = {}
         self.workflow = self.create_graph()
         self.app = self.workflow.compile()
+        self.async_app = self.create_graph(asynchronous=True).compile()
+
+    @property
+    def data_analyser(self):
+        if self._data_analyser is None:
+            from data_agent import DataAnalyser
+            self._data_analyser = DataAnalyser(llm_cache=self.llm_cache)
+        return self._data_analyser
+
+    @property
+    def dash_maker(self):
+        if self._dash_maker is None:
+            from dash_agent import DashCoder
+            self._dash_maker = DashCoder(llm_cache=self.llm_cache, doc_indexer=self.doc_indexer)
+        return self._dash_maker
+
+    @property
+    def doc_indexer(self):
+        if self._doc_indexer is None and self.documentation_rag:
+            from index import VectorIndexer
+            self._doc_indexer = VectorIndexer()
+            self._doc_indexer.load_index()
+        return self._doc_indexer
+
+    def build_snapshot(self, file_path):
+        # pandas is only imported once there is a CSV to snapshot
+        from data_snapshot import build_snapshot
+        return build_snapshot(file_path)
+
+    def create_graph(self, asynchronous=False):
+        if asynchronous:
+            nodes = {
+                "file_processing": self.afile_processing,
+                "data_exploration": self.adata_exploration,
+                "dash_app_generation": self.adash_app_generation,
+                "deployment": self.adeployment,
+            }
+        else:
+            nodes = {
+                "file_processing": self.file_processing,
+                "data_exploration": self.data_exploration,
+                "dash_app_generation": self.dash_app_generation,
+                "deployment": self.deployment,
+            }
+        workflow = StateGraph(DashFlowState)
+        for name, node in nodes.items():
+            workflow.add_node(name, self.timed(name, node))
+        workflow.add_edge("file_processing", "data_exploration")
+        workflow.add_edge("data_exploration", "dash_app_generation")
+        workflow.add_edge("dash_app_generation", "deployment")
+        workflow.add_edge("deployment", END)
+        workflow.set_entry_point("file_processing")
+        return workflow
+
+    def record_timing(self, run_id, name, seconds):
+        self.timings.setdefault(run_id, {})[name] = seconds
+
+    def timed(self, name, node):
+        """Wrap a graph node so its wall-clock time is recorded for the run"""
+        if asyncio.iscoroutinefunction(node):
+            async def timed_node(state):
+                start = time.perf_counter()
+                result = await node(state)
+                self.record_timing(state.run_id, name, time.perf_counter() - start)
+                return result
+        else:
+            def timed_node(state):
+                start = time.perf_counter()
+                result = node(state)
+                self.record_timing(state.run_id, name, time.perf_counter() - start)
+                return result
+        return timed_node
+
+    async def run_in_background(self, run_id, name, func, *args):
+        """Run blocking work in a thread and record how long it took"""
+        start = time.perf_counter()
+        result = await asyncio.to_thread(func, *args)
+        self.record_timing(run_id, name, time.perf_counter() - start)
+        return result
+
+    def print_timings(self, timings):
+        print("Timing breakdown:")
+        for name, seconds in timings.items():
+            print(f"  {name:<32} {seconds:8.2f}s")
+
+    def load_dashboard(self, state):
+        """
+        For edits, the code of the dashboard being edited: its registry script when app_id
+        is given, otherwise output_path (GENERATED_APP_PATH when not deploying)
+        """
+        if state.mode != "adhoc-edit" or state.dash_code:
+            return
+        if state.app_id and self.app_registry is not None:
+            path = self.app_registry.script_path(state.app_id)
+            if not os.path.exists(path):
+                raise ValueError(f"No dashboard {state.app_id} to edit")
+        elif state.output_path or not self.deploy:
+            path = state.output_path or GENERATED_APP_PATH
+            if not os.path.exists(path):
+                return
+        else:
+            # Deployed apps live in the registry, GENERATED_APP_PATH is not the app being edited
+            raise ValueError("Give the app_id of the dashboard to edit")
+        with open(path, "r", encoding="utf-8") as f:
+            state.dash_code = f.read()
 
-    def create_graph(self):
-        self.workflow =  StateGraph(DashFlowState)
-        self.workflow.add_node("file_processing", self.file_processing)
-        self.workflow.add_node("data_exploration", self.data_exploration)
-        self.workflow.add_node("dash_app_generation", self.dash_app_generation)
-        self.workflow.add_node("deployment", self.deployment)
-        self.workflow.add_edge("file_processing", "data_exploration")
-        self.workflow.add_edge("data_exploration", "dash_app_generation")
-        self.workflow.add_edge("dash_app_generation", "deployment")
-        self.workflow.add_edge("deployment", END)
-        self.workflow.set_entry_point("file_processing")
-        return self.workflow
+    def draft_path(self, state):
+        """Where the code is streamed to while it is generated"""
+        if state.output_path or not self.deploy:
+            return state.output_path or GENERATED_APP_PATH
+        # The app's script is written when it is deployed, concurrent runs must not share a file
+        return os.path.join(DRAFTS_DIR, f"{state.run_id}.py")
 
     def file_processing(self, state):
         print("Processing file...")
+        self.load_dashboard(state)
         if state.file_path.endswith(".pdf") and state.mode == "adhoc-gen":
             self.user_input.process_files(state.file_path)
         return state
@@ -87,6 +264,8 @@ class DashWorkflow:
         if state.file_path.endswith(".pdf") and state.mode == "adhoc-gen":
             results = self.data_analyser.invoke(state.file_path, mode=state.mode, user_query=state.query, user_input=self.user_input)
         elif state.file_path.endswith("csv"):
+            if self.data_snapshots:
+                self.build_snapshot(state.file_path)
             results = self.data_analyser.invoke(state.file_path, mode=state.mode, user_query=state.query)
         state.visualization_suggestions = results["visualization_suggestions"]
         state.dashboard_design = results["dashboard_design"]
@@ -94,22 +273,153 @@ class DashWorkflow:
 
     def dash_app_generation(self, state):
         print("Generating dash app...")
-        if state.mode == "adhoc-gen":
+        if self.stream_generation:
+            code = self.stream_dash_app(state)
+        elif state.mode == "adhoc-gen":
             code = self.dash_maker.invoke(state.query, state.file_path, state.visualization_suggestions, state.dashboard_design, mode=state.mode)
         elif state.mode == "adhoc-edit":
             code = self.dash_maker.invoke(state.query, state.file_path, state.visualization_suggestions, state.dashboard_design, mode=state.mode, old_code=state.dash_code)
+        if not self.stream_generation:
+            state.syntax_error = check_syntax(code)
         state.dash_code = code
         return state
 
+    def stream_dash_app(self, state):
+        """Stream the generated code to disk, validating syntax while it is generated"""
+        output_path = self.draft_path(state)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        old_code = state.dash_code if state.mode == "adhoc-edit" else ""
+        checker = IncrementalSyntaxChecker()
+        generation = self.dash_maker.stream(state.query, state.file_path, state.visualization_suggestions,
+                                            state.dashboard_design, mode=state.mode, old_code=old_code,
+                                            output_path=output_path)
+        for text in generation:
+            if checker.feed(text):
+                print(f"Syntax error in generated code ({describe_syntax_error(checker.error)})")
+        # The last statement (e.g. the __main__ block) is only complete once the stream ended
+        if checker.error is None and checker.finish() is not None:
+            print(f"Syntax error in generated code ({describe_syntax_error(checker.error)})")
+        state.syntax_error = describe_syntax_error(checker.error) if checker.error is not None else ""
+
+        stats = generation.stats
+        if stats["cached"]:
+            print("Dash app served from the LLM cache")
+        else:
+            print(f"Time to first token: {stats['time_to_first_token']:.2f}s, "
+                  f"{stats['tokens']} tokens at {stats['tokens_per_sec'] or 0:.1f} tokens/sec")
+        return generation.code
+
     def deployment(self, state):
+        if not self.deploy:
+            save_code(state.dash_code, state.output_path or GENERATED_APP_PATH)
+            return state
+        if self.skip_broken_deploy(state):
+            return state
+        print("Deploying dash app...")
+        state.app_id, state.url = execute_code(state.dash_code, self.app_registry, state.app_id or None)
+        self.remove_draft(state)
+        return state
+
+    def skip_broken_deploy(self, state):
+        """Code that does not compile is not deployed, it is left in the draft for inspection"""
+        if not state.syntax_error:
+            return False
+        path = self.draft_path(state)
+        save_code(state.dash_code, path)
+        print(f"Not deploying the dash app, its code has a syntax error ({state.syntax_error}), see {path}")
+        return True
+
+    def remove_draft(self, state):
+        path = os.path.join(DRAFTS_DIR, f"{state.run_id}.py")
+        if os.path.exists(path):
+            os.remove(path)
+
+    async def afile_processing(self, state):
+        print("Processing file...")
+        self.load_dashboard(state)
+        tasks = self.background_tasks.setdefault(state.run_id, {})
+        if state.file_path.endswith(".csv") and self.data_snapshots:
+            tasks["snapshot"] = asyncio.create_task(
+                self.run_in_background(state.run_id, "data snapshot (background)", self.build_snapshot, state.file_path))
+        if state.file_path.endswith(".csv") and state.mode == "adhoc-gen":
+            tasks["profile"] = asyncio.create_task(
+                self.run_in_background(state.run_id, "profiling (background)", self.data_analyser.profile, state.file_path))
+        elif state.file_path.endswith(".pdf") and state.mode == "adhoc-gen":
+            await self.run_in_background(state.run_id, "pdf_parsing", self.user_input.process_files, state.file_path)
+        return state
+
+    async def adata_exploration(self, state):
+        print("Exploring data...")
+        tasks = self.background_tasks.get(state.run_id, {})
+        if state.file_path.endswith(".pdf") and state.mode == "adhoc-gen":
+            results = await self.data_analyser.ainvoke(state.file_path, mode=state.mode, user_query=state.query, user_input=self.user_input)
+        elif state.file_path.endswith("csv"):
+            profile = await tasks.pop("profile") if "profile" in tasks else None
+            results = await self.data_analyser.ainvoke(state.file_path, mode=state.mode, user_query=state.query, profile=profile)
+        state.visualization_suggestions = results["visualization_suggestions"]
+        state.dashboard_design = results["dashboard_design"]
+        return state
+
+    async def adash_app_generation(self, state):
+        print("Generating dash app...")
+        tasks = self.background_tasks.get(state.run_id, {})
+        if "snapshot" in tasks:
+            # The prompt lists the column types of the snapshot
+            await tasks.pop("snapshot")
+        if self.stream_generation:
+            # The LLM stream is consumed by a thread, the event loop stays free for other runs
+            state.dash_code = await asyncio.to_thread(self.stream_dash_app, state)
+            return state
+        old_code = state.dash_code if state.mode == "adhoc-edit" else ""
+        state.dash_code = await self.dash_maker.ainvoke(state.query, state.file_path, state.visualization_suggestions, state.dashboard_design,
+                                                        mode=state.mode, old_code=old_code)
+        state.syntax_error = check_syntax(state.dash_code)
+        return state
+
+    async def adeployment(self, state):
+        if not self.deploy:
+            save_code(state.dash_code, state.output_path or GENERATED_APP_PATH)
+            return state
+        if self.skip_broken_deploy(state):
+            return state
         print("Deploying dash app...")
-        url = execute_code(state.dash_code)
-        state.url = url
+        state.app_id, state.url = await asyncio.to_thread(execute_code, state.dash_code, self.app_registry,
+                                                          state.app_id or None)
+        self.remove_draft(state)
         return state
 
-    def run(self, query, file_path, mode="adhoc-gen"):
-        config = {"query": query, "file_path": file_path, "mode": mode}
-        return self.app.invoke(config)
+    def run(self, query, file_path, mode="adhoc-gen", output_path="", app_id=""):
+        run_id = uuid.uuid4().hex
+        config = {"query": query, "file_path": file_path, "mode": mode, "run_id": run_id, "output_path": output_path,
+                  "app_id": app_id}
+        start = time.perf_counter()
+        result = self.app.invoke(config)
+        self.last_timings = self.timings.pop(run_id, {})
+        self.last_timings["total"] = time.perf_counter() - start
+        self.print_timings(self.last_timings)
+        return result
+
+    async def arun(self, query, file_path, mode="adhoc-gen", output_path="", app_id=""):
+        """
+        Async variant of run. Blocking work (PDF parsing, CSV profiling, the table
+        search, starting the app) runs in threads and the LLM calls use ainvoke (or
+        a streaming thread with stream_generation), so independent steps overlap.
+        Background steps are listed separately in the timing breakdown and overlap
+        the node times.
+        """
+        run_id = uuid.uuid4().hex
+        config = {"query": query, "file_path": file_path, "mode": mode, "run_id": run_id, "output_path": output_path,
+                  "app_id": app_id}
+        start = time.perf_counter()
+        try:
+            result = await self.async_app.ainvoke(config)
+        finally:
+            for task in self.background_tasks.pop(run_id, {}).values():
+                task.cancel()
+        self.last_timings = self.timings.pop(run_id, {})
+        self.last_timings["total"] = time.perf_counter() - start
+        self.print_timings(self.last_timings)
+        return result
 
 def main():
     workflow = DashWorkflow()
@@ -118,7 +428,9 @@ def main():
     2. Edit a dashboard
     3. Exit
     """
-    
+    # Every generated dashboard keeps running next to the others, editing replaces one of them
+    app_id = ""
+
     while True:
         print(info_for_user)
         mode = int(input("Enter what you want to do: "))
@@ -132,7 +444,10 @@ def main():
             if not file_path:
                 file_path = "data/form-10k-exp.pdf"
             result = workflow.run(query, file_path, mode)
-            print(f"Dashboard deployed at {result['url']}")
+            if result["syntax_error"]:
+                continue
+            app_id = result["app_id"]
+            print(f"Dashboard {app_id} deployed at {result['url']}")
             
         elif mode == 2:
             mode = "adhoc-edit"
@@ -142,8 +457,12 @@ def main():
             file_path = input("Enter file path: ")
             if not file_path:
                 file_path = "data/form-10k-exp.pdf"
-            result = workflow.run(query, file_path, mode)
-            print(f"Dashboard deployed at {result['url']}")
+            app_id = input(f"Enter dashboard id [{app_id}]: ") or app_id
+            result = workflow.run(query, file_path, mode, app_id=app_id)
+            if result["syntax_error"]:
+                continue
+            app_id = result["app_id"]
+            print(f"Dashboard {app_id} deployed at {result['url']}")
         elif mode == 3:
             break
         else:
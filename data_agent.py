@@ -1,13 +1,16 @@
-from json import load
 from langchain_openai import ChatOpenAI
 import os
 from dotenv import load_dotenv
-import pandas as pd
 from typing import Dict, List, Any
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+from langchain_core.messages import HumanMessage
 from user_input import UserInput
+from data_profiler import profile_csv, DataProfile
+from data_summary import build_summary
+from profile_cache import ProfileCache
+from llm_cache import LLMCache
 import subprocess
+import asyncio
 import json
 
 ADHOC_VIZ_PROMPT = PromptTemplate(
@@ -201,136 +204,118 @@ df = pd.read_csv('{file_path}')
             os.remove(script_filename)
 
 class DataAnalyser:
-    def __init__(self):
-        self.llm = ChatOpenAI(
+    def __init__(self, profile_memory_limit_mb=2048, use_profile_cache=True, llm_cache: LLMCache = None,
+                 llm: ChatOpenAI = None, profile_cache: ProfileCache = None, retrieval_token_budget=6000,
+                 summary_mode="auto", summary_token_budget=3000):
+        # An existing client (and its connection pool) can be shared between analysers
+        self.llm = llm or ChatOpenAI(
             model="gpt-4o",
             api_key=os.getenv("OPENAI_API_KEY"),
             temperature=0.2
         )
 
-        self.mode = None
+        # The last analysis of every file, which an adhoc-edit of that file starts from
+        self.sessions = {}
+        # CSVs that would not fit in this many MB are profiled in chunks
+        self.profile_memory_limit_mb = profile_memory_limit_mb
+        if profile_cache is None and use_profile_cache:
+            profile_cache = ProfileCache()
+        self.profile_cache = profile_cache
+        self.llm_cache = llm_cache
+        # Upper bound on the tokens of PDF table pages put into the visualization prompt
+        self.retrieval_token_budget = retrieval_token_budget
+        # "lossless", "compact" or "auto" (lossless when it fits in summary_token_budget)
+        self.summary_mode = summary_mode
+        self.summary_token_budget = summary_token_budget
         
         # Create chains using the new pipe syntax
         # self.visualization_chain = self.visualization_prompt | self.llm
         # self.dashboard_chain = self.dashboard_prompt | self.llm
 
-    def init_chains(self, file_path: str):
+    @staticmethod
+    def select_prompts(mode: str, file_path: str):
+        """The visualization and dashboard prompts for mode and the type of file_path"""
         if file_path.endswith(".csv"):
-            if self.mode == "adhoc-gen":
-                self.visualization_prompt = ADHOC_VIZ_PROMPT
-                self.dashboard_prompt = ADHOC_DASHBOARD_PROMPT
-            elif self.mode == "adhoc-edit":
-                self.visualization_prompt = ADHOC_EDIT_VIZPROMPT
-                self.dashboard_prompt = ADHOC_EDIT_DASHBOARD_PROMPT
+            if mode == "adhoc-gen":
+                return {"visualization": ADHOC_VIZ_PROMPT, "dashboard": ADHOC_DASHBOARD_PROMPT}
+            elif mode == "adhoc-edit":
+                return {"visualization": ADHOC_EDIT_VIZPROMPT, "dashboard": ADHOC_EDIT_DASHBOARD_PROMPT}
         elif file_path.endswith(".pdf"):
-            if self.mode == "adhoc-gen":
-                self.visualization_prompt = ADHOC_DOC_VIZ_PROMPT
-                self.dashboard_prompt = ADHOC_DOC_DASHBOARD_PROMPT
-            # elif self.mode == "adhoc-edit":
-            #     self.visualization_prompt = ADHOC_EDIT_DOC_VIZPROMPT
-            #     self.dashboard_prompt = ADHOC_EDIT_DOC_DASHBOARD_PROMPT
-
-        self.visualization_chain = self.visualization_prompt | self.llm
-        self.dashboard_chain = self.dashboard_prompt | self.llm
-
-    def analyze_data(self, file_path: str, user_query: str = "", user_input: UserInput = None) -> Dict[str, Any]:
+            if mode == "adhoc-gen":
+                return {"visualization": ADHOC_DOC_VIZ_PROMPT, "dashboard": ADHOC_DOC_DASHBOARD_PROMPT}
+            # elif mode == "adhoc-edit":
+            #     return {"visualization": ADHOC_EDIT_DOC_VIZPROMPT, "dashboard": ADHOC_EDIT_DOC_DASHBOARD_PROMPT}
+        raise ValueError(f"No analysis prompts for mode {mode} and file {file_path}")
+
+    def run_chain(self, prompt, stage: str, inputs: Dict[str, Any]) -> str:
+        """Run the visualization or dashboard prompt, answering from the LLM cache when possible"""
+        if self.llm_cache is not None:
+            return self.llm_cache.invoke(stage, self.llm, [HumanMessage(prompt.format(**inputs))],
+                                         query=inputs.get("user_query"))
+        result = (prompt | self.llm).invoke(inputs)
+        return result.content if hasattr(result, 'content') else str(result)
+
+    async def arun_chain(self, prompt, stage: str, inputs: Dict[str, Any]) -> str:
+        """Async counterpart of run_chain"""
+        if self.llm_cache is not None:
+            return await self.llm_cache.ainvoke(stage, self.llm, [HumanMessage(prompt.format(**inputs))],
+                                                query=inputs.get("user_query"))
+        result = await (prompt | self.llm).ainvoke(inputs)
+        return result.content if hasattr(result, 'content') else str(result)
+
+    def profile(self, file_path: str):
+        """Profile a CSV, reusing the cached profile if the file has not changed"""
+        variant = f"memory_limit_mb={self.profile_memory_limit_mb}"
+        if self.profile_cache is not None:
+            profile = self.profile_cache.get(file_path, variant)
+            if profile is not None:
+                return profile
+
+        profile = profile_csv(file_path, memory_limit_mb=self.profile_memory_limit_mb)
+        if self.profile_cache is not None:
+            self.profile_cache.put(file_path, profile, variant)
+        return profile
+
+    def analysis_steps(self, file_path: str, mode: str, user_query: str = "", user_input: UserInput = None,
+                       profile: DataProfile = None, retrieved_docs=None):
         """
-        Analyze dataframe using provided run_code function and suggest visualizations
+        Profile the data and suggest visualizations. This is a generator shared by
+        analyze_data and aanalyze_data: it yields (stage, inputs) for every LLM
+        call, is sent back the response and returns the results.
         """
-        if self.mode == "adhoc-gen":
+        if mode == "adhoc-gen":
             if file_path.endswith(".csv"):
-                # Get dataframe info
-                info_command = "print(df.info())"
-                df_info = run_code(info_command, file_path)
-                
-                # Get column names and types
-                columns_command = "print(df.columns.tolist())"
-                columns = run_code(columns_command, file_path)
-                dtypes_command = "print(df.dtypes.to_string())"
-                dtypes = run_code(dtypes_command, file_path)
-                
-                # Get data preview
-                preview_command = "print(df.head().to_string())"
-                preview = run_code(preview_command, file_path)
-                
-                # Get basic statistics
-                stats_command = "print(df.describe(include='all').to_string())"
-                stats = run_code(stats_command, file_path)
-                
-                # Analyze categorical columns
-                cat_analysis_command = """
-        cat_analysis = {}
-        for col in df.select_dtypes(include=['object', 'category']).columns:
-            unique_vals = df[col].value_counts().head(10).to_dict()
-            null_count = df[col].isnull().sum()
-            cat_analysis[col] = {
-                'unique_values': unique_vals,
-                'total_unique': df[col].nunique(),
-                'null_count': null_count
-            }
-        print(cat_analysis)
-                """
-                categorical_analysis = run_code(cat_analysis_command, file_path)
-                
-                # Analyze numerical columns
-                num_analysis_command = """
-        num_analysis = {}
-        for col in df.select_dtypes(include=['int64', 'float64']).columns:
-            stats = df[col].describe()
-            null_count = df[col].isnull().sum()
-            num_analysis[col] = {
-                'min': stats['min'],
-                'max': stats['max'],
-                'mean': stats['mean'],
-                'median': df[col].median(),
-                'null_count': null_count,
-                'skewness': df[col].skew()
-            }
-        print(num_analysis)
-                """
-                numerical_analysis = run_code(num_analysis_command, file_path)
-                
-                # Combine outputs
-                code_output = f"""
-                Data Info:
-                {df_info}
-                
-                Column Types:
-                {dtypes}
-                
-                Preview:
-                {preview}
-                
-                Statistics:
-                {stats}
-                
-                Categorical Columns Analysis:
-                {categorical_analysis}
-                
-                Numerical Columns Analysis:
-                {numerical_analysis}
-                """
+                # Load the CSV once (or stream it if it is too large) and compute every statistic in-process,
+                # unless an unchanged file was already profiled
+                if profile is None:
+                    profile = self.profile(file_path)
+                # The complete summary, or a token-budgeted one for wide tables (see data_summary.py)
+                code_output, columns = build_summary(profile, self.summary_mode, self.summary_token_budget)
+                categorical_analysis = profile.categorical_analysis()
+                numerical_analysis = profile.numerical_analysis()
 
-                self.data_info = code_output
-                self.columns = columns
-                
                 # Get visualization suggestions
-                viz_result = self.visualization_chain.invoke({
-                    "data_info": self.data_info,
-                    "columns": self.columns
-                })
-                self.viz_suggestions = viz_result.content if hasattr(viz_result, 'content') else str(viz_result)
+                viz_suggestions = yield "visualization", {
+                    "data_info": code_output,
+                    "columns": columns
+                }
                 
                 # Get dashboard suggestions
-                dashboard_result = self.dashboard_chain.invoke({
-                    "visualizations": self.viz_suggestions
-                })
-                self.dashboard_design = dashboard_result.content if hasattr(dashboard_result, 'content') else str(dashboard_result)
+                dashboard_design = yield "dashboard", {
+                    "visualizations": viz_suggestions
+                }
+
+                self.sessions[file_path] = {
+                    "data_info": code_output,
+                    "columns": columns,
+                    "viz_suggestions": viz_suggestions,
+                    "dashboard_design": dashboard_design
+                }
                 
                 return {
                     "data_summary": code_output,
-                    "visualization_suggestions": self.viz_suggestions,
-                    "dashboard_design": self.dashboard_design,
+                    "visualization_suggestions": viz_suggestions,
+                    "dashboard_design": dashboard_design,
                     "detailed_analysis": {
                         "categorical": categorical_analysis,
                         "numerical": numerical_analysis
@@ -338,67 +323,96 @@ class DataAnalyser:
                 }
 
             elif file_path.endswith(".pdf"):
-                retrieved_docs = user_input.search("  ", k=2, filter=True)
+                # Retrieve the tables of this file that matter for the user's query, within a token budget
+                if retrieved_docs is None:
+                    retrieved_docs = user_input.search_tables(user_query, file_path=file_path, token_budget=self.retrieval_token_budget)
                 docs = "\n\n\n".join([doc.page_content for doc in retrieved_docs])
                 
                 # Get visualization suggestions
-                viz_result = self.visualization_chain.invoke({
+                viz_suggestions = yield "visualization", {
                     "docs": docs
-                })
-                self.viz_suggestions = viz_result.content if hasattr(viz_result, 'content') else str(viz_result)
+                }
                 
                 # Get dashboard suggestions
-                dashboard_result = self.dashboard_chain.invoke({
-                    "visualizations": self.viz_suggestions
-                })
-                self.dashboard_design = dashboard_result.content if hasattr(dashboard_result, 'content') else str(dashboard_result)
+                dashboard_design = yield "dashboard", {
+                    "visualizations": viz_suggestions
+                }
 
                 output = {
                     "data_summary": docs,
-                    "visualization_suggestions": self.viz_suggestions,
-                    "dashboard_design": self.dashboard_design
+                    "visualization_suggestions": viz_suggestions,
+                    "dashboard_design": dashboard_design
                 }
 
-                with open(f"exp_analysis_doc_{self.mode}.jsonl", "a", encoding='utf-8') as f:
+                with open(f"exp_analysis_doc_{mode}.jsonl", "a", encoding='utf-8') as f:
                     json_str = json.dumps(output)
                     f.write(json_str + '\n')
                 
                 return output
 
-        elif self.mode == "adhoc-edit":
+        elif mode == "adhoc-edit":
+            session = self.sessions.get(file_path)
+            if session is None:
+                raise ValueError(f"No earlier analysis of {file_path} to edit, run adhoc-gen on it first")
             if file_path.endswith(".csv"):
                 print(f"User Query: {user_query}")
-                print(f"OLD VISUALIZATIONS: {self.viz_suggestions}")
-                print(f"Old Dashboard Design: {self.dashboard_design}")
-                viz_result = self.visualization_chain.invoke({
-                    "data_info": self.data_info,
-                "columns": self.columns,
-                "old_visualizations": self.viz_suggestions,
+                print(f"OLD VISUALIZATIONS: {session['viz_suggestions']}")
+                print(f"Old Dashboard Design: {session['dashboard_design']}")
+                viz_suggestions = yield "visualization", {
+                    "data_info": session["data_info"],
+                "columns": session["columns"],
+                "old_visualizations": session["viz_suggestions"],
                 "user_query": user_query
-            })
-            self.viz_suggestions = viz_result.content if hasattr(viz_result, 'content') else str(viz_result)
+            }
             
             # Get dashboard suggestions
-            dashboard_result = self.dashboard_chain.invoke({
-                "old_dashboard_layout_recommendation": self.dashboard_design,
+            dashboard_design = yield "dashboard", {
+                "old_dashboard_layout_recommendation": session["dashboard_design"],
                 "user_query": user_query,
-                "new_visualizations": self.viz_suggestions
-            })
-            self.dashboard_design = dashboard_result.content if hasattr(dashboard_result, 'content') else str(dashboard_result)
+                "new_visualizations": viz_suggestions
+            }
+
+            session.update(viz_suggestions=viz_suggestions, dashboard_design=dashboard_design)
             
             return {
-                "visualization_suggestions": self.viz_suggestions,
-                "dashboard_design": self.dashboard_design
+                "visualization_suggestions": viz_suggestions,
+                "dashboard_design": dashboard_design
             }
 
+    def analyze_data(self, file_path: str, mode: str = "adhoc-gen", user_query: str = "", user_input: UserInput = None) -> Dict[str, Any]:
+        prompts = self.select_prompts(mode, file_path)
+        steps = self.analysis_steps(file_path, mode, user_query, user_input)
+        response = None
+        try:
+            while True:
+                stage, inputs = steps.send(response)
+                response = self.run_chain(prompts[stage], stage, inputs)
+        except StopIteration as done:
+            return done.value
+
+    async def aanalyze_data(self, file_path: str, mode: str = "adhoc-gen", user_query: str = "", user_input: UserInput = None,
+                            profile: DataProfile = None) -> Dict[str, Any]:
+        prompts = self.select_prompts(mode, file_path)
+        # The blocking steps (profiling, the vector search) run in threads, off the event loop
+        retrieved_docs = None
+        if mode == "adhoc-gen" and file_path.endswith(".csv") and profile is None:
+            profile = await asyncio.to_thread(self.profile, file_path)
+        elif mode == "adhoc-gen" and file_path.endswith(".pdf"):
+            retrieved_docs = await asyncio.to_thread(user_input.search_tables, user_query, file_path=file_path,
+                                                     token_budget=self.retrieval_token_budget)
+        steps = self.analysis_steps(file_path, mode, user_query, user_input, profile, retrieved_docs)
+        response = None
+        try:
+            while True:
+                stage, inputs = steps.send(response)
+                response = await self.arun_chain(prompts[stage], stage, inputs)
+        except StopIteration as done:
+            return done.value
+
     def invoke(self, file_path: str, mode="adhoc-gen", user_query: str = "", user_input: UserInput = None) -> Dict[str, Any]:
         # print(f"user query: {user_query}")
-        self.mode = mode
-        self.user_input = user_input
-
-        self.init_chains(file_path)
         if file_path.endswith(".csv"):
-            results = self.analyze_data(file_path, user_query)
+            results = self.analyze_data(file_path, mode, user_query)
 
             with open(f"exp_analysis_{mode}.json", "w", encoding='utf-8') as f:
                 json.dump(results, f)
@@ -406,9 +420,24 @@ class DataAnalyser:
         
         # later for other file types
         elif file_path.endswith(".pdf"):
-            results = self.analyze_data(file_path, user_query, user_input)
+            results = self.analyze_data(file_path, mode, user_query, user_input)
+            return results
+
+    async def ainvoke(self, file_path: str, mode="adhoc-gen", user_query: str = "", user_input: UserInput = None, profile: DataProfile = None) -> Dict[str, Any]:
+        """
+        Async counterpart of invoke. A profile computed ahead of time (e.g. while
+        other pipeline work was running) can be passed in to skip profiling.
+        """
+        if file_path.endswith(".csv"):
+            results = await self.aanalyze_data(file_path, mode, user_query, profile=profile)
+
+            with open(f"exp_analysis_{mode}.json", "w", encoding='utf-8') as f:
+                json.dump(results, f)
             return results
 
+        elif file_path.endswith(".pdf"):
+            return await self.aanalyze_data(file_path, mode, user_query, user_input)
+
 if __name__ == "__main__":
     data_analyser = DataAnalyser()
     result = data_analyser.invoke("data/dummy_data.csv")
@@ -0,0 +1,264 @@
+# Pre-aggregated data for the callbacks of generated Dash apps
+#
+# Generated apps build a DataCube once at startup and answer date range filters,
+# per-category totals and monthly rollups from it, instead of filtering and grouping
+# the whole DataFrame on every interaction:
+#
+#     from data_cube import DataCube
+#     cube = DataCube(df, date="Date", categories=["Company"])
+#     cube.frame(start_date, end_date, {"Company": selected})    # rows in the range
+#     cube.totals("Company", "Volume", start_date, end_date)     # groupby(...).sum()
+#     cube.counts("Company", start_date, end_date)               # value_counts()
+#     cube.over_time("Volume", start_date, end_date, by="Company", freq="MS")
+#
+# Apps started by app_server.deploy_app get this directory on PYTHONPATH, saved
+# apps run elsewhere need it too.
+
+import numpy as np
+import pandas as pd
+
+MAX_CATEGORIES = 200
+
+
+class DataCube:
+    def __init__(self, df: pd.DataFrame, date=None, categories=None, measures=None, max_categories=MAX_CATEGORIES):
+        """
+        The rows are sorted by date once, so a date range is a slice found with
+        searchsorted, and every measure keeps its cumulative sums overall and per
+        value of each category column, so a sum over a range is two lookups.
+        categories defaults to the text columns with at most max_categories values,
+        measures to the numeric columns. Rows without a date count when no range is
+        given but never fall in one, like with df[(df[date] >= start) & (df[date] <= end)].
+        """
+        if date is not None:
+            if not pd.api.types.is_datetime64_any_dtype(df[date]):
+                df = df.assign(**{date: pd.to_datetime(df[date], errors="coerce")})
+            df = df.sort_values(date, kind="stable", na_position="last")
+        self.df = df.reset_index(drop=True)
+        self.date = date
+
+        if categories is None:
+            text_columns = self.df.select_dtypes(include=["object", "category"]).columns
+            categories = [column for column in text_columns if self.df[column].nunique() <= max_categories]
+        self.categories = list(categories)
+        if measures is None:
+            measures = self.df.select_dtypes(include="number").columns
+        self.measures = list(measures)
+
+        # Undated rows come last, so the dates of the others stay sorted for searchsorted
+        self.all_dates = self.df[date].to_numpy(dtype="datetime64[ns]") if date is not None else None
+        self.dates = self._dated(self.all_dates)
+        self.n_rows = len(self.df)
+        self.values = {m: self.df[m].to_numpy(dtype="float64", na_value=np.nan) for m in self.measures}
+        self.cumsums = {m: self._cumsum(v) for m, v in self.values.items()}
+
+        self.codes = {}
+        # Index per tuple of category columns, see index()
+        self.indexes = {}
+        for column in self.categories:
+            self.index((column,))
+
+    @staticmethod
+    def _dated(dates):
+        return dates[:len(dates) - int(np.isnat(dates).sum())] if dates is not None else None
+
+    @staticmethod
+    def _cumsum(values):
+        # NaN counts as 0, like the NaN skipping of DataFrame.sum
+        return np.concatenate(([0.0], np.cumsum(np.nan_to_num(values))))
+
+    @staticmethod
+    def _as_list(value):
+        if value is None:
+            return []
+        return [value] if isinstance(value, str) or not hasattr(value, "__iter__") else list(value)
+
+    def _filters(self, filters):
+        """filters without the columns that select everything"""
+        return {column: set(self._as_list(v)) for column, v in (filters or {}).items() if self._as_list(v)}
+
+    def index(self, columns):
+        """
+        The dates and cumulative sums of the measures of the rows of each combination
+        of values of columns, as {values: (dates, cumsums, n_rows)} in sorted order.
+        The single category columns are indexed at startup, combinations (a filter on
+        one column and totals by another) on first use, and kept.
+        """
+        columns = tuple(columns)
+        if columns in self.indexes:
+            return self.indexes[columns]
+        key = np.zeros(self.n_rows, dtype="int64")
+        shape = []
+        for column in columns:
+            if column not in self.codes:
+                self.codes[column] = pd.factorize(self.df[column], sort=True)
+            codes, uniques = self.codes[column]
+            # Rows with a missing value get a negative key, groupby leaves them out too
+            key = np.where((codes < 0) | (key < 0), -1, key * len(uniques) + codes)
+            shape.append(len(uniques))
+        order = np.argsort(key, kind="stable")
+        sorted_key = key[order]
+        first = int(np.searchsorted(sorted_key, 0))
+        starts = first + np.flatnonzero(np.diff(sorted_key[first:], prepend=-1))
+        ends = np.append(starts[1:], len(order))
+
+        entries = {}
+        for start, end in zip(starts, ends):
+            rows = order[start:end]
+            positions = np.unravel_index(sorted_key[start], shape)
+            values = tuple(self.codes[column][1][p] for column, p in zip(columns, positions))
+            entries[values] = (
+                self._dated(self.all_dates[rows]) if self.all_dates is not None else None,
+                {m: self._cumsum(v[rows]) for m, v in self.values.items()},
+                len(rows),
+            )
+        self.indexes[columns] = entries
+        return entries
+
+    def _groups(self, by, filters):
+        """
+        (value of by, dates, cumsums, n_rows) of the rows passing filters, from the
+        index of by and the filtered columns, or None when one of them is not a
+        category column and the rows have to be grouped instead.
+        """
+        columns = ([by] if by is not None else []) + sorted(set(filters) - {by})
+        if not columns:
+            return [(None, self.dates, self.cumsums, self.n_rows)]
+        if any(column not in self.categories for column in columns):
+            return None
+        groups = []
+        for values, (dates, cumsums, n_rows) in self.index(columns).items():
+            if all(value in filters[column] for column, value in zip(columns, values) if column in filters):
+                groups.append((values[0] if by is not None else None, dates, cumsums, n_rows))
+        return groups
+
+    @staticmethod
+    def _timestamp(value):
+        return None if value is None else np.datetime64(pd.Timestamp(value), "ns")
+
+    @staticmethod
+    def _bounds(dates, n_rows, start=None, end=None):
+        """Positions [lo, hi) of the rows with start <= date <= end, all n_rows without a range"""
+        if dates is None or (start is None and end is None):
+            return 0, n_rows
+        lo = 0 if start is None else int(np.searchsorted(dates, start, side="left"))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, end, side="right"))
+        return lo, max(lo, hi)
+
+    def date_range(self, start=None, end=None):
+        """Row positions [lo, hi) of the date range, start and end included"""
+        return self._bounds(self.dates, self.n_rows, self._timestamp(start), self._timestamp(end))
+
+    def frame(self, start=None, end=None, filters=None):
+        """
+        The rows in the date range (all rows when neither start nor end is given)
+        whose columns have one of the values in filters, e.g. {"Company": ["A", "B"]}.
+        Empty or None filter values select everything.
+        """
+        if start is None and end is None:
+            df = self.df
+        else:
+            lo, hi = self.date_range(start, end)
+            df = self.df.iloc[lo:hi]
+        for column, selected in self._filters(filters).items():
+            df = df[df[column].isin(selected)]
+        return df
+
+    def totals(self, by, measures=None, start=None, end=None, filters=None):
+        """
+        Sums of the measures per value of the category column by over the date range,
+        with a "count" column of rows: df[range].groupby(by)[measures].sum() without the
+        scan. Filters on columns that are not category columns fall back to grouping
+        the filtered rows.
+        """
+        measures = self.measures if measures is None else self._as_list(measures)
+        filters = self._filters(filters)
+        groups = self._groups(by, filters)
+        if groups is None:
+            df = self.frame(start, end, filters)
+            grouped = df.groupby(by, sort=True, observed=True)
+            result = grouped[measures].sum()
+            result["count"] = grouped.size()
+            return result.reset_index()
+
+        start, end = self._timestamp(start), self._timestamp(end)
+        rows = {}
+        for value, dates, cumsums, n_rows in groups:
+            lo, hi = self._bounds(dates, n_rows, start, end)
+            if hi > lo:
+                row = rows.setdefault(value, [0.0] * len(measures) + [0])
+                for i, m in enumerate(measures):
+                    row[i] += cumsums[m][hi] - cumsums[m][lo]
+                row[-1] += hi - lo
+        return pd.DataFrame([[value] + row for value, row in rows.items()], columns=[by] + measures + ["count"])
+
+    def counts(self, by, start=None, end=None, filters=None):
+        """Rows per value of by over the date range, largest first like value_counts()"""
+        result = self.totals(by, [], start, end, filters)
+        return result.sort_values("count", ascending=False, kind="stable").reset_index(drop=True)
+
+    @staticmethod
+    def _period_starts(first, last, freq):
+        """Starts of the periods of frequency freq from the one containing first to last"""
+        offset = pd.tseries.frequencies.to_offset(freq)
+        return pd.date_range(offset.rollback(pd.Timestamp(first).normalize()), last, freq=offset)
+
+    def over_time(self, measures=None, start=None, end=None, by=None, freq="MS", filters=None):
+        """
+        Sums of the measures per period of the date column (freq is a pandas frequency
+        of period starts: "MS" months, "QS" quarters, "YS" years, "W-MON" weeks), per
+        value of by when given. Periods without rows are left out, like a groupby on
+        dt.to_period; the period column holds the start of each period.
+        """
+        if self.dates is None:
+            raise ValueError("over_time needs the date column of the DataCube")
+        measures = self.measures if measures is None else self._as_list(measures)
+        filters = self._filters(filters)
+        columns = ["period"] + ([by] if by is not None else []) + measures + ["count"]
+        start, end = self._timestamp(start), self._timestamp(end)
+        # Undated rows fall in no period
+        lo, hi = self._bounds(self.dates, len(self.dates), start, end)
+        if hi <= lo:
+            return pd.DataFrame(columns=columns)
+        starts = self._period_starts(self.dates[lo], self.dates[hi - 1], freq)
+        boundaries = starts.to_numpy(dtype="datetime64[ns]")
+
+        groups = self._groups(by, filters)
+        if groups is None:
+            df = self.frame(start, end, filters)
+            df = df[df[self.date].notna()]
+            positions = np.searchsorted(boundaries, df[self.date].to_numpy(dtype="datetime64[ns]"), side="right") - 1
+            keys = [pd.Series(starts[positions], index=df.index, name="period")]
+            keys += [df[by]] if by is not None else []
+            grouped = df.groupby(keys, sort=True, observed=True)
+            result = grouped[measures].sum()
+            result["count"] = grouped.size()
+            return result.reset_index()[columns]
+
+        series = {}
+        for value, dates, cumsums, _ in groups:
+            lo, hi = self._bounds(dates, len(dates), start, end)
+            if hi <= lo:
+                continue
+            # Row positions where each period starts, clipped to the range
+            edges = np.append(np.clip(np.searchsorted(dates, boundaries, side="left"), lo, hi), hi)
+            sums = series.setdefault(value, [np.zeros(len(starts)) for _ in measures]
+                                     + [np.zeros(len(starts), dtype="int64")])
+            for i, m in enumerate(measures):
+                sums[i] += np.diff(cumsums[m][edges])
+            sums[-1] += np.diff(edges)
+
+        frames = []
+        for value, sums in series.items():
+            keep = sums[-1] > 0
+            frame = {"period": starts[keep]}
+            if by is not None:
+                frame[by] = value
+            for m, total in zip(measures, sums):
+                frame[m] = total[keep]
+            frame["count"] = sums[-1][keep]
+            frames.append(pd.DataFrame(frame))
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        result = pd.concat(frames, ignore_index=True)
+        return result.sort_values(columns[:2 if by is not None else 1], kind="stable").reset_index(drop=True)
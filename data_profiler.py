@@ -0,0 +1,265 @@
+# Profile CSV files in-process for DataAnalyser
+
+import io
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List
+from pydantic import BaseModel
+from sketches import MomentSketch, TDigest, MisraGries, HyperLogLog
+
+SAMPLE_ROWS = 1000
+# Share of the memory limit given to a single parsed chunk, the rest is headroom
+# for pandas' parsing buffers and the sketches
+CHUNK_FRACTION = 0.25
+TOP_K_CAPACITY = 1000
+
+
+class DataProfile(BaseModel):
+    """Everything DataAnalyser needs to describe a CSV to the LLM"""
+    file_path: str
+    columns: str = ""
+    info: str = ""
+    dtypes: str = ""
+    preview: str = ""
+    stats: str = ""
+    categorical: Dict[str, Any] = {}
+    numerical: Dict[str, Any] = {}
+    streamed: bool = False
+    # Per-column facts for the token-budgeted summary (see data_summary.py)
+    n_rows: int = 0
+    column_dtypes: Dict[str, str] = {}
+    null_counts: Dict[str, int] = {}
+    preview_records: List[Dict[str, str]] = []
+
+    def categorical_analysis(self):
+        return str(self.categorical)
+
+    def numerical_analysis(self):
+        return str(self.numerical)
+
+
+def profile_dataframe(df, file_path=""):
+    """Compute all profiling statistics for an already loaded dataframe"""
+    buf = io.StringIO()
+    df.info(buf=buf)
+
+    null_counts = df.isnull().sum()
+
+    cat_cols = df.select_dtypes(include=['object', 'category']).columns
+    nunique = df[cat_cols].nunique()
+    cat_analysis = {}
+    for col in cat_cols:
+        cat_analysis[col] = {
+            'unique_values': df[col].value_counts().head(10).to_dict(),
+            'total_unique': nunique[col],
+            'null_count': null_counts[col]
+        }
+
+    num_cols = df.select_dtypes(include=['int64', 'float64']).columns
+    num_analysis = {}
+    if len(num_cols):
+        num_df = df[num_cols]
+        num_stats = num_df.describe()
+        medians = num_df.median()
+        skews = num_df.skew()
+        for col in num_cols:
+            num_analysis[col] = {
+                'min': num_stats[col]['min'],
+                'max': num_stats[col]['max'],
+                'mean': num_stats[col]['mean'],
+                'median': medians[col],
+                'null_count': null_counts[col],
+                'skewness': skews[col]
+            }
+
+    return DataProfile(
+        file_path=file_path,
+        # Strings are stripped like the old run_code stdout so prompts stay identical
+        columns=str(df.columns.tolist()),
+        # print(df.info()) printed the info block followed by "None"
+        info=(buf.getvalue() + "None").strip(),
+        dtypes=df.dtypes.to_string().strip(),
+        preview=df.head().to_string().strip(),
+        stats=df.describe(include='all').to_string().strip(),
+        categorical=cat_analysis,
+        numerical=num_analysis,
+        n_rows=len(df),
+        column_dtypes={str(col): str(dtype) for col, dtype in df.dtypes.items()},
+        null_counts={str(col): int(count) for col, count in null_counts.items()},
+        preview_records=preview_records(df.head())
+    )
+
+
+def preview_records(head):
+    return [{str(col): str(value) for col, value in row.items()} for row in head.to_dict("records")]
+
+
+def estimate_memory(file_path):
+    """Estimate the in-memory size of the parsed CSV and the bytes per parsed row"""
+    sample = pd.read_csv(file_path, nrows=SAMPLE_ROWS)
+    if len(sample) == 0:
+        return 0, 1
+    mem_per_row = sample.memory_usage(deep=True).sum() / len(sample)
+    with open(file_path, "rb") as f:
+        head = f.read(1 << 20)
+    disk_per_row = len(head) / max(head.count(b"\n"), 1)
+    return os.path.getsize(file_path) / disk_per_row * mem_per_row, mem_per_row
+
+
+def profile_csv(file_path, memory_limit_mb=None):
+    """
+    Load the CSV once and profile it. If the parsed file would not fit in
+    memory_limit_mb it is profiled in bounded chunks instead.
+    """
+    if memory_limit_mb is not None:
+        estimated, mem_per_row = estimate_memory(file_path)
+        if estimated > memory_limit_mb * 1e6:
+            chunksize = max(int(memory_limit_mb * 1e6 * CHUNK_FRACTION / mem_per_row), SAMPLE_ROWS)
+            return stream_profile_csv(file_path, chunksize=chunksize)
+    df = pd.read_csv(file_path)
+    return profile_dataframe(df, file_path)
+
+
+class ColumnSketch:
+    def __init__(self, numeric):
+        self.numeric = numeric
+        self.dtype = None
+        self.null_count = 0
+        if numeric:
+            self.moments = MomentSketch()
+            self.digest = TDigest()
+        else:
+            self.heavy_hitters = MisraGries(TOP_K_CAPACITY)
+            self.distinct = HyperLogLog()
+
+    def update(self, series):
+        if self.numeric:
+            if not pd.api.types.is_numeric_dtype(series):
+                # Values that do not parse count as nulls, like they are left out of the moments
+                series = pd.to_numeric(series, errors="coerce")
+            self.null_count += int(series.isnull().sum())
+            # A column is int64 only if every chunk parsed as int64
+            if self.dtype is None or self.dtype == "int64":
+                self.dtype = "int64" if series.dtype == "int64" else "float64"
+            values = series.to_numpy(dtype="float64", na_value=np.nan)
+            self.moments.update(values)
+            self.digest.update(values)
+        else:
+            self.null_count += int(series.isnull().sum())
+            self.dtype = self.dtype or str(series.dtype)
+            values = series.dropna()
+            self.heavy_hitters.update(values)
+            self.distinct.update(values)
+
+    def total_unique(self):
+        if not self.heavy_hitters.truncated:
+            return len(self.heavy_hitters.counts)
+        return self.distinct.count()
+
+
+def _format_info(sketches, n_rows, mem_per_row):
+    lines = [
+        "<class 'pandas.core.frame.DataFrame'>",
+        f"RangeIndex: {n_rows} entries, 0 to {n_rows - 1}",
+        f"Data columns (total {len(sketches)} columns):",
+    ]
+    table = pd.DataFrame({
+        "Column": list(sketches),
+        "Non-Null Count": [f"{n_rows - s.null_count} non-null" for s in sketches.values()],
+        "Dtype": [s.dtype for s in sketches.values()],
+    })
+    lines.append(table.to_string())
+    dtype_counts = pd.Series([s.dtype for s in sketches.values()]).value_counts().sort_index()
+    lines.append("dtypes: " + ", ".join(f"{k}({v})" for k, v in dtype_counts.items()))
+    lines.append(f"memory usage: {n_rows * mem_per_row / 1e6:.1f} MB (estimated)")
+    lines.append("None")
+    return "\n".join(lines)
+
+
+def _format_stats(sketches, n_rows):
+    stats = {}
+    has_cat = any(not s.numeric for s in sketches.values())
+    has_num = any(s.numeric for s in sketches.values())
+    for col, s in sketches.items():
+        col_stats = {"count": n_rows - s.null_count}
+        if s.numeric:
+            col_stats.update({
+                "mean": s.moments.mean if s.moments.n else np.nan,
+                "std": s.moments.std(),
+                "min": s.moments.min,
+                "25%": s.digest.quantile(0.25),
+                "50%": s.digest.quantile(0.5),
+                "75%": s.digest.quantile(0.75),
+                "max": s.moments.max,
+            })
+        else:
+            top = s.heavy_hitters.top(1)
+            col_stats.update({
+                "unique": s.total_unique(),
+                "top": top.index[0] if len(top) else np.nan,
+                "freq": top.iloc[0] if len(top) else np.nan,
+            })
+        stats[col] = col_stats
+    rows = ["count"]
+    if has_cat:
+        rows += ["unique", "top", "freq"]
+    if has_num:
+        rows += ["mean", "std", "min", "25%", "50%", "75%", "max"]
+    return pd.DataFrame(stats, index=rows).to_string().strip()
+
+
+def stream_profile_csv(file_path, chunksize=100_000):
+    """
+    Profile a CSV in bounded chunks. Counts, nulls, min/max, mean, variance and
+    skewness are exact; quantiles, top values and distinct counts come from sketches.
+    """
+    sketches = {}
+    preview = None
+    mem_per_row = 0
+    n_rows = 0
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        if preview is None:
+            preview = chunk.head()
+            mem_per_row = chunk.memory_usage(deep=True).sum() / max(len(chunk), 1)
+            for col in chunk.columns:
+                numeric = str(chunk[col].dtype) in ("int64", "float64")
+                sketches[col] = ColumnSketch(numeric)
+        for col, sketch in sketches.items():
+            sketch.update(chunk[col])
+        n_rows += len(chunk)
+
+    cat_analysis = {}
+    num_analysis = {}
+    for col, s in sketches.items():
+        if s.numeric:
+            num_analysis[col] = {
+                'min': s.moments.min,
+                'max': s.moments.max,
+                'mean': s.moments.mean if s.moments.n else np.nan,
+                'median': s.digest.quantile(0.5),
+                'null_count': s.null_count,
+                'skewness': s.moments.skewness()
+            }
+        elif s.dtype in ("object", "category"):
+            cat_analysis[col] = {
+                'unique_values': s.heavy_hitters.top(10).to_dict(),
+                'total_unique': s.total_unique(),
+                'null_count': s.null_count
+            }
+
+    return DataProfile(
+        file_path=file_path,
+        columns=str(list(sketches)),
+        info=_format_info(sketches, n_rows, mem_per_row),
+        dtypes=pd.Series({col: s.dtype for col, s in sketches.items()}).to_string().strip(),
+        preview=preview.to_string().strip() if preview is not None else "",
+        stats=_format_stats(sketches, n_rows),
+        categorical=cat_analysis,
+        numerical=num_analysis,
+        streamed=True,
+        n_rows=n_rows,
+        column_dtypes={str(col): s.dtype for col, s in sketches.items()},
+        null_counts={str(col): s.null_count for col, s in sketches.items()},
+        preview_records=preview_records(preview) if preview is not None else []
+    )
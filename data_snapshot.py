@@ -0,0 +1,221 @@
+# Cleaned, typed column snapshots of CSV files for generated Dash apps
+#
+# The workflow writes a snapshot of each CSV while it explores the data: amounts like
+# "$1,234.50" become floats, date columns datetimes and repetitive text categoricals.
+# Generated apps then start with
+#
+#     from data_snapshot import load_data
+#     df = load_data("./data/file.csv")
+#
+# which memory-maps the snapshot instead of parsing and cleaning the CSV again, and
+# builds it first when there is none for the current version of the file.
+#
+# Each column is one .npy file (categoricals as integer codes, their categories in
+# manifest.json), so loading needs nothing beyond numpy and pandas.
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Bump when the cleaning or the snapshot layout changes
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIR_ENV = "DATA_SNAPSHOT_DIR"
+DEFAULT_SNAPSHOT_DIR = "./data_snapshots"
+DATE_NAME = re.compile(r"date|time|year|month|period|day|week", re.IGNORECASE)
+DATE_VALUE = re.compile(r"^\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|^\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}")
+# Currency symbols, thousands separators, percent signs and spaces around a number
+NUMBER_NOISE = re.compile(r"[\s$€£¥,%]")
+MISSING = {"", "-", "--", "n/a", "na", "nan", "none", "null"}
+# Text columns with at most this share of distinct values become categoricals
+CATEGORY_RATIO = 0.5
+# Snapshot directories loaded by this process, their names identify the version of each file
+LOADED_SNAPSHOTS = set()
+
+
+def snapshot_root():
+    return os.getenv(SNAPSHOT_DIR_ENV, DEFAULT_SNAPSHOT_DIR)
+
+
+def snapshot_path(file_path, root=None):
+    """Directory of the snapshot of file_path as it is now (path, size and mtime)"""
+    stat = os.stat(file_path)
+    identity = json.dumps([os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, pd.__version__, SNAPSHOT_VERSION])
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(root or snapshot_root(), f"{name}-{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]}")
+
+
+def _missing(text):
+    return text.str.strip().str.lower().isin(MISSING)
+
+
+def clean_numbers(column: pd.Series):
+    """
+    column as floats when every non-missing value is a number once currency signs,
+    thousands separators and percent signs are removed ("(1,234)" is -1234), else None
+    """
+    text = column.astype(str)
+    present = column.notna() & ~_missing(text)
+    if not present.any():
+        return None
+    stripped = text[present].str.replace(NUMBER_NOISE, "", regex=True)
+    negative = stripped.str.startswith("(") & stripped.str.endswith(")")
+    stripped = stripped.where(~negative, "-" + stripped.str.slice(1, -1))
+    numbers = pd.to_numeric(stripped, errors="coerce")
+    if numbers.isna().any():
+        return None
+    return numbers.astype("float64").reindex(column.index)
+
+
+def clean_dates(column: pd.Series, name=""):
+    """column as datetimes when it looks like dates and every non-missing value parses, else None"""
+    text = column.astype(str)
+    present = column.notna() & ~_missing(text)
+    if not present.any():
+        return None
+    values = text[present]
+    if not DATE_NAME.search(name) and not values.head(20).str.match(DATE_VALUE).all():
+        return None
+    try:
+        # The format of the first value is used for all of them, like the generated code's format=...
+        dates = pd.to_datetime(values, errors="coerce")
+    except (ValueError, TypeError, OverflowError):
+        return None
+    if dates.isna().any():
+        return None
+    return dates.reindex(column.index)
+
+
+def clean_frame(df: pd.DataFrame, category_ratio=CATEGORY_RATIO):
+    """
+    The typed DataFrame and {column: (dtype before, dtype after)} of the columns it
+    changed. Text columns become floats or datetimes when all their values convert,
+    repetitive ones categoricals; the other columns are left as they are.
+    """
+    df = df.copy()
+    changes = {}
+    for column in df.columns:
+        before = df[column]
+        if before.dtype != object:
+            continue
+        after = clean_numbers(before)
+        if after is None:
+            after = clean_dates(before, str(column))
+        if after is None and before.nunique() <= category_ratio * max(len(before), 1):
+            after = before.astype("category")
+        if after is not None:
+            df[column] = after
+            changes[column] = (str(before.dtype), str(after.dtype))
+    return df, changes
+
+
+def write_snapshot(df: pd.DataFrame, path, changes=None, source=""):
+    """Write df to the directory path, one .npy file per column"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    columns = []
+    for i, (name, column) in enumerate(df.items()):
+        entry = {"name": str(name), "file": f"{i}.npy", "dtype": str(column.dtype)}
+        if isinstance(column.dtype, pd.CategoricalDtype) or not isinstance(column.dtype, np.dtype) \
+                or column.dtype == object:
+            # Text (and nullable extension types) is stored as codes into its distinct values,
+            # columns that were not categoricals are rebuilt as object columns on load
+            categorical = column.astype("category")
+            entry["kind"] = "category" if isinstance(column.dtype, pd.CategoricalDtype) else "object"
+            entry["categories"] = [c if isinstance(c, (str, int, float, bool)) else str(c)
+                                   for c in categorical.cat.categories.tolist()]
+            values = categorical.cat.codes.to_numpy()
+        elif pd.api.types.is_datetime64_any_dtype(column.dtype):
+            entry["kind"] = "datetime"
+            entry["tz"] = str(column.dt.tz) if column.dt.tz is not None else None
+            # Aware datetimes are stored in UTC and converted back on load
+            values = column.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy(dtype="datetime64[ns]") \
+                if column.dt.tz is not None else column.to_numpy(dtype="datetime64[ns]")
+        else:
+            entry["kind"] = "array"
+            values = column.to_numpy()
+        np.save(os.path.join(tmp_path, entry["file"]), values, allow_pickle=False)
+        columns.append(entry)
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "source": source,
+        "rows": len(df),
+        "columns": columns,
+        "changes": {str(name): list(change) for name, change in (changes or {}).items()},
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another process (e.g. a second worker of the app) wrote it meanwhile
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(path):
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_snapshot(path):
+    """
+    The DataFrame of a snapshot directory. Numeric and datetime columns are mapped
+    copy-on-write, pages are read from the file when touched and in-place changes
+    stay in the process.
+    """
+    manifest = read_manifest(path)
+    LOADED_SNAPSHOTS.add(os.path.abspath(path))
+    data = {}
+    for entry in manifest["columns"]:
+        values = np.load(os.path.join(path, entry["file"]), mmap_mode="c", allow_pickle=False)
+        if entry["kind"] in ("category", "object"):
+            categorical = pd.Categorical.from_codes(values, entry["categories"])
+            data[entry["name"]] = categorical if entry["kind"] == "category" else np.asarray(categorical, dtype=object)
+        elif entry["kind"] == "datetime" and entry.get("tz"):
+            data[entry["name"]] = pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(entry["tz"])
+        else:
+            data[entry["name"]] = values
+    # copy=False keeps one block per column on top of the mapped arrays
+    return pd.DataFrame(data, copy=False)
+
+
+def build_snapshot(file_path, root=None, **read_csv_options):
+    """Read, clean and snapshot the CSV file_path unless its snapshot exists, returns the snapshot path"""
+    path = snapshot_path(file_path, root)
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        return path
+    df, changes = clean_frame(pd.read_csv(file_path, **read_csv_options))
+    # Snapshots of older versions of the file are no longer used
+    prefix = os.path.basename(path).rsplit("-", 1)[0] + "-"
+    parent = os.path.dirname(path)
+    if os.path.isdir(parent):
+        for name in os.listdir(parent):
+            if name.startswith(prefix) and os.path.join(parent, name) != path and not name.endswith(".tmp"):
+                old = os.path.join(parent, name)
+                if os.path.exists(os.path.join(old, "manifest.json")) and \
+                        read_manifest(old).get("source") == os.path.abspath(file_path):
+                    shutil.rmtree(old, ignore_errors=True)
+    os.makedirs(parent or ".", exist_ok=True)
+    write_snapshot(df, path, changes, source=os.path.abspath(file_path))
+    return path
+
+
+def load_data(file_path, root=None):
+    """The cleaned, typed DataFrame of the CSV file_path, from its snapshot"""
+    return load_snapshot(build_snapshot(file_path, root))
+
+
+def snapshot_changes(file_path, root=None):
+    """{column: (dtype before, dtype after)} of the existing snapshot of file_path, None without one"""
+    path = snapshot_path(file_path, root)
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        return None
+    return {name: tuple(change) for name, change in read_manifest(path)["changes"].items()}
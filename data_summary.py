@@ -0,0 +1,176 @@
+# Data summaries of a DataProfile for the DataAnalyser prompts
+
+import math
+import re
+from data_profiler import DataProfile
+from token_budget import count_tokens
+
+DATE_NAME = re.compile(r"date|time|year|month|quarter|period|day|week", re.IGNORECASE)
+MAX_CELL_CHARS = 24
+PREVIEW_COLUMNS = 12
+# Shares of the budget for the per-column lines and, after them, the names of the other columns;
+# the preview gets what is left
+LINES_SHARE = 0.7
+NAMES_SHARE = 0.2
+
+
+def lossless_summary(profile: DataProfile):
+    """
+    info, dtypes, head, describe and the column analyses, complete and verbatim. The
+    text is identical to the summary analyze_data always sent, indentation included,
+    so cached LLM responses keep matching.
+    """
+    indent = " " * 16
+    parts = [
+        "Data Info:", profile.info, "",
+        "Column Types:", profile.dtypes, "",
+        "Preview:", profile.preview, "",
+        "Statistics:", profile.stats, "",
+        "Categorical Columns Analysis:", profile.categorical_analysis(), "",
+        "Numerical Columns Analysis:", profile.numerical_analysis(),
+    ]
+    return "\n" + "\n".join(indent + part for part in parts) + "\n" + indent
+
+
+def _number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "nan"
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:.4g}"
+    return str(int(value)) if isinstance(value, float) and abs(value) < 1e15 else str(value)
+
+
+def _cell(value):
+    value = str(value).replace("\n", " ").replace("|", "/")
+    return value if len(value) <= MAX_CELL_CHARS else value[:MAX_CELL_CHARS - 1] + "…"
+
+
+def column_score(profile: DataProfile, column):
+    """
+    How much a column tells about the data, higher first. Time-like columns come
+    first since dashboards are mostly built around them; constant, mostly empty
+    and identifier-like columns come last.
+    """
+    n_rows = max(profile.n_rows, 1)
+    filled = 1 - profile.null_counts.get(column, 0) / n_rows
+    dtype = profile.column_dtypes.get(column, "")
+    time_like = bool(DATE_NAME.search(column)) or dtype.startswith("datetime")
+    if column in profile.numerical:
+        stats = profile.numerical[column]
+        if stats["min"] == stats["max"]:
+            return 0.05 * filled
+        score = filled
+    elif column in profile.categorical:
+        stats = profile.categorical[column]
+        unique = stats["total_unique"]
+        if unique <= 1:
+            return 0.05 * filled
+        counts = [count for count in stats["unique_values"].values() if count]
+        total = sum(counts)
+        # Entropy of the top values, relative to the most the shown values could have
+        entropy = -sum(count / total * math.log(count / total) for count in counts) if total else 0.0
+        evenness = entropy / math.log(len(counts)) if len(counts) > 1 else 0.0
+        # Nearly one value per row: names or ids rather than groups. Evenly spread groups
+        # are what dashboards filter and color by, they rank above plain measures
+        identifier = unique / n_rows > 0.9 and not time_like
+        score = filled * (0.3 if identifier else 0.6 + 0.6 * evenness)
+    else:
+        score = 0.5 * filled
+    return score + (1.0 if time_like else 0.0)
+
+
+def column_line(profile: DataProfile, column):
+    dtype = profile.column_dtypes.get(column, "")
+    nulls = profile.null_counts.get(column, 0)
+    if column in profile.numerical:
+        stats = profile.numerical[column]
+        detail = (f"{_number(stats['min'])}..{_number(stats['max'])}, mean {_number(stats['mean'])}, "
+                  f"median {_number(stats['median'])}, skew {_number(stats['skewness'])}")
+    elif column in profile.categorical:
+        stats = profile.categorical[column]
+        top = ", ".join(f"{_cell(value)} ({count})" for value, count in list(stats["unique_values"].items())[:5])
+        detail = f"{stats['total_unique']} unique, top: {top}"
+    else:
+        detail = ""
+    return f"{column} | {dtype} | {nulls} | {detail}"
+
+
+def compact_summary(profile: DataProfile, token_budget=3000, model="gpt-4o"):
+    """
+    A summary of at most token_budget tokens. Columns are ranked by column_score and
+    described one line each, most informative first, within LINES_SHARE of the budget;
+    the names of the rest follow within NAMES_SHARE, then preview rows of the top
+    columns in what is left.
+    Lines are always kept whole and ties keep the file's column order, so the same
+    profile and budget always give the same summary. Returns (summary, columns),
+    columns being the names the summary describes.
+    """
+    columns = list(profile.column_dtypes)
+    ranked = sorted(columns, key=lambda column: -column_score(profile, column))
+    header = (f"Rows: {profile.n_rows}, columns: {len(columns)}\n\n"
+              "Columns (name | dtype | nulls | range and averages, or distinct count and top values):")
+    lines = [header]
+    used = count_tokens(header, model)
+
+    described = []
+    for column in ranked:
+        line = column_line(profile, column)
+        tokens = count_tokens(line, model) + 1
+        if used + tokens > token_budget * LINES_SHARE:
+            break
+        described.append(column)
+        lines.append(line)
+        used += tokens
+
+    rest = [column for column in ranked if column not in described]
+    if rest:
+        names = []
+        names_budget = used + token_budget * NAMES_SHARE
+        for column in rest:
+            tokens = count_tokens(column, model) + 1
+            if used + tokens > names_budget:
+                break
+            names.append(column)
+            used += tokens
+        note = f"\nOther columns ({len(rest)}): {', '.join(names)}"
+        if len(names) < len(rest):
+            note += f"{',' if names else ''} and {len(rest) - len(names)} more"
+        lines.append(note)
+        used += count_tokens(note, model)
+
+    preview_columns = [column for column in ranked if column in described][:PREVIEW_COLUMNS]
+    if profile.preview_records and preview_columns:
+        # Preview columns in file order, like the data
+        preview_columns = [column for column in columns if column in preview_columns]
+        preview = ["\nPreview:", " | ".join(preview_columns)]
+        for record in profile.preview_records:
+            row = " | ".join(_cell(record.get(column, "")) for column in preview_columns)
+            tokens = count_tokens(row, model) + 1
+            if used + count_tokens("\n".join(preview), model) + tokens > token_budget:
+                break
+            preview.append(row)
+        if len(preview) > 2:
+            lines.extend(preview)
+
+    return "\n".join(lines), described
+
+
+def build_summary(profile: DataProfile, mode="auto", token_budget=3000, model="gpt-4o"):
+    """
+    Summary for the visualization prompt and the columns it names. mode "lossless"
+    is the complete summary, "compact" the budgeted one, and "auto" the complete one
+    when it fits in token_budget, otherwise the budgeted one.
+    """
+    all_columns = profile.columns
+    if mode == "lossless":
+        return lossless_summary(profile), all_columns
+    if mode == "auto":
+        summary = lossless_summary(profile)
+        if count_tokens(summary, model) <= token_budget:
+            return summary, all_columns
+    elif mode != "compact":
+        raise ValueError(f"Unknown summary mode: {mode}")
+    summary, described = compact_summary(profile, token_budget, model)
+    if len(described) == len(profile.column_dtypes):
+        return summary, all_columns
+    return summary, str(described)
@@ -0,0 +1,223 @@
+# Persistent dense embedding cache shared by UserInput and VectorIndexer
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# The matrix file grows by at least this many rows at a time
+GROW_ROWS = 4096
+# Seconds before a hit updates the last use of its row again
+TOUCH_INTERVAL = 60
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def shared_embedding_cache(cache_dir="./embedding_cache", capacity=200_000):
+    """One EmbeddingCache per directory and process, so all indexers write through the same instance"""
+    with _shared_lock:
+        if cache_dir not in _shared_caches:
+            _shared_caches[cache_dir] = EmbeddingCache(cache_dir, capacity)
+        return _shared_caches[cache_dir]
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir="./embedding_cache", capacity=200_000):
+        """
+        Vectors of each model live in a memory-mapped float32 matrix of at most
+        `capacity` rows, grown as it fills, next to a SQLite index of text hash ->
+        row. When the matrix is full the least recently used tenth of the rows is
+        evicted and their slots reused. Processes sharing cache_dir coordinate
+        through the SQLite locks: rows are written under an exclusive lock, which
+        waits for readers that are still copying vectors out of the matrix.
+        """
+        self.cache_dir = cache_dir
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.stores = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _store(self, model_id, dim=None):
+        """Open (or with dim given, create) the matrix and index for a model"""
+        if model_id in self.stores:
+            return self.stores[model_id]
+        slug = hashlib.sha256(model_id.encode("utf-8")).hexdigest()[:16]
+        index_path = os.path.join(self.cache_dir, f"{slug}.index.sqlite")
+        if not os.path.exists(index_path) and dim is None:
+            return None
+        # Autocommit, the transactions are explicit
+        conn = sqlite3.connect(index_path, timeout=60, check_same_thread=False, isolation_level=None)
+        conn.execute("BEGIN EXCLUSIVE")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (model_id TEXT, dim INTEGER, capacity INTEGER, next_row INTEGER)")
+        conn.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER UNIQUE, last_used REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS rows_last_used ON rows (last_used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS free (row INTEGER PRIMARY KEY)")
+        meta = conn.execute("SELECT dim, capacity FROM meta").fetchone()
+        if meta is None:
+            if dim is None:
+                conn.execute("ROLLBACK")
+                conn.close()
+                return None
+            conn.execute("INSERT INTO meta VALUES (?, ?, ?, 0)", (model_id, dim, self.capacity))
+            meta = (dim, self.capacity)
+            # The JSON index and preallocated matrix of earlier versions
+            for old in (f"{slug}.index.json", f"{slug}.f32"):
+                if os.path.exists(os.path.join(self.cache_dir, old)):
+                    os.remove(os.path.join(self.cache_dir, old))
+        conn.execute("COMMIT")
+        store = {"conn": conn, "dim": meta[0], "capacity": meta[1],
+                 "matrix_path": os.path.join(self.cache_dir, f"{slug}.vectors.f32"), "matrix": None}
+        self.stores[model_id] = store
+        return store
+
+    @staticmethod
+    def _matrix(store, row):
+        """The memory map of the matrix, remapped when row is past its end (another process may have grown it)"""
+        matrix = store["matrix"]
+        if matrix is None or row >= matrix.shape[0]:
+            row_bytes = store["dim"] * 4
+            rows = os.path.getsize(store["matrix_path"]) // row_bytes if os.path.exists(store["matrix_path"]) else 0
+            matrix = np.memmap(store["matrix_path"], dtype="float32", mode="r+", shape=(rows, store["dim"])) if rows else None
+            store["matrix"] = matrix
+        return matrix
+
+    @staticmethod
+    def _grow(store, row):
+        """Extend the matrix file so it holds row, doubling it up to the capacity"""
+        row_bytes = store["dim"] * 4
+        path = store["matrix_path"]
+        rows = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+        if row < rows:
+            return
+        rows = min(store["capacity"], max(row + 1, 2 * rows, GROW_ROWS))
+        with open(path, "ab") as f:
+            f.truncate(rows * row_bytes)
+
+    def get(self, model_id, texts):
+        """Returns a list with a vector (or None on a miss) per text"""
+        with self._lock:
+            store = self._store(model_id)
+            if store is None:
+                self.misses += len(texts)
+                return [None] * len(texts)
+            conn = store["conn"]
+            keys = [self.text_hash(text) for text in texts]
+            results = []
+            # The shared lock keeps writers from reusing the rows until the vectors are copied
+            conn.execute("BEGIN")
+            try:
+                rows = {}
+                for start in range(0, len(keys), 500):
+                    chunk = list(set(keys[start:start + 500]))
+                    for key, row, last_used in conn.execute(
+                            f"SELECT key, row, last_used FROM rows WHERE key IN ({','.join('?' * len(chunk))})", chunk):
+                        rows[key] = (row, last_used)
+                for key in keys:
+                    if key not in rows:
+                        self.misses += 1
+                        results.append(None)
+                        continue
+                    self.hits += 1
+                    row = rows[key][0]
+                    results.append(np.array(self._matrix(store, row)[row]))
+            finally:
+                conn.execute("COMMIT")
+            # Recency only needs to be coarse for the eviction, which keeps most lookups read-only
+            now = time.time()
+            stale = [(now, key) for key, (_, last_used) in rows.items() if now - last_used > TOUCH_INTERVAL]
+            if stale:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("UPDATE rows SET last_used = ? WHERE key = ?", stale)
+                conn.execute("COMMIT")
+            return results
+
+    def put(self, model_id, texts, vectors):
+        if not texts:
+            return
+        with self._lock:
+            store = self._store(model_id, dim=len(vectors[0]))
+            conn = store["conn"]
+            # Also waits for the readers of other processes, see get
+            conn.execute("BEGIN EXCLUSIVE")
+            try:
+                now = time.time()
+                for text, vector in zip(texts, vectors):
+                    key = self.text_hash(text)
+                    if conn.execute("SELECT 1 FROM rows WHERE key = ?", (key,)).fetchone():
+                        continue
+                    row = self._allocate(store)
+                    self._grow(store, row)
+                    self._matrix(store, row)[row] = np.asarray(vector, dtype="float32")
+                    conn.execute("INSERT INTO rows VALUES (?, ?, ?)", (key, row, now))
+                if store["matrix"] is not None:
+                    store["matrix"].flush()
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _allocate(self, store):
+        """A free row of the matrix, evicting the least recently used tenth of the rows when it is full"""
+        conn = store["conn"]
+        free = conn.execute("SELECT row FROM free LIMIT 1").fetchone()
+        if free is None:
+            next_row = conn.execute("SELECT next_row FROM meta").fetchone()[0]
+            if next_row < store["capacity"]:
+                conn.execute("UPDATE meta SET next_row = ?", (next_row + 1,))
+                return next_row
+            conn.execute("""
+                INSERT INTO free SELECT row FROM rows ORDER BY last_used LIMIT ?
+            """, (max(store["capacity"] // 10, 1),))
+            conn.execute("DELETE FROM rows WHERE row IN (SELECT row FROM free)")
+            free = conn.execute("SELECT row FROM free LIMIT 1").fetchone()
+        conn.execute("DELETE FROM free WHERE row = ?", free)
+        return free[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = {model_id: store["conn"].execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+                       for model_id, store in self.stores.items()}
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps a dense Embeddings model so that already seen texts are not encoded again"""
+    def __init__(self, embeddings, model_id, cache=None):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.cache = cache or shared_embedding_cache()
+
+    def _embed(self, texts, model_id, encode):
+        vectors = self.cache.get(model_id, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Encode each distinct missing text once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(unique_texts, encode(unique_texts)))
+            self.cache.put(model_id, unique_texts, [computed[text] for text in unique_texts])
+            for i in missing:
+                vectors[i] = computed[texts[i]]
+        return [list(map(float, vector)) for vector in vectors]
+
+    def embed_documents(self, texts):
+        return self._embed(texts, self.model_id, self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        # Some models embed queries differently from documents, keep them apart
+        encode = lambda texts: [self.embeddings.embed_query(t) for t in texts]
+        return self._embed([text], f"{self.model_id}#query", encode)[0]
@@ -0,0 +1,96 @@
+# Batched dense + sparse embedding and bulk upload into a hybrid QdrantVectorStore
+
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EmbeddingPipeline:
+    def __init__(self, embeddings, sparse_embeddings, batch_size=64, queue_size=4, workers=2):
+        """
+        Documents are split into batches of batch_size. Dense and sparse encodings of
+        a batch run concurrently on a thread pool (both torch and onnxruntime release
+        the GIL, so this uses several cores), while an uploader thread bulk-upserts
+        finished batches. At most queue_size batches are in flight between the stages.
+        """
+        self.embeddings = embeddings
+        self.sparse_embeddings = sparse_embeddings
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.workers = workers
+
+    def _timed(self, fn, texts, timings, key):
+        start = time.perf_counter()
+        result = fn(texts)
+        with self._timings_lock:
+            timings[key] += time.perf_counter() - start
+        return result
+
+    def run(self, vector_store, documents, ids=None):
+        """Embed and upsert documents into vector_store, returns throughput stats"""
+        from qdrant_client import models
+
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in documents]
+        timings = {"dense_seconds": 0.0, "sparse_seconds": 0.0, "upload_seconds": 0.0}
+        self._timings_lock = threading.Lock()
+        batches = queue.Queue(maxsize=self.queue_size)
+        errors = []
+
+        def upload():
+            while True:
+                item = batches.get()
+                if item is None:
+                    return
+                batch, batch_ids, dense_future, sparse_future = item
+                try:
+                    dense, sparse = dense_future.result(), sparse_future.result()
+                    start = time.perf_counter()
+                    points = [
+                        models.PointStruct(
+                            id=point_id,
+                            vector={
+                                vector_store.vector_name: dense_vector,
+                                vector_store.sparse_vector_name: models.SparseVector(
+                                    indices=sparse_vector.indices, values=sparse_vector.values
+                                ),
+                            },
+                            payload={
+                                vector_store.content_payload_key: doc.page_content,
+                                vector_store.metadata_payload_key: doc.metadata,
+                            },
+                        )
+                        for doc, point_id, dense_vector, sparse_vector in zip(batch, batch_ids, dense, sparse)
+                    ]
+                    vector_store.client.upsert(collection_name=vector_store.collection_name, points=points)
+                    timings["upload_seconds"] += time.perf_counter() - start
+                except Exception as e:
+                    errors.append(e)
+
+        start = time.perf_counter()
+        uploader = threading.Thread(target=upload, daemon=True)
+        uploader.start()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for i in range(0, len(documents), self.batch_size):
+                if errors:
+                    break
+                batch = documents[i:i + self.batch_size]
+                texts = [doc.page_content for doc in batch]
+                dense_future = pool.submit(self._timed, self.embeddings.embed_documents, texts, timings, "dense_seconds")
+                sparse_future = pool.submit(self._timed, self.sparse_embeddings.embed_documents, texts, timings, "sparse_seconds")
+                # Blocks once queue_size batches are waiting, bounding memory
+                batches.put((batch, ids[i:i + self.batch_size], dense_future, sparse_future))
+            batches.put(None)
+            uploader.join()
+        if errors:
+            raise errors[0]
+
+        seconds = time.perf_counter() - start
+        return dict(
+            timings,
+            pages=len(documents),
+            seconds=seconds,
+            pages_per_sec=len(documents) / seconds if seconds > 0 else 0.0
+        )
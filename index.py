@@ -4,47 +4,157 @@ from langchain_openai import OpenAIEmbeddings
 from sentence_transformers import SentenceTransformer
 from langchain_huggingface import HuggingFaceEmbeddings
 from scrap_doc import DocumentationScraper
-from pathlib import Path
+from embedding_cache import CachedEmbeddings
+from embedding_pipeline import EmbeddingPipeline
+from chunking import chunk_documents, chunk_hash
 import os
+import json
+import time
+import uuid
 from load_dotenv import load_dotenv
 load_dotenv()
 
+DOC_POINT_NAMESPACE = uuid.UUID("2b8e6f0c-9d4a-4f3b-8c1e-5a7d9e3f1b64")
+
 
 class VectorIndexer:
-    def __init__(self):
+    def __init__(self, index_path="./documentation_cache", chunk_size=1000, chunk_overlap=150, chunking="structure"):
         self.vector_store = None
+        self.index_path = index_path
+        # Page and chunk hashes of what is in the index, next to the index itself
+        self.manifest_path = index_path.rstrip("/") + "_manifest.json"
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # MiniLM reads at most 256 tokens, about 1000 characters, of each chunk
+        self.chunking = chunking
         # self.embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
-        self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        self.embed_model_id = "sentence-transformers/all-MiniLM-L6-v2"
+        # Vectors are cached on disk and shared with UserInput, re-indexing unchanged pages is free
+        self.embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=self.embed_model_id), self.embed_model_id)
         # self.embeddings = SentenceTransformer("dunzhang/stella_en_400M_v5", trust_remote_code=True)
         self.sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
 
     def index_docs(self, docs):
-        qdrant_path = Path("./qdrant_db")
-        qdrant_path.mkdir(exist_ok=True)
+        """Bring the index in line with docs, only new or changed chunks are embedded"""
+        return self.sync(docs)
+
+    def page_hash(self, doc):
+        # Chunking settings are part of the hash, changing them re-chunks every page
+        return chunk_hash(f"{self.chunking}:{self.chunk_size}:{self.chunk_overlap}:{doc.page_content}")
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
 
-        self.vector_store =  QdrantVectorStore.from_documents(
-            docs,
+    def save_manifest(self, manifest):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def sync(self, docs):
+        """
+        Pages are keyed by their source url. Unchanged pages are skipped, chunks of new
+        or changed pages are upserted under ids derived from url and chunk hash, and
+        chunks that are no longer produced, including those of vanished pages, are deleted.
+        Chunks a changed page still produces keep their vectors, their metadata (position
+        on the page, ...) is rewritten.
+        """
+        from qdrant_client import models
+        start = time.perf_counter()
+        manifest = self.load_manifest() if os.path.exists(self.index_path) else None
+        self.close()
+        # Without a manifest the ids in an existing collection are unknown, start over
+        self.vector_store = QdrantVectorStore.construct_instance(
             embedding=self.embeddings,
             sparse_embedding=self.sparse_embeddings,
-            path="./documentation_cache",
+            client_options={"path": self.index_path},
             collection_name="documentation",
             retrieval_mode=RetrievalMode.HYBRID,
+            force_recreate=manifest is None
         )
+        old_pages = (manifest or {}).get("pages", {})
+        pages = {}
+        upserts = []
+        updates = []
+        deletes = []
+        for doc in docs:
+            source = doc.metadata["source"]
+            page_hash = self.page_hash(doc)
+            old_page = old_pages.get(source)
+            if old_page is not None and old_page["page_hash"] == page_hash:
+                pages[source] = old_page
+                continue
+            chunks = {}
+            for chunk in chunk_documents([doc], self.chunk_size, self.chunk_overlap, self.chunking):
+                point_id = str(uuid.uuid5(DOC_POINT_NAMESPACE, f"{source}#{chunk.metadata['chunk_hash']}"))
+                chunks.setdefault(point_id, chunk)
+            old_ids = set(old_page["ids"]) if old_page else set()
+            upserts.extend((point_id, chunk) for point_id, chunk in chunks.items() if point_id not in old_ids)
+            updates.extend((point_id, chunk) for point_id, chunk in chunks.items() if point_id in old_ids)
+            deletes.extend(old_ids - set(chunks))
+            pages[source] = {"page_hash": page_hash, "ids": list(chunks)}
+        for source, old_page in old_pages.items():
+            if source not in pages:
+                deletes.extend(old_page["ids"])
+
+        if upserts:
+            EmbeddingPipeline(self.embeddings, self.sparse_embeddings).run(
+                self.vector_store, [chunk for _, chunk in upserts], ids=[point_id for point_id, _ in upserts]
+            )
+        if updates:
+            self.vector_store.client.batch_update_points(
+                collection_name=self.vector_store.collection_name,
+                update_operations=[
+                    models.SetPayloadOperation(set_payload=models.SetPayload(
+                        payload={self.vector_store.metadata_payload_key: chunk.metadata}, points=[point_id]))
+                    for point_id, chunk in updates
+                ]
+            )
+        if deletes:
+            self.vector_store.client.delete(
+                collection_name=self.vector_store.collection_name,
+                points_selector=models.PointIdsList(points=deletes)
+            )
+        self.save_manifest({"pages": pages})
+
+        stats = {
+            "pages": len(pages),
+            "changed_pages": sum(1 for source, page in pages.items() if old_pages.get(source) is not page),
+            "removed_pages": sum(1 for source in old_pages if source not in pages),
+            "upserted_chunks": len(upserts),
+            "updated_chunks": len(updates),
+            "deleted_chunks": len(deletes),
+            "seconds": time.perf_counter() - start,
+        }
+        print(f"Synced {stats['pages']} pages in {stats['seconds']:.1f}s: {stats['changed_pages']} new or changed, "
+              f"{stats['removed_pages']} removed, {stats['upserted_chunks']} chunks upserted, "
+              f"{stats['updated_chunks']} updated, {stats['deleted_chunks']} deleted")
+        return stats
+
+    def close(self):
+        # Embedded Qdrant locks its path, release it before opening the index again
+        if self.vector_store is not None:
+            self.vector_store.client.close()
+            self.vector_store = None
 
     def load_index(self):
+        self.close()
         self.vector_store = QdrantVectorStore.from_existing_collection(
             embedding=self.embeddings,
             sparse_embedding=self.sparse_embeddings,
-            path="./documentation_cache",
+            path=self.index_path,
             collection_name="documentation",
             retrieval_mode=RetrievalMode.HYBRID,
         )
 
-    def search(self, query):
+    def search(self, query, k=4):
         # query = "What did the president say about Ketanji Brown Jackson"
-        found_docs = self.vector_store.similarity_search(query)
+        found_docs = self.vector_store.similarity_search(query, k=k)
         return found_docs
-    
+
 
 if __name__ == "__main__":
     doc_url = "https://dash.plotly.com/"
@@ -53,6 +163,6 @@ if __name__ == "__main__":
     # scraper = DocumentationScraper(doc_url)
     # docs = scraper.load_documents()
     # indexer.index_docs(docs)
-    
+
     results = indexer.search("How to create a bar chart in Dash")
-    print(results)
\ No newline at end of file
+    print(results)
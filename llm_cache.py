@@ -0,0 +1,164 @@
+# SQLite cache of LLM responses shared by DataAnalyser and DashCoder
+
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from langchain_core.messages import SystemMessage
+
+
+class LLMCache:
+    def __init__(self, path="./llm_cache.sqlite", ttl_seconds=7 * 24 * 3600, max_entries=5000,
+                 embeddings=None, similarity_threshold=0.97):
+        """
+        Responses are keyed by model, temperature, system prompt and the rendered
+        user prompt. If embeddings are given, an exact miss on a call that names
+        the user query falls back to the cached response whose query is the most
+        similar one, when its cosine similarity reaches similarity_threshold and
+        the rest of the prompt (data summary, old code, ...) is the same. Only the
+        query is embedded, the embedding model reads just the start of its input.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.metrics = {}
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                stage TEXT,
+                scope TEXT,
+                response TEXT,
+                embedding BLOB,
+                created REAL,
+                last_used REAL,
+                context TEXT
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(responses)")]
+        if "context" not in columns:
+            # Embeddings of caches written before the context column are of whole prompts, never reuse them
+            self.conn.execute("ALTER TABLE responses ADD COLUMN context TEXT")
+            self.conn.execute("UPDATE responses SET embedding = NULL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope)")
+        self.conn.commit()
+
+    @staticmethod
+    def _hash(*parts):
+        return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def split_messages(messages):
+        system_prompt = "\n".join(m.content for m in messages if isinstance(m, SystemMessage))
+        user_prompt = "\n".join(m.content for m in messages if not isinstance(m, SystemMessage))
+        return system_prompt, user_prompt
+
+    def _record(self, stage, outcome):
+        stage_metrics = self.metrics.setdefault(stage, {"hits": 0, "semantic_hits": 0, "misses": 0})
+        stage_metrics[outcome] += 1
+
+    def _context(self, scope, user_prompt, query):
+        """Hash of the user prompt without the query, which semantic hits must share"""
+        return self._hash(scope, user_prompt.replace(query, "", 1))
+
+    def _embed(self, text):
+        vector = np.asarray(self.embeddings.embed_query(text), dtype="float32")
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, stage, model, temperature, system_prompt, user_prompt, query=None):
+        scope = self._hash(stage, model, temperature, system_prompt)
+        key = self._hash(scope, user_prompt)
+        expiry = time.time() - self.ttl_seconds
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND created >= ?", (key, expiry)
+            ).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+                self._record(stage, "hits")
+                return row[0]
+
+            if self.embeddings is not None and query:
+                rows = self.conn.execute(
+                    "SELECT key, response, embedding FROM responses "
+                    "WHERE context = ? AND created >= ? AND embedding IS NOT NULL",
+                    (self._context(scope, user_prompt, query), expiry)
+                ).fetchall()
+                if rows:
+                    matrix = np.stack([np.frombuffer(r[2], dtype="float32") for r in rows])
+                    scores = matrix @ self._embed(query)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), rows[best][0]))
+                        self.conn.commit()
+                        self._record(stage, "semantic_hits")
+                        return rows[best][1]
+
+            self._record(stage, "misses")
+            return None
+
+    def update(self, stage, model, temperature, system_prompt, user_prompt, response, query=None):
+        scope = self._hash(stage, model, temperature, system_prompt)
+        key = self._hash(scope, user_prompt)
+        embedding, context = None, None
+        if self.embeddings is not None and query:
+            embedding, context = self._embed(query).tobytes(), self._context(scope, user_prompt, query)
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, stage, scope, response, embedding, now, now, context)
+            )
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        self.conn.execute("""
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def invoke(self, stage, llm, messages, query=None):
+        """
+        Return the cached response content for messages, calling llm on a miss. query is
+        the user query rendered into the messages, it enables the semantic lookup.
+        """
+        system_prompt, user_prompt = self.split_messages(messages)
+        model, temperature = llm.model_name, llm.temperature
+        response = self.lookup(stage, model, temperature, system_prompt, user_prompt, query)
+        if response is None:
+            response = llm.invoke(messages).content
+            self.update(stage, model, temperature, system_prompt, user_prompt, response, query)
+        return response
+
+    async def ainvoke(self, stage, llm, messages, query=None):
+        """
+        Async counterpart of invoke. The lookup and update run in a thread, since with
+        embeddings they embed the query, which would stall every other task of the loop.
+        """
+        system_prompt, user_prompt = self.split_messages(messages)
+        model, temperature = llm.model_name, llm.temperature
+        response = await asyncio.to_thread(self.lookup, stage, model, temperature, system_prompt, user_prompt, query)
+        if response is None:
+            response = (await llm.ainvoke(messages)).content
+            await asyncio.to_thread(self.update, stage, model, temperature, system_prompt, user_prompt, response, query)
+        return response
+
+    def stats(self):
+        report = {}
+        for stage, m in self.metrics.items():
+            lookups = m["hits"] + m["semantic_hits"] + m["misses"]
+            report[stage] = dict(m, hit_rate=(m["hits"] + m["semantic_hits"]) / lookups if lookups else 0.0)
+        return report
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
@@ -0,0 +1,84 @@
+# PDF parser backends for UserInput, all returning LlamaParse's JSON shape:
+# [{"file_path": ..., "pages": [{"md": ..., "triggeredAutoMode": <page has a table>}, ...]}, ...]
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+class LlamaParseParser:
+    """Remote parsing with LlamaParse, auto mode is triggered on pages with tables"""
+    name = "llamaparse"
+
+    def parse(self, file_paths):
+        from llama_cloud_services import LlamaParse
+        parser = LlamaParse(
+            result_type="markdown",
+            auto_mode=True,
+            auto_mode_trigger_on_table_in_page=True,
+            api_key=os.getenv("LLAMAPARSE_API_KEY")
+        )
+        return parser.get_json_result(file_paths)
+
+
+# One converter per worker process, its layout and table models load once
+_converter = None
+
+
+def _docling_pages(file_path, first_page, last_page):
+    """Markdown and table flag of pages first_page..last_page (1-based, inclusive)"""
+    global _converter
+    if _converter is None:
+        from docling.document_converter import DocumentConverter
+        _converter = DocumentConverter()
+    document = _converter.convert(file_path, page_range=(first_page, last_page)).document
+    table_pages = {prov.page_no for table in document.tables for prov in table.prov}
+    return [
+        {"md": document.export_to_markdown(page_no=page_no), "triggeredAutoMode": page_no in table_pages}
+        for page_no in range(first_page, last_page + 1)
+    ]
+
+
+class DoclingParser:
+    """
+    Local parsing with docling. Each file is split into page ranges of pages_per_task
+    pages that are converted in parallel by a pool of worker processes, so throughput
+    scales with cores and does not depend on the network.
+    """
+    name = "docling"
+
+    def __init__(self, workers=None, pages_per_task=8):
+        self.workers = workers or os.cpu_count()
+        self.pages_per_task = pages_per_task
+
+    @staticmethod
+    def page_count(file_path):
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(file_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    def page_ranges(self, file_path):
+        n_pages = self.page_count(file_path)
+        return [(first, min(first + self.pages_per_task - 1, n_pages))
+                for first in range(1, n_pages + 1, self.pages_per_task)]
+
+    def parse(self, file_paths):
+        tasks = [(file_path, first, last) for file_path in file_paths for first, last in self.page_ranges(file_path)]
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks) or 1)) as pool:
+            results = list(pool.map(_docling_pages, *zip(*tasks))) if tasks else []
+        docs = {file_path: {"file_path": file_path, "pages": []} for file_path in file_paths}
+        # pool.map keeps task order, so pages come back in order
+        for (file_path, _, _), pages in zip(tasks, results):
+            docs[file_path]["pages"].extend(pages)
+        return [docs[file_path] for file_path in file_paths]
+
+
+PARSERS = {parser.name: parser for parser in (LlamaParseParser, DoclingParser)}
+
+
+def get_parser(name, **kwargs):
+    if name not in PARSERS:
+        raise ValueError(f"Unknown parser {name}, expected one of {', '.join(PARSERS)}")
+    return PARSERS[name](**kwargs)
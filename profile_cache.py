@@ -0,0 +1,154 @@
+# On-disk cache of DataProfiles keyed by the profiled file's identity
+
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+import pandas as pd
+
+# Bump when DataProfile or the profiling code changes what it computes
+PROFILE_VERSION = 2
+# Seconds before a hit updates the last use of its entry again
+TOUCH_INTERVAL = 60
+
+
+class ProfileCache:
+    def __init__(self, cache_dir="./profile_cache", max_bytes=512 * 1024 * 1024, full_hash=False):
+        """
+        Entries are keyed by file size + mtime (or a full content hash if
+        full_hash is set), the pandas version and the profiling variant.
+        Least recently used entries are evicted once max_bytes is exceeded.
+        The index is a SQLite table, so processes sharing cache_dir (batch
+        workers, app servers) do not overwrite each other's entries.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.full_hash = full_hash
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=60, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                file TEXT,
+                variant TEXT,
+                bytes INTEGER,
+                last_used REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_file ON entries (file, variant)")
+        self._import_json_index()
+        self.conn.commit()
+
+    def _import_json_index(self):
+        """Move the entries of the index.json of earlier versions into the table"""
+        json_path = os.path.join(self.cache_dir, "index.json")
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?)",
+                [(key, e["file"], e["variant"], e["bytes"], e["last_used"]) for key, e in index.items()]
+            )
+        except (OSError, ValueError, KeyError):
+            pass
+        os.remove(json_path)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def file_key(self, file_path, variant=""):
+        stat = os.stat(file_path)
+        if self.full_hash:
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            identity = ["sha256", digest.hexdigest()]
+        else:
+            identity = ["stat", os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns]
+        raw = json.dumps(identity + [pd.__version__, PROFILE_VERSION, variant])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, file_path, variant=""):
+        key = self.file_key(file_path, variant)
+        with self._lock:
+            entry = self.conn.execute("SELECT last_used FROM entries WHERE key = ?", (key,)).fetchone()
+            if entry is not None and os.path.exists(self._entry_path(key)):
+                try:
+                    with open(self._entry_path(key), "rb") as f:
+                        profile = pickle.load(f)
+                    # Recency only needs to be coarse for the eviction, which keeps most hits read-only
+                    now = time.time()
+                    if now - entry[0] > TOUCH_INTERVAL:
+                        self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+                        self.conn.commit()
+                    self.hits += 1
+                    return profile
+                except (OSError, pickle.UnpicklingError, EOFError):
+                    self._remove(key)
+                    self.conn.commit()
+            self.misses += 1
+            return None
+
+    def put(self, file_path, profile, variant=""):
+        key = self.file_key(file_path, variant)
+        abs_path = os.path.abspath(file_path)
+        with self._lock:
+            # Written under another name first, so readers in other processes never see half a pickle
+            tmp_path = f"{self._entry_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(profile, f)
+            size = os.path.getsize(tmp_path)
+            # The file changed since older entries were written, drop them
+            stale = self.conn.execute(
+                "SELECT key FROM entries WHERE file = ? AND variant = ? AND key != ?", (abs_path, variant, key)
+            ).fetchall()
+            for (stale_key,) in stale:
+                self._remove(stale_key)
+            os.replace(tmp_path, self._entry_path(key))
+            self.conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                              (key, abs_path, variant, size, time.time()))
+            self._evict()
+            self.conn.commit()
+
+    def invalidate(self, file_path):
+        abs_path = os.path.abspath(file_path)
+        with self._lock:
+            for (key,) in self.conn.execute("SELECT key FROM entries WHERE file = ?", (abs_path,)).fetchall():
+                self._remove(key)
+            self.conn.commit()
+
+    def _remove(self, key):
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if os.path.exists(self._entry_path(key)):
+            os.remove(self._entry_path(key))
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, bytes FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            total -= size
+            self._remove(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total
+        }
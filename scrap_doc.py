@@ -1,67 +1,106 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-from langchain_community.document_loaders import WebBaseLoader
+from langchain_core.documents import Document
+from crawler import AsyncCrawler, page_markdown
+import asyncio
+import threading
 
 class DocumentationScraper:
-    def __init__(self, homepage_url):
+    def __init__(self, homepage_url, max_depth=1, max_connections=8, cache_dir="./doc_page_cache",
+                 selenium_fallback=True):
+        """
+        Pages are fetched over plain async HTTP, breadth first from homepage_url up to
+        max_depth links away (1 is the homepage and the pages it links to). Selenium
+        only starts when a page turns out to be rendered by JavaScript.
+        """
         self.homepage_url = homepage_url
         self.doc_links = []
         self.docs = []
-        self._setup_selenium_options()
+        self.pages = []
+        self.crawler = AsyncCrawler(
+            homepage_url,
+            max_depth=max_depth,
+            max_connections=max_connections,
+            cache_dir=cache_dir,
+            url_filter=lambda url: 'enterprise' not in url.lower(),
+            js_fallback=self.render_page if selenium_fallback else None
+        )
+        self.driver = None
+        self._driver_lock = threading.Lock()
 
     def _setup_selenium_options(self):
         """Set up Selenium WebDriver options"""
+        from selenium.webdriver.chrome.options import Options
         self.options = Options()
         self.options.add_argument("--headless")
         self.options.add_argument("--disable-gpu")
         self.options.add_argument("--no-sandbox")
         self.options.add_argument("--disable-dev-shm-usage")
 
+    def render_page(self, url):
+        """HTML of url after JavaScript ran, in one headless Chrome started on first use"""
+        with self._driver_lock:
+            if self.driver is None:
+                from selenium import webdriver
+                from selenium.webdriver.chrome.service import Service
+                from webdriver_manager.chrome import ChromeDriverManager
+                self._setup_selenium_options()
+                self.driver = webdriver.Chrome(
+                    service=Service(ChromeDriverManager().install()),
+                    options=self.options
+                )
+            self.driver.get(url)
+            return self.driver.page_source
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+    async def acrawl(self):
+        try:
+            self.pages = await self.crawler.crawl()
+        finally:
+            self.close()
+        self.doc_links = [page["url"] for page in self.pages]
+        return self.pages
+
+    def crawl(self):
+        return asyncio.run(self.acrawl())
+
     def get_documentation_links(self):
-        """Extract all documentation links from the homepage"""
-        driver = webdriver.Chrome(
-            service=Service(ChromeDriverManager().install()),
-            options=self.options
-        )
-        
-        driver.get(self.homepage_url)
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        links = set()
-
-        for a_tag in soup.find_all("a", href=True):
-            link = urljoin(self.homepage_url, a_tag["href"])
-            parsed_link = urlparse(link)
-            
-            if (parsed_link.netloc == urlparse(self.homepage_url).netloc and 
-                'enterprise' not in link.lower()):
-                links.add(link)
-
-        driver.quit()
-        self.doc_links = list(links)
+        """Extract all documentation links reachable from the homepage"""
+        self.crawl()
         return self.doc_links
 
     def load_documents(self):
-        """Load documents using WebBaseLoader"""
-        if not self.doc_links:
-            self.get_documentation_links()
-        
-        loader = WebBaseLoader(self.doc_links)
-        self.docs = loader.load()
+        """Markdown documents of the crawled pages, with the same metadata as WebBaseLoader"""
+        if not self.pages:
+            self.crawl()
+
+        self.docs = []
+        for page in self.pages:
+            soup = BeautifulSoup(page["html"], "html.parser")
+            metadata = {"source": page["url"], "status": page["status"]}
+            if soup.title:
+                metadata["title"] = soup.title.get_text()
+            description = soup.find("meta", attrs={"name": "description"})
+            if description:
+                metadata["description"] = description.get("content", "No description found.")
+            if soup.find("html") and soup.find("html").get("lang"):
+                metadata["language"] = soup.find("html").get("lang")
+            # Markdown keeps the headings and code blocks that chunking splits on
+            self.docs.append(Document(page_content=page_markdown(page["html"]), metadata=metadata))
         return self.docs
 
     def save_content(self, filename="doc_sel.txt"):
         """Save documents content to a file"""
         if not self.docs:
             raise ValueError("No documents loaded. Call load_documents() first.")
-        
+
         content = ""
         for doc in self.docs:
             content += doc.page_content
-            
+
         with open(filename, "w", encoding="utf-8") as f:
             f.write(content)
 
@@ -69,11 +108,12 @@ def main():
     scraper = DocumentationScraper("https://dash.plotly.com/")
     links = scraper.get_documentation_links()
     print(f"Found {len(links)} documentation links.")
-    
-    docs = scraper.load_documents(num_links=4)
+
+    docs = scraper.load_documents()
     print(f"Loaded {len(docs)} documents.")
-    
+    print(scraper.crawler.stats)
+
     # scraper.save_content_to_file()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,140 @@
+# Mergeable summaries used by the streaming CSV profiler
+
+import numpy as np
+import pandas as pd
+
+
+class MomentSketch:
+    """Count, min/max and the first three central moments, merged chunk by chunk"""
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.min = np.nan
+        self.max = np.nan
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        nb = len(values)
+        mean_b = values.mean()
+        dev = values - mean_b
+        m2_b = np.dot(dev, dev)
+        m3_b = np.dot(dev * dev, dev)
+        self.min = np.nanmin([self.min, values.min()])
+        self.max = np.nanmax([self.max, values.max()])
+
+        # Chan et al. pairwise update, the batched form of Welford's algorithm
+        na = self.n
+        n = na + nb
+        delta = mean_b - self.mean
+        self.m3 = (self.m3 + m3_b
+                   + delta ** 3 * na * nb * (na - nb) / n ** 2
+                   + 3 * delta * (na * m2_b - nb * self.m2) / n)
+        self.m2 = self.m2 + m2_b + delta ** 2 * na * nb / n
+        self.mean = self.mean + delta * nb / n
+        self.n = n
+
+    def std(self):
+        if self.n < 2:
+            return np.nan
+        return np.sqrt(self.m2 / (self.n - 1))
+
+    def skewness(self):
+        """Adjusted Fisher-Pearson skewness, same estimator as pandas Series.skew"""
+        n = self.n
+        if n < 3:
+            return np.nan
+        if self.m2 == 0:
+            return 0.0
+        return (n * (n - 1) ** 0.5 / (n - 2)) * (self.m3 / self.m2 ** 1.5)
+
+
+class TDigest:
+    """Merging t-digest with the arcsine scale function, updated with whole arrays"""
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="mergesort")
+        means = means[order]
+        weights = weights[order]
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        bucket = np.floor(k - k[0]).astype("int64")
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        new_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / new_weights
+        self.weights = new_weights
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(len(values))]))
+
+    def quantile(self, q):
+        if len(self.means) == 0:
+            return np.nan
+        if len(self.means) == 1:
+            return self.means[0]
+        cum = (np.cumsum(self.weights) - self.weights / 2) / self.weights.sum()
+        return float(np.interp(q, cum, self.means))
+
+
+class MisraGries:
+    """Heavy hitters summary; counts are exact while distinct values fit the capacity"""
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype="int64")
+        self.truncated = False
+
+    def update(self, values):
+        chunk_counts = pd.Series(values).value_counts()
+        if len(chunk_counts) == 0:
+            return
+        counts = self.counts.add(chunk_counts, fill_value=0)
+        if len(counts) > self.capacity:
+            threshold = counts.nlargest(self.capacity + 1).iloc[-1]
+            counts = counts[counts > threshold] - threshold
+            self.truncated = True
+        self.counts = counts.astype("int64")
+
+    def top(self, k=10):
+        return self.counts.sort_values(ascending=False, kind="mergesort").head(k)
+
+
+class HyperLogLog:
+    """Distinct count estimator over pandas' stable 64-bit value hashes"""
+    def __init__(self, precision=14):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype="uint8")
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        hashes = pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+        idx = (hashes >> np.uint64(64 - self.p)).astype("int64")
+        # The 52 bits after the index fit exactly in a float64, so frexp gives the bit length
+        rest = ((hashes << np.uint64(self.p)) >> np.uint64(12)).astype("float64")
+        _, exponent = np.frexp(rest)
+        rank = np.where(rest > 0, 53 - exponent, 53).astype("uint8")
+        np.maximum.at(self.registers, idx, rank)
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype("float64"))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
@@ -0,0 +1,24 @@
+# Token counting for prompt budgets
+
+_encodings = {}
+
+
+def get_encoding(model="gpt-4o"):
+    if model not in _encodings:
+        try:
+            import tiktoken
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text, model="gpt-4o"):
+    """Number of tokens of text for model, roughly 4 characters per token without tiktoken"""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,98 +1,496 @@
 # Process input files and build hybrid RAG index using Qdrant
 
-import pandas as pd
+# Embedding models, Qdrant and the parsers are imported on first use, CSV-only
+# sessions never touch the index and should not pay for loading them
+
 from pathlib import Path
-from langchain_qdrant import QdrantVectorStore, FastEmbedSparse, RetrievalMode
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.docstore.document import Document
-from docling.chunking import HybridChunker
-from langchain_docling import DoclingLoader
-from langchain_docling.loader import ExportType
-from llama_cloud_services import LlamaParse
-from qdrant_client import models
+from embedding_pipeline import EmbeddingPipeline
+from embedding_cache import CachedEmbeddings
+from collection_manager import CollectionManager, ReadWriteLock
+from pdf_parsers import get_parser
+from token_budget import count_tokens
 import os
+import json
+import uuid
+import hashlib
+import threading
+import numpy as np
 from load_dotenv import load_dotenv
 load_dotenv()
 
+PARSED_CACHE_DIR = "./parsed_cache"
+# Used when the user gave no query, e.g. the default "Generate a dashboard" flow
+DEFAULT_TABLE_QUERY = "financial statement tables with key figures"
+POINT_NAMESPACE = uuid.UUID("6f1c2a52-3b0e-4d8e-9a57-0c4f5d1e7b21")
+# Payload fields used in search filters, indexed so that filtered search does not scan every point
+PAYLOAD_INDEXES = {
+    "metadata.has_table": "bool",
+    "metadata.file": "keyword",
+    "metadata.id": "keyword",
+}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def create_payload_indexes(client, collection_name):
+    """Index the filtered payload fields, a no-op for fields that are already indexed"""
+    from qdrant_client import models
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field, schema in PAYLOAD_INDEXES.items():
+        if field not in existing:
+            client.create_payload_index(collection_name, field_name=field,
+                                        field_schema=models.PayloadSchemaType(schema), wait=True)
+
+
+def collection_settings(hnsw_config=None, quantization=None):
+    """Qdrant collection options for an HNSW config dict (m, ef_construct, ...) and an optional "int8" quantization"""
+    from qdrant_client import models
+    options = {}
+    if hnsw_config:
+        options["hnsw_config"] = models.HnswConfigDiff(**hnsw_config)
+    if quantization == "int8":
+        options["quantization_config"] = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    elif quantization is not None:
+        raise ValueError(f"Unsupported quantization: {quantization}")
+    return options
+
+
 class UserInput:
-    def __init__(self):
+    def __init__(self, embed_batch_size=64, index_path="./user_input_cache", parsed_cache_dir=PARSED_CACHE_DIR,
+                 url=None, hnsw_config=None, quantization=None, shard_by=None, tenant=None,
+                 shards_path="./user_input_shards", max_open_collections=8, parser="llamaparse", parser_options=None):
+        """
+        The index lives in embedded Qdrant at index_path, or in a Qdrant server when url
+        is given. hnsw_config (e.g. {"m": 16, "ef_construct": 100}) and quantization
+        ("int8" for scalar quantization) tune the collection; embedded Qdrant accepts
+        them, but only a server applies HNSW, quantization and payload indexes. They
+        are set when the collection is created, see migrate_index for existing ones.
+
+        With shard_by="file" every filing gets its own collection (under shards_path
+        when embedded), with shard_by="tenant" all files of `tenant` share one. Searches
+        then only score the shards of the files they are given, and concurrent
+        workflows only wait for each other when they write the same shard.
+
+        parser selects the PDF backend: "llamaparse" (remote) or "docling" (local,
+        parallel over page ranges), parser_options are passed to it.
+        """
         self.embed_model_id = "sentence-transformers/all-MiniLM-L6-v2"
-        self.embeddings = HuggingFaceEmbeddings(model_name=self.embed_model_id)
-        self.sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
+        self.index_path = index_path
+        self.url = url
+        self.hnsw_config = hnsw_config
+        self.quantization = quantization
+        if shard_by not in (None, "file", "tenant"):
+            raise ValueError(f"Unsupported shard_by: {shard_by}")
+        if shard_by == "tenant" and tenant is None:
+            raise ValueError("shard_by='tenant' needs a tenant")
+        self.shard_by = shard_by
+        self.tenant = tenant
+        self.shards_path = shards_path
+        self.max_open_collections = max_open_collections
+        self._collections = None
+        self.parsed_cache_dir = parsed_cache_dir
+        self.parser = get_parser(parser, **(parser_options or {}))
+        self.embed_batch_size = embed_batch_size
+        self._embeddings = None
+        self._sparse_embeddings = None
         self.vector_store = None
+        # The local Qdrant index is shared by concurrent workflows, serialize writes to it
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._table_index_lock = threading.Lock()
+        # Content hashes of the processed files by path, with the size and mtime they were computed for
+        self._file_hashes = {}
+        # Searches share self.vector_store, opening or closing it waits for them
+        self._index_lock = ReadWriteLock()
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._model_lock:
+                if self._embeddings is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    # Vectors are cached on disk and shared with the documentation index
+                    self._embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=self.embed_model_id), self.embed_model_id)
+        return self._embeddings
+
+    @property
+    def sparse_embeddings(self):
+        if self._sparse_embeddings is None:
+            with self._model_lock:
+                if self._sparse_embeddings is None:
+                    from langchain_qdrant import FastEmbedSparse
+                    self._sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
+        return self._sparse_embeddings
+
+    @property
+    def collections(self):
+        if self._collections is None:
+            # Load the models first, they take _model_lock themselves
+            embeddings, sparse_embeddings = self.embeddings, self.sparse_embeddings
+            with self._model_lock:
+                if self._collections is None:
+                    self._collections = CollectionManager(
+                        embeddings, sparse_embeddings, base_path=self.shards_path, url=self.url,
+                        max_open=self.max_open_collections,
+                        collection_options=collection_settings(self.hnsw_config, self.quantization),
+                        on_create=lambda vector_store: create_payload_indexes(vector_store.client, vector_store.collection_name)
+                    )
+        return self._collections
+
+    def shard(self, file_hash):
+        return self.tenant if self.shard_by == "tenant" else file_hash
+
+    def file_hash(self, path):
+        """Content hash of the file at path, only computed again once its size or mtime changed"""
+        stat = os.stat(path)
+        identity = (stat.st_size, stat.st_mtime_ns)
+        cached = self._file_hashes.get(os.path.abspath(path))
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+        file_hash = file_sha256(path)
+        self._file_hashes[os.path.abspath(path)] = (identity, file_hash)
+        return file_hash
+
+    def embed_query(self, text):
+        """Dense MiniLM embedding of text, lets UserInput stand in for the embeddings object"""
+        return self.embeddings.embed_query(text)
 
     def process_files(self, file_paths):
-        # self.loader = DoclingLoader(
-        #     file_path=file_paths,
-        #     export_type=ExportType.MARKDOWN,
-        #     chunker=HybridChunker(tokenizer=self.embed_model_id),
-        # )
-        self.loader = LlamaParse(
-            result_type="markdown",
-            auto_mode=True,
-            auto_mode_trigger_on_table_in_page=True,
-            api_key=os.getenv("LLAMAPARSE_API_KEY")
-        )
-        docs = self.loader.get_json_result(file_paths)
-
-        documents = [
-            Document(
-                page_content=page['md'],
-                metadata={'id': f"doc_{k}_page_{i}", 'has_table': page['triggeredAutoMode'], 'file': doc['file_path']}
-            ) 
-            for k, doc in enumerate(docs)
-            for i, page in enumerate(doc['pages'])
-        ]
-
-        if os.path.exists("./user_input_cache"):
+        if self.shard_by:
+            # Shards have their own write locks
+            self._process_files(file_paths)
+            return
+        with self._lock:
+            self._process_files(file_paths)
+
+    def _process_files(self, file_paths):
+        if isinstance(file_paths, str):
+            file_paths = [file_paths]
+        # Parse only files whose content has not been parsed before
+        file_hashes = [self.file_hash(path) for path in file_paths]
+        docs = [self.load_parsed(file_hash) for file_hash in file_hashes]
+        missing = [path for path, doc in zip(file_paths, docs) if doc is None]
+        if missing:
+            parsed = iter(self.parse(missing))
+            docs = [doc if doc is not None else next(parsed) for doc in docs]
+            for file_hash, path, doc in zip(file_hashes, file_paths, docs):
+                if path in missing:
+                    self.save_parsed(file_hash, doc)
+
+        documents = []
+        ids = []
+        for k, (file_hash, doc) in enumerate(zip(file_hashes, docs)):
+            for i, page in enumerate(doc['pages']):
+                page_hash = hashlib.sha256(page['md'].encode("utf-8")).hexdigest()
+                documents.append(Document(
+                    page_content=page['md'],
+                    metadata={'id': f"doc_{k}_page_{i}", 'has_table': page['triggeredAutoMode'], 'file': doc['file_path'],
+                              'file_hash': file_hash, 'page': i, 'page_hash': page_hash}
+                ))
+                # Deterministic ids make re-indexing the same page an idempotent upsert. The page
+                # number keeps pages with the same markdown (e.g. repeated separator pages) apart
+                ids.append(str(uuid.uuid5(POINT_NAMESPACE, f"{file_hash}:{i}:{page_hash}")))
+
+        self.update_table_index(file_hashes, docs, documents, ids)
+
+        if self.shard_by:
+            for shard in dict.fromkeys(self.shard(file_hash) for file_hash in file_hashes):
+                shard_docs = [(doc, point_id) for doc, point_id in zip(documents, ids)
+                              if self.shard(doc.metadata['file_hash']) == shard]
+                with self.collections.writer(shard) as vector_store:
+                    existing = self.existing_ids([point_id for _, point_id in shard_docs], vector_store)
+                    new = [(doc, point_id) for doc, point_id in shard_docs if point_id not in existing]
+                    if new:
+                        self.remove_stale_points([doc.metadata['file_hash'] for doc, _ in shard_docs],
+                                                 [point_id for _, point_id in shard_docs], vector_store)
+                        self.add_documents([doc for doc, _ in new], ids=[point_id for _, point_id in new],
+                                           vector_store=vector_store)
+                print(f"Shard {shard}: skipped {len(shard_docs) - len(new)} already indexed pages")
+
+        elif self.index_exists():
             self.load_index()
-            self.add_documents(documents)
+            existing = self.existing_ids(ids)
+            new = [(doc, point_id) for doc, point_id in zip(documents, ids) if point_id not in existing]
+            if new:
+                self.remove_stale_points(file_hashes, ids)
+                self.add_documents([doc for doc, _ in new], ids=[point_id for _, point_id in new])
+            print(f"Skipped {len(documents) - len(new)} already indexed pages")
 
         else:
-            self.build_index(documents)
-        
+            self.build_index(documents, ids=ids)
+
+    def parse(self, file_paths):
+        return self.parser.parse(file_paths)
+
+    def parsed_path(self, file_hash):
+        # Backends produce different markdown, each keeps its own cache entries
+        suffix = "" if self.parser.name == "llamaparse" else f".{self.parser.name}"
+        return os.path.join(self.parsed_cache_dir, f"{file_hash}{suffix}.json")
+
+    def load_parsed(self, file_hash):
+        path = self.parsed_path(file_hash)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
 
-    def build_index(self, documents):
-        qdrant_path = Path("./user_input_cache")
-        qdrant_path.mkdir(exist_ok=True)
+    def save_parsed(self, file_hash, doc):
+        os.makedirs(self.parsed_cache_dir, exist_ok=True)
+        with open(self.parsed_path(file_hash), "w", encoding="utf-8") as f:
+            json.dump(doc, f)
 
-        self.vector_store = QdrantVectorStore.from_documents(
-            documents,
+    def update_table_index(self, file_hashes, docs, documents, ids):
+        """Record the point ids of every table page per file, so table search only scores those pages"""
+        with self._table_index_lock:
+            table_index = self.load_table_index()
+            for file_hash, doc in zip(file_hashes, docs):
+                table_index[file_hash] = {
+                    "file": doc['file_path'],
+                    "table_ids": [point_id for document, point_id in zip(documents, ids)
+                                  if document.metadata['file_hash'] == file_hash and document.metadata['has_table']]
+                }
+            os.makedirs(self.parsed_cache_dir, exist_ok=True)
+            with open(os.path.join(self.parsed_cache_dir, "table_index.json"), "w", encoding="utf-8") as f:
+                json.dump(table_index, f)
+
+    def load_table_index(self):
+        path = os.path.join(self.parsed_cache_dir, "table_index.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def existing_ids(self, ids, vector_store=None):
+        vector_store = vector_store or self.vector_store
+        points = vector_store.client.retrieve(
+            collection_name=vector_store.collection_name,
+            ids=ids,
+            with_payload=False,
+            with_vectors=False
+        )
+        return {str(point.id) for point in points}
+
+    def remove_stale_points(self, file_hashes, ids, vector_store=None):
+        """Delete the points of these files that are not among ids, e.g. indexed under an earlier id scheme"""
+        from qdrant_client import models
+        vector_store = vector_store or self.vector_store
+        vector_store.client.delete(
+            collection_name=vector_store.collection_name,
+            points_selector=models.FilterSelector(filter=models.Filter(
+                must=[models.FieldCondition(key="metadata.file_hash", match=models.MatchAny(any=list(set(file_hashes))))],
+                must_not=[models.HasIdCondition(has_id=ids)]
+            ))
+        )
+
+    def client_options(self):
+        return {"url": self.url} if self.url else {"path": self.index_path}
+
+    def index_exists(self):
+        if not self.url:
+            return os.path.exists(self.index_path)
+        if self.vector_store is not None:
+            return self.vector_store.client.collection_exists("user_input")
+        from qdrant_client import QdrantClient
+        client = QdrantClient(url=self.url)
+        try:
+            return client.collection_exists("user_input")
+        finally:
+            client.close()
+
+    def build_index(self, documents, ids=None):
+        from langchain_qdrant import QdrantVectorStore, RetrievalMode
+        if not self.url:
+            qdrant_path = Path(self.index_path)
+            qdrant_path.mkdir(exist_ok=True)
+
+        # Creates the collection, the documents are then embedded and uploaded in batches
+        vector_store = QdrantVectorStore.construct_instance(
             embedding=self.embeddings,
             sparse_embedding=self.sparse_embeddings,
-            path="./user_input_cache",
+            client_options=self.client_options(),
             collection_name="user_input",
-            retrieval_mode=RetrievalMode.HYBRID
+            retrieval_mode=RetrievalMode.HYBRID,
+            collection_create_options=collection_settings(self.hnsw_config, self.quantization)
         )
-    
+        create_payload_indexes(vector_store.client, vector_store.collection_name)
+        with self._index_lock.write():
+            self._close()
+            self.vector_store = vector_store
+        self.add_documents(documents, ids=ids)
+
+    def _close(self):
+        # Embedded Qdrant locks its path, release it before opening the index again
+        if self.vector_store is not None:
+            self.vector_store.client.close()
+            self.vector_store = None
+
+    def close(self):
+        with self._index_lock.write():
+            self._close()
+
     def load_index(self):
+        """Open the index, unless it is open already (then other workflows may be searching it)"""
+        with self._index_lock.write():
+            if self.vector_store is None:
+                self._load_index()
+
+    def _load_index(self):
+        from langchain_qdrant import QdrantVectorStore, RetrievalMode
         self.vector_store = QdrantVectorStore.from_existing_collection(
             embedding=self.embeddings,
             sparse_embedding=self.sparse_embeddings,
-            path="./user_input_cache",
             collection_name="user_input",
-            retrieval_mode=RetrievalMode.HYBRID
+            retrieval_mode=RetrievalMode.HYBRID,
+            **self.client_options()
         )
+
+    def migrate_index(self):
+        """
+        Give the collection the payload indexes and the hnsw_config/quantization of this
+        UserInput. New collections get them when they are created; run this once for one
+        built before the indexes existed or after changing the settings.
+        """
+        self.load_index()
+        with self._index_lock.write():
+            client, collection_name = self.vector_store.client, self.vector_store.collection_name
+            create_payload_indexes(client, collection_name)
+            settings = collection_settings(self.hnsw_config, self.quantization)
+            if settings:
+                client.update_collection(collection_name, **settings)
     
-    def add_documents(self, documents):
+    def add_documents(self, documents, ids=None, vector_store=None):
         print("Indexing...")
-        self.vector_store.add_documents(documents)
+        pipeline = EmbeddingPipeline(self.embeddings, self.sparse_embeddings, batch_size=self.embed_batch_size)
+        stats = pipeline.run(vector_store or self.vector_store, documents, ids=ids)
+        print(f"Indexed {stats['pages']} pages in {stats['seconds']:.1f}s ({stats['pages_per_sec']:.1f} pages/sec)")
+        return stats
+
+    def shards_for(self, file_paths):
+        """The shards holding file_paths (a path or a list of them), which shard_by="file" searches need"""
+        if self.shard_by == "tenant":
+            return [self.tenant]
+        if not file_paths:
+            raise ValueError("With shard_by='file' a search needs the files to search")
+        if isinstance(file_paths, str):
+            file_paths = [file_paths]
+        return list(dict.fromkeys(self.shard(self.file_hash(path)) for path in file_paths))
 
-    def search(self, query, k=3, filter=None):
+    def search(self, query, k=3, filter=None, file_paths=None):
+        """
+        The k pages most relevant to query, of file_paths (a path or a list of them) if
+        given, only table pages with filter. With shard_by the hits of the shards are
+        merged by dense similarity, hybrid scores of separate collections do not compare.
+        """
+        from qdrant_client import models
+        conditions = []
         if filter:
-            apply_filter = models.Filter(
-                            must=[
-                                models.FieldCondition(
-                                    key=f"metadata.has_table",
-                                    match=models.MatchValue(
-                                        value = True
-                                    ),
-                                ),
-                            ]
-                        )
-            return self.vector_store.similarity_search(query, k=k, filter=apply_filter)
+            conditions.append(models.FieldCondition(key="metadata.has_table", match=models.MatchValue(value=True)))
+        if file_paths and self.shard_by != "file":
+            hashes = [self.file_hash(path) for path in ([file_paths] if isinstance(file_paths, str) else file_paths)]
+            conditions.append(models.FieldCondition(key="metadata.file_hash", match=models.MatchAny(any=hashes)))
+        apply_filter = models.Filter(must=conditions) if conditions else None
+        if not self.shard_by:
+            with self._index_lock.read():
+                return self.vector_store.similarity_search(query, k=k, filter=apply_filter)
+        candidates, vectors = self._shard_candidates(self.shards_for(file_paths), query, apply_filter, k)
+        if not candidates:
+            return []
+        _, relevance = self._dense_relevance(query, vectors)
+        return [candidates[i] for i in np.argsort(-relevance, kind="stable")[:k]]
+
+
+    def search_tables(self, query, file_path=None, k=8, fetch_k=24, token_budget=6000, lambda_mult=0.6):
+        """
+        Retrieve the table pages most relevant to query, restricted to file_path if
+        given (with shard_by="file" it must be). Hybrid search proposes fetch_k
+        candidates among the file's table pages, then maximal marginal relevance over
+        the dense vectors picks up to k diverse pages whose combined size stays within
+        token_budget.
+        """
+        from qdrant_client import models
+        query = query.strip() or DEFAULT_TABLE_QUERY
+
+        if file_path is not None:
+            # Hashed when the file was processed, a table search does not read the file again
+            file_hash = self.file_hash(file_path)
+            table_ids = self.load_table_index().get(file_hash, {}).get("table_ids", [])
+            if not table_ids:
+                return []
+            condition = models.HasIdCondition(has_id=table_ids)
+        else:
+            condition = models.FieldCondition(key="metadata.has_table", match=models.MatchValue(value=True))
+        query_filter = models.Filter(must=[condition])
+
+        if self.shard_by:
+            candidates, vectors = self._shard_candidates(self.shards_for(file_path), query, query_filter, fetch_k)
         else:
-            return self.vector_store.similarity_search(query, k=k)
+            with self._index_lock.read():
+                candidates, vectors = self._candidates(self.vector_store, query, query_filter, fetch_k)
+        if not candidates:
+            return []
+
+        matrix, relevance = self._dense_relevance(query, vectors)
+        similarity = matrix @ matrix.T
+        tokens = [count_tokens(doc.page_content) for doc in candidates]
+
+        selected = []
+        remaining = set(range(len(candidates)))
+        budget = token_budget
+        while remaining and len(selected) < k:
+            redundancy = similarity[:, selected].max(axis=1) if selected else np.zeros(len(candidates))
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+            best = max(remaining, key=lambda i: scores[i])
+            remaining.discard(best)
+            if tokens[best] > budget:
+                # Too large for what is left, smaller pages may still fit
+                continue
+            selected.append(best)
+            budget -= tokens[best]
+        return [candidates[i] for i in selected]
+
+    def _dense_relevance(self, query, vectors):
+        """The normalized vectors and their cosine similarity to query"""
+        matrix = np.array(vectors, dtype="float32")
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype="float32")
+        return matrix, matrix @ (query_vector / (np.linalg.norm(query_vector) + 1e-12))
+
+    def _shard_candidates(self, shards, query, query_filter, fetch_k):
+        """Candidates of every shard with their dense vectors, shards of files never indexed have none"""
+        candidates, vectors = [], []
+        for shard in shards:
+            try:
+                with self.collections.reader(shard) as vector_store:
+                    shard_candidates, shard_vectors = self._candidates(vector_store, query, query_filter, fetch_k)
+            except KeyError:
+                continue
+            candidates.extend(shard_candidates)
+            vectors.extend(shard_vectors)
+        return candidates, vectors
+
+    def _candidates(self, vector_store, query, query_filter, fetch_k):
+        """Hybrid search candidates with their dense vectors"""
+        candidates = vector_store.similarity_search(query, k=fetch_k, filter=query_filter)
+        if not candidates:
+            return [], []
+        points = vector_store.client.retrieve(
+            collection_name=vector_store.collection_name,
+            ids=[doc.metadata["_id"] for doc in candidates],
+            with_vectors=[vector_store.vector_name]
+        )
+        # The unnamed dense vector of a hybrid collection comes back as a bare list
+        vectors = {str(point.id): point.vector[vector_store.vector_name] if isinstance(point.vector, dict) else point.vector
+                   for point in points}
+        return candidates, [vectors[str(doc.metadata["_id"])] for doc in candidates]
 
 
 def test_parse():